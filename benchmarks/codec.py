@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Measure per-request JSON encode/decode time on the router's relay path.
+
+Builds representative chat bodies (a system prompt plus N turns of
+mixed-length messages) and times the JSON work one primary request does:
+
+  decode   — parse the client's request body
+  outbound — encode the speculative primary body, and the fallback
+  session  — the session log (client messages + pretty-printed record)
+  relay    — parse the backend's response for the session log
+
+for three codecs:
+
+  legacy   — stdlib json, re-encoded for every send (requests' json=)
+  stdlib   — src/codec.py without orjson: encoded once, bytes reused
+  orjson   — src/codec.py with orjson (skipped if it isn't installed)
+
+No GPU or backends needed.
+
+Usage:
+    python benchmarks/codec.py [--requests N] [--turns 2,20,100]
+"""
+
+import argparse
+import functools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='ai-router-bench-'))
+
+PARAGRAPH = ("The scheduler keeps a per-replica queue and prefers the replica that "
+             "already holds the conversation's prefix in its KV cache — “naïve” "
+             "round-robin would re-prefill the whole history on every turn. ")
+
+
+def make_request(turns):
+    """A chat request of `turns` user/assistant exchanges."""
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": PARAGRAPH * (1 + i % 3)})
+        messages.append({"role": "assistant", "content": PARAGRAPH * (4 + i % 5)})
+    messages.append({"role": "user", "content": "And how does that interact with hedging?"})
+    return {"model": "ai-router", "messages": messages, "stream": False,
+            "temperature": 0.6, "top_p": 0.95}
+
+
+def make_response():
+    return {"id": "chatcmpl-1", "object": "chat.completion", "model": "primary",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": PARAGRAPH * 8}}],
+            "usage": {"prompt_tokens": 4000, "completion_tokens": 400, "total_tokens": 4400}}
+
+
+def legacy_request(raw, response_raw):
+    """The relay path before src/codec.py."""
+    data = json.loads(raw)
+    json.dumps(data['messages'], default=str)                        # set_query
+    spec = dict(data, messages=[dict(m) for m in data['messages']])
+    json.dumps(spec, allow_nan=False).encode()                       # speculative (json=)
+    json.dumps(data, allow_nan=False).encode()                       # fallback (json=)
+    json.loads(response_raw)                                         # session log parse
+    json.dumps({"steps": [{"response_content": PARAGRAPH * 8}], "client_messages": "x"},
+               indent=2, default=str)                                # session save
+
+
+def codec_request(codec, raw, response_raw):
+    """The relay path through src/codec.py."""
+    data = codec.loads(raw)
+    codec.dumps(data['messages'], default=str)                       # set_query
+    spec = dict(data, messages=[dict(m) for m in data['messages']])
+    codec.dumps(spec)                                                # speculative, reused by the fallback
+    codec.loads(response_raw)
+    codec.dumps({"steps": [{"response_content": PARAGRAPH * 8}], "client_messages": "x"},
+                pretty=True, default=str)
+
+
+def measure(fn, n):
+    """Median and p95 of n calls, in microseconds."""
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--requests', type=int, default=500, help='Requests per measurement')
+    parser.add_argument('--turns', default='2,20,100', help='Conversation lengths (comma-separated)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from src import codec
+    fast = codec.orjson
+
+    via_codec = functools.partial(codec_request, codec)
+    codecs = [('legacy', legacy_request), ('stdlib', via_codec)]
+    if fast is not None:
+        codecs.append(('orjson', via_codec))
+    else:
+        print("orjson is not installed — skipping it (pip install orjson)\n")
+
+    response_raw = json.dumps(make_response()).encode()
+    print(f"{'turns':>6} {'body':>9} " + ' '.join(f"{name + ' p50':>12} {name + ' p95':>12}" for name, _ in codecs)
+          + f" {'saved':>7}")
+    for turns in (int(t) for t in args.turns.split(',')):
+        raw = json.dumps(make_request(turns)).encode()
+        results = []
+        for name, fn in codecs:
+            codec.orjson = fast if name == 'orjson' else None
+            measure(lambda: fn(raw, response_raw), 20)  # warm up
+            results.append(measure(lambda: fn(raw, response_raw), args.requests))
+        codec.orjson = fast
+        saved = (results[0][0] - results[-1][0]) / results[0][0] * 100
+        print(f"{turns:>6} {len(raw):>9} " + ' '.join(f"{p50:>10.0f}µs {p95:>10.0f}µs" for p50, p95 in results)
+              + f" {saved:>6.1f}%")
+
+
+if __name__ == '__main__':
+    main()
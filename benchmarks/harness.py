@@ -0,0 +1,177 @@
+"""
+Shared pieces of the end-to-end benchmarks (replay.py, loadtest.py).
+
+  RouterProcess   — runs `python router.py` as a child process against the
+                    given backends, on a free port, logging to a temporary
+                    LOG_DIR, and waits until /health answers 200
+  server_timing() — parses a Server-Timing value (header, or the trailer
+                    comment that ends a stream) into {name: ms}
+  read_stream()   — consumes a streamed chat completion, timing its tokens
+  percentile()    — nearest-rank percentile of a list of numbers
+  git_commit()    — the checked-out commit, to tag reports with
+
+Not run directly.
+"""
+
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TRAILER_PREFIX = b': server-timing '
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class RouterProcess:
+    """The router in a child process, for as long as the with block runs."""
+
+    def __init__(self, env, workers=1, log_dir=None, startup_timeout=60):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_dir = log_dir or tempfile.mkdtemp(prefix='ai-router-bench-')
+        self.sessions_dir = os.path.join(self.log_dir, 'sessions')
+        self.env = {**os.environ, **env, 'PORT': str(self.port), 'LOG_DIR': self.log_dir,
+                    'WORKERS': str(workers), 'API_KEY': '', 'PYTHONUNBUFFERED': '1'}
+        if workers > 1:
+            # Workers share state through files; keep them away from a live router's
+            self.env['SHARED_STATE_DIR'] = os.path.join(self.log_dir, 'shared-state')
+        self.startup_timeout = startup_timeout
+        self.process = None
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def start(self):
+        output = open(os.path.join(self.log_dir, 'router.out'), 'wb')
+        self.process = subprocess.Popen([sys.executable, 'router.py'], cwd=PROJECT_ROOT, env=self.env,
+                                        stdout=output, stderr=subprocess.STDOUT)
+        output.close()
+        deadline = time.time() + self.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"router exited with {self.process.returncode};"
+                                   f" see {self.log_dir}/router.out")
+            try:
+                if requests.get(f"{self.url}/health", timeout=2).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"router not healthy after {self.startup_timeout}s; see {self.log_dir}/router.out")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def server_timing(value) -> dict:
+    """{'router': 4.0, 'total': 2346.0, ...} from a Server-Timing value."""
+    timings = {}
+    for metric in (value or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        for param in params.split(';'):
+            key, _, ms = param.strip().partition('=')
+            if key == 'dur' and name:
+                try:
+                    timings[name] = float(ms)
+                except ValueError:
+                    pass
+    return timings
+
+
+def read_stream(response, started) -> dict:
+    """Read an SSE chat completion stream to its end.
+
+    Args:
+        response: A streaming requests response
+        started: time.perf_counter() when the request was sent
+
+    Returns:
+        dict with ttft_ms (first content or reasoning token), gaps_ms
+        (between token chunks), tokens (token chunks), server_timing (from
+        the trailer) and error (an in-stream error event, or a stream
+        that ended without [DONE])
+    """
+    result = {'ttft_ms': None, 'gaps_ms': [], 'tokens': 0, 'server_timing': {}, 'error': None}
+    last = None
+    done = False
+    event = None
+    for line in response.iter_lines():
+        if not line:
+            event = None
+            continue
+        if line.startswith(b'event: '):
+            # Named events (SSE_PROGRESS_EVENTS) aren't completion chunks
+            event = line[7:]
+            continue
+        if line.startswith(TRAILER_PREFIX):
+            result['server_timing'] = server_timing(line[len(TRAILER_PREFIX):].decode())
+            continue
+        if event is not None or not line.startswith(b'data: '):
+            continue
+        payload = line[6:]
+        if payload == b'[DONE]':
+            done = True
+            continue
+        try:
+            chunk = json.loads(payload)
+        except ValueError:
+            continue
+        if 'error' in chunk:
+            error = chunk['error']
+            result['error'] = str(error.get('message', error) if isinstance(error, dict) else error)
+            continue
+        delta = ((chunk.get('choices') or [{}])[0] or {}).get('delta') or {}
+        if delta.get('content') or delta.get('reasoning_content') or delta.get('reasoning'):
+            now = time.perf_counter()
+            if last is None:
+                result['ttft_ms'] = (now - started) * 1000
+            else:
+                result['gaps_ms'].append((now - last) * 1000)
+            last = now
+            result['tokens'] += 1
+    if not done and result['error'] is None:
+        result['error'] = 'stream ended without [DONE]'
+    return result
+
+
+def percentile(values, p):
+    """Nearest-rank p-th percentile (0-100), or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Load-test the router with concurrent streaming and non-streaming clients.
+
+--clients client threads each send /v1/chat/completions requests back to
+back for --duration seconds (or until --requests are done).  Each request
+draws its query class from --mix (weights per route class) and is
+streamed with probability --stream-share.  By default a fresh router is
+started against the stub backends (stubs/), and queries carry the stubs'
+[stub:<class>] marker so the classifier stub routes them as drawn; with
+--url the load goes to a running router and its real backends, and
+--pid names its process for the resource samples.
+
+Measured on the client, per class and for streamed / non-streamed
+requests:
+
+  ttft      — time to the first content or reasoning token (streams)
+  gap       — time between token chunks (streams)
+  total     — time to the end of the response
+  router    — router-added ms from Server-Timing (header, or the
+              stream's trailer)
+  errors    — non-200 responses, in-stream error events, streams cut off
+              without [DONE] and connection failures
+
+plus overall requests/s and tokens/s, and, sampled from /proc every
+--sample-interval seconds, the router's RSS and thread count (summed
+over gunicorn's workers when WORKERS > 1).
+
+--json writes the report, tagged with the commit it ran on; --compare
+prints the change of every headline number against an earlier report.
+
+Usage:
+    python benchmarks/loadtest.py [--clients 32] [--duration 30] [--stream-share 0.5]
+                                  [--mix simple=4,moderate=3,complex=1,enrich=1]
+                                  [--workers 2] [--json after.json] [--compare before.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.harness import RouterProcess, git_commit, percentile, read_stream, server_timing  # noqa: E402
+from stubs import start_stubs, router_env  # noqa: E402
+
+# What each class sends; the real classifier should route these the same way
+QUERIES = {
+    'simple': ['what is the capital of france', 'hello, how are you', 'convert 5 miles to km'],
+    'moderate': ['explain how binary search works', 'compare tcp and udp',
+                 'write a python function to merge two sorted lists'],
+    'complex': ['propose a novel approach to distributed consensus and prove it safe',
+                'design a research plan on the implications of quantum error correction'],
+    'enrich': ['what is the latest news on the stock market today', 'what is the weather right now in tokyo'],
+}
+DEFAULT_MIX = 'simple=4,moderate=3,complex=1,enrich=1'
+# Numbers of the 'all' group that --compare reports
+COMPARED = ('requests_per_s', 'tokens_per_s', 'error_rate', 'ttft_p50_ms', 'ttft_p95_ms', 'gap_p50_ms',
+            'gap_p99_ms', 'total_p50_ms', 'total_p95_ms', 'router_p50_ms', 'router_p95_ms')
+
+
+def parse_mix(spec) -> dict:
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in QUERIES:
+            raise ValueError(f"unknown class {name!r} (known: {', '.join(QUERIES)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError('the mix needs a class with a positive weight')
+    return mix
+
+
+def _process_tree(pid) -> list:
+    """pid and its descendants, from /proc/<pid>/task/*/children."""
+    pids = [pid]
+    for parent in pids:
+        try:
+            for task in os.listdir(f'/proc/{parent}/task'):
+                with open(f'/proc/{parent}/task/{task}/children') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _status(pid) -> dict:
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('VmRSS', 'Threads'):
+                    values[name] = int(value.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+class ResourceSampler:
+    """Samples RSS and thread count of a process and its children."""
+
+    def __init__(self, pid, interval):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._started = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def sample(self):
+        rss_kb = threads = processes = 0
+        for pid in _process_tree(self.pid):
+            status = _status(pid)
+            if status:
+                processes += 1
+                rss_kb += status.get('VmRSS', 0)
+                threads += status.get('Threads', 0)
+        self.samples.append({'t_s': round(time.perf_counter() - self._started, 2), 'processes': processes,
+                             'rss_mb': round(rss_kb / 1024, 1), 'threads': threads})
+
+    def _run(self):
+        self.sample()
+        while not self._stop.wait(self.interval):
+            self.sample()
+        self.sample()
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {}
+        rss = [s['rss_mb'] for s in self.samples]
+        threads = [s['threads'] for s in self.samples]
+        return {
+            'pid': self.pid,
+            'processes': max(s['processes'] for s in self.samples),
+            'rss_start_mb': rss[0], 'rss_max_mb': max(rss), 'rss_end_mb': rss[-1],
+            'threads_start': threads[0], 'threads_max': max(threads), 'threads_end': threads[-1],
+            'samples': self.samples,
+        }
+
+
+def send(http, url, headers, body, query_class) -> dict:
+    """One request; the client-side measurements."""
+    result = {'class': query_class, 'stream': body['stream'], 'error': None}
+    started = time.perf_counter()
+    try:
+        with http.post(f"{url}/v1/chat/completions", json=body, headers=headers, stream=body['stream'],
+                       timeout=600) as response:
+            result['status'] = response.status_code
+            timings = server_timing(response.headers.get('Server-Timing'))
+            if response.status_code != 200:
+                response.content
+                result['error'] = f"HTTP {response.status_code}"
+            elif body['stream']:
+                stream = read_stream(response, started)
+                result.update(ttft_ms=stream['ttft_ms'], gaps_ms=stream['gaps_ms'], tokens=stream['tokens'],
+                              error=stream['error'])
+                timings = stream['server_timing'] or timings
+            else:
+                usage = response.json().get('usage') or {}
+                result['tokens'] = usage.get('completion_tokens', 0)
+    except (requests.RequestException, ValueError) as e:
+        result['status'] = None
+        result['error'] = type(e).__name__
+    result['total_ms'] = (time.perf_counter() - started) * 1000
+    result['router_ms'] = timings.get('router') if result['error'] is None else None
+    return result
+
+
+def run(url, clients, duration, max_requests, mix, stream_share, markers, history, seed, api_key=None):
+    """Drive the clients; the results of every request, in completion order."""
+    headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    sent = [0]
+    classes, weights = zip(*mix.items())
+
+    def _client(n):
+        rng = random.Random(f"{seed}-{n}")
+        http = requests.Session()
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and sent[0] >= max_requests:
+                    return
+                sent[0] += 1
+                number = sent[0]
+            query_class = rng.choices(classes, weights)[0]
+            query = f"{rng.choice(QUERIES[query_class])} (request {number})"
+            if markers:
+                query = f"[stub:{query_class}] {query}"
+            messages = []
+            for turn in range(history):
+                messages += [{'role': 'user', 'content': f"earlier question {turn}: {rng.choice(QUERIES['simple'])}"},
+                             {'role': 'assistant', 'content': f"earlier answer {turn}"}]
+            messages.append({'role': 'user', 'content': query})
+            body = {'model': 'ai-router', 'messages': messages, 'stream': rng.random() < stream_share}
+            result = send(http, url, headers, body, query_class)
+            with lock:
+                results.append(result)
+
+    threads = [threading.Thread(target=_client, args=(n,), name=f'client-{n}') for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def _ms(value):
+    return None if value is None else round(value, 1)
+
+
+def group_stats(group, elapsed) -> dict:
+    ok = [r for r in group if r['error'] is None]
+    ttft = [r['ttft_ms'] for r in ok if r.get('ttft_ms') is not None]
+    gaps = [gap for r in ok for gap in r.get('gaps_ms', ())]
+    total = [r['total_ms'] for r in ok]
+    router = [r['router_ms'] for r in ok if r.get('router_ms') is not None]
+    return {
+        'requests': len(group),
+        'errors': len(group) - len(ok),
+        'error_rate': round((len(group) - len(ok)) / len(group), 4) if group else 0,
+        'requests_per_s': round(len(ok) / elapsed, 2),
+        'tokens_per_s': round(sum(r.get('tokens') or 0 for r in ok) / elapsed, 1),
+        'ttft_p50_ms': _ms(percentile(ttft, 50)),
+        'ttft_p95_ms': _ms(percentile(ttft, 95)),
+        'ttft_p99_ms': _ms(percentile(ttft, 99)),
+        'gap_p50_ms': _ms(percentile(gaps, 50)),
+        'gap_p95_ms': _ms(percentile(gaps, 95)),
+        'gap_p99_ms': _ms(percentile(gaps, 99)),
+        'total_p50_ms': _ms(percentile(total, 50)),
+        'total_p95_ms': _ms(percentile(total, 95)),
+        'total_p99_ms': _ms(percentile(total, 99)),
+        'router_p50_ms': _ms(percentile(router, 50)),
+        'router_p95_ms': _ms(percentile(router, 95)),
+    }
+
+
+def summarize(results, elapsed) -> dict:
+    groups = {'all': results,
+              'stream': [r for r in results if r['stream']],
+              'non_stream': [r for r in results if not r['stream']]}
+    for query_class in QUERIES:
+        group = [r for r in results if r['class'] == query_class]
+        if group:
+            groups[query_class] = group
+    return {name: group_stats(group, elapsed) for name, group in groups.items() if group}
+
+
+def print_summary(groups):
+    columns = ('requests', 'errors', 'requests_per_s', 'tokens_per_s', 'ttft_p50_ms', 'ttft_p95_ms',
+               'gap_p50_ms', 'gap_p99_ms', 'total_p50_ms', 'total_p95_ms', 'router_p50_ms', 'router_p95_ms')
+    labels = ('reqs', 'errors', 'req/s', 'tok/s', 'ttft p50', 'p95', 'gap p50', 'p99', 'total p50', 'p95',
+              'router p50', 'p95')
+    print(f"{'group':<11}" + ''.join(f"{label:>11}" for label in labels))
+    for name, stats in groups.items():
+        cells = ('-' if stats[c] is None else stats[c] for c in columns)
+        print(f"{name:<11}" + ''.join(f"{cell:>11}" for cell in cells))
+
+
+def print_resources(resources):
+    if not resources:
+        return
+    print(f"\nrouter pid {resources['pid']} ({resources['processes']} processes):"
+          f" RSS {resources['rss_start_mb']} -> {resources['rss_end_mb']} MB (max {resources['rss_max_mb']}),"
+          f" threads {resources['threads_start']} -> {resources['threads_end']} (max {resources['threads_max']})")
+
+
+def print_comparison(before, after):
+    """Each headline number of the 'all' group and the resources, before -> after."""
+    print(f"\nvs {before.get('commit') or 'baseline'}:")
+    rows = [(f"all.{metric}", before['groups'].get('all', {}).get(metric), after['groups']['all'].get(metric))
+            for metric in COMPARED]
+    for metric in ('rss_max_mb', 'threads_max'):
+        rows.append((metric, (before.get('resources') or {}).get(metric), (after.get('resources') or {}).get(metric)))
+    for name, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else ''
+        print(f"  {name:<22} {old:>10} -> {new:<10} {change}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent clients (default 16)')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default 30)')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests (default: no limit)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Class weights (default {DEFAULT_MIX})')
+    parser.add_argument('--stream-share', type=float, default=0.5, help='Share of streamed requests (default 0.5)')
+    parser.add_argument('--history', type=int, default=0, help='Earlier turns in every conversation (default 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the mix, the queries and the stubs')
+    parser.add_argument('--workers', type=int, default=1, help='WORKERS for the router under test (default 1)')
+    for kind in ('router', 'primary', 'xai'):
+        parser.add_argument(f'--{kind}', default='', metavar='SPEC', help=f'Latency spec for the {kind} stub')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='Seconds between resource samples')
+    parser.add_argument('--url', help='Load a running router instead (its real backends; no stubs)')
+    parser.add_argument('--pid', type=int, help='With --url: the router process to sample (default: none)')
+    parser.add_argument('--api-key', default=os.getenv('API_KEY'), help='API key for --url (default $API_KEY)')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--compare', help='Print the change against this earlier report')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        sys.exit(f"--mix: {e}")
+    print(f"{args.clients} clients for {args.duration:g}s, mix {args.mix}, {args.stream_share:.0%} streamed",
+          file=sys.stderr)
+
+    def _load(url, pid, api_key=None):
+        sampler = ResourceSampler(pid, args.sample_interval).start() if pid else None
+        try:
+            results, elapsed = run(url, args.clients, args.duration, args.requests, mix, args.stream_share,
+                                   markers=not args.url, history=args.history, seed=args.seed, api_key=api_key)
+        finally:
+            if sampler is not None:
+                sampler.stop()
+        return results, elapsed, sampler.summary() if sampler else {}
+
+    if args.url:
+        results, elapsed, resources = _load(args.url.rstrip('/'), args.pid, args.api_key)
+    else:
+        servers = start_stubs({kind: getattr(args, kind) for kind in ('router', 'primary', 'xai')}, seed=args.seed,
+                              ports={'router': 0, 'primary': 0, 'xai': 0})
+        try:
+            with RouterProcess(router_env(servers), workers=args.workers) as router:
+                print(f"Router pid {router.pid} on {router.url}, logs in {router.log_dir}", file=sys.stderr)
+                results, elapsed, resources = _load(router.url, router.pid)
+        finally:
+            for server in servers.values():
+                server.stop()
+
+    if not results:
+        sys.exit('No requests completed')
+    groups = summarize(results, elapsed)
+    print()
+    print_summary(groups)
+    print_resources(resources)
+    errors = Counter(r['error'] for r in results if r['error'])
+    for error, count in errors.most_common(5):
+        print(f"  {count} x {error}", file=sys.stderr)
+
+    report = {
+        'commit': git_commit(),
+        'target': args.url or 'stubs',
+        'config': {'clients': args.clients, 'duration_s': args.duration, 'requests': args.requests, 'mix': mix,
+                   'stream_share': args.stream_share, 'history': args.history, 'seed': args.seed,
+                   'workers': None if args.url else args.workers,
+                   'stubs': None if args.url else {k: getattr(args, k) for k in ('router', 'primary', 'xai')}},
+        'elapsed_s': round(elapsed, 2),
+        'groups': groups,
+        'errors': dict(errors),
+        'resources': resources,
+    }
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks of the router's per-request Python work, with a regression gate.
+
+Times the pure-Python steps every chat request goes through — no network,
+no backends — over conversations from one short message to 100 turns /
+100K characters:
+
+  determine_route         meta-prompt detection and <chat_history>
+                          truncation (meta/150k is over the primary's
+                          budget and gets truncated)
+  build_routing_request   classifier context, routing prompt and the
+                          encoded classifier body (determine_route)
+  speculative_primary     copy, MODERATE policy, primary system prompt
+                          injection and encoding (start_speculative_primary)
+  inject_system_prompt    xAI system prompt injection on a copy of the
+                          messages (forward_request)
+  SessionLogger.set_query snapshot of the client messages
+  SessionLogger.save      session file write, with its periodic cleanup
+  _log_request_summary    REQUEST summary line for a finished session
+  date_context            temporal context at each granularity
+
+Each case runs for at least --min-time seconds per repeat (timeit's
+autorange); the best of --repeat repeats is reported as µs per call.
+
+--save stores the results as the baseline (default
+benchmarks/micro_baseline.json, per machine and not committed).  When
+a baseline exists, every run compares against it and exits 1 if a case
+got slower by more than --tolerance (default 25%) and --floor µs, so it
+can gate a change:
+
+    python benchmarks/micro.py --save      # on the base commit
+    python benchmarks/micro.py             # on the change
+
+Usage:
+    python benchmarks/micro.py [--filter session] [--repeat 5] [--tolerance 0.25] [--save]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+# Session files and logs go to a scratch directory, and the real prompts
+# are used (their length is part of the work)
+os.environ['LOG_DIR'] = tempfile.mkdtemp(prefix='ai-router-micro-')
+PROMPTS = {
+    'ROUTING_PROMPT_PATH': 'routing/request.md',
+    'ROUTING_TRUNCATION_NOTE_PATH': 'routing/truncation_note.md',
+    'ROUTING_SYSTEM_PROMPT_PATH': 'routing/system.md',
+    'PRIMARY_SYSTEM_PROMPT_PATH': 'primary/system.md',
+    'META_SYSTEM_PROMPT_PATH': 'meta/system.md',
+    'XAI_SYSTEM_PROMPT_PATH': 'xai/system.md',
+    'ENRICHMENT_SYSTEM_PROMPT_PATH': 'enrichment/system.md',
+    'ENRICHMENT_INJECTION_PROMPT_PATH': 'enrichment/injection.md',
+}
+for _name, _path in PROMPTS.items():
+    os.environ.setdefault(_name, str(PROJECT_ROOT / 'config' / 'prompts' / _path))
+# The app's log lines are part of what's timed, but not worth reading
+_stderr = sys.stderr
+sys.stderr = open(os.devnull, 'w')
+
+from src.app import _log_request_summary  # noqa: E402
+from src.codec import dumps  # noqa: E402
+from src.config import date_context, XAI_SYSTEM_PROMPT  # noqa: E402
+from src.providers import (  # noqa: E402
+    build_routing_request, determine_route, inject_system_prompt, speculative_primary_data,
+)
+from src.session_logger import SessionLogger  # noqa: E402
+
+from benchmarks.harness import git_commit  # noqa: E402
+
+DATE_CTX = date_context()
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'micro_baseline.json'
+WORDS = ('the', 'router', 'sends', 'each', 'query', 'to', 'a', 'model', 'that', 'fits', 'its', 'cost',
+         'and', 'latency', 'budget', 'while', 'keeping', 'context', 'warm', 'in', 'cache', 'so')
+
+
+def _text(chars, seed=0) -> str:
+    words = []
+    length = 0
+    i = seed
+    while length < chars:
+        word = WORDS[i % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        i += 7
+    return ' '.join(words)[:chars]
+
+
+def conversation(turns, chars) -> list:
+    """turns user/assistant exchanges of about chars characters in all,
+    ending with a short user question."""
+    per_message = max(1, chars // max(1, 2 * turns))
+    messages = []
+    for turn in range(turns):
+        messages.append({'role': 'user', 'content': _text(per_message // 4, turn)})
+        messages.append({'role': 'assistant', 'content': _text(per_message * 2 - per_message // 4, turn + 1)})
+    messages.append({'role': 'user', 'content': 'and how does that compare to last year?'})
+    return messages
+
+
+def meta_prompt(chars) -> list:
+    """A client meta-prompt (follow-up suggestions) embedding chars of chat history."""
+    lines = []
+    length = 0
+    turn = 0
+    while length < chars:
+        line = f"{'USER' if turn % 2 == 0 else 'ASSISTANT'}: {_text(400, turn)}"
+        lines.append(line)
+        length += len(line) + 1
+        turn += 1
+    history = '\n'.join(lines)
+    return [{'role': 'user', 'content': (
+        "### Task:\nSuggest 3-5 relevant follow-up questions the user might ask next.\n"
+        "### Guidelines:\n- Write from the user's point of view\n- Keep each question short\n"
+        f"<chat_history>\n{history}\n</chat_history>\n")}]
+
+
+CONVERSATIONS = {
+    '1msg': [{'role': 'user', 'content': 'what is the capital of france'}],
+    '10turns/10k': conversation(10, 10_000),
+    '100turns/100k': conversation(100, 100_000),
+}
+META_PROMPTS = {
+    'meta/4k': meta_prompt(4_000),
+    'meta/100k': meta_prompt(100_000),
+    'meta/150k': meta_prompt(150_000),
+}
+
+
+def _finished_session(messages) -> SessionLogger:
+    """A session as a primary request leaves it: query, route and two steps."""
+    session = SessionLogger()
+    session.data['client_ip'] = '127.0.0.1'
+    session.set_query(messages)
+    session.begin_step('classification', 'router', 'http://router:8001/v1/chat/completions', 'router-model',
+                       messages=build_routing_request(messages, DATE_CTX)[0], params={'temperature': 0.0})
+    session.end_step(status=200, response_content='<think>short</think>\nMODERATE', finish_reason='stop',
+                     phases={'write_ms': 0.1, 'ttfb_ms': 180.0, 'body_ms': 0.2, 'reused': True})
+    session.set_route('primary', 'MODERATE', 180)
+    session.begin_step('provider_call', 'primary', 'http://primary:8000/v1/chat/completions', 'primary-model',
+                       params={'model': 'ai-router', 'stream': True})
+    session.end_step(status=200, response_content='[streamed]',
+                     phases={'write_ms': 0.3, 'ttfb_ms': 40.0, 'reused': True})
+    return session
+
+
+def cases() -> dict:
+    """'function[payload]' -> zero-argument callable doing one call's work."""
+    found = {}
+    for name, messages in META_PROMPTS.items():
+        found[f'determine_route[{name}]'] = (
+            lambda m=messages: determine_route([dict(x) for x in m], date_ctx=DATE_CTX))
+    for name, messages in CONVERSATIONS.items():
+        data = {'model': 'ai-router', 'messages': messages, 'stream': True}
+        found[f'build_routing_request[{name}]'] = lambda m=messages: build_routing_request(m, DATE_CTX)
+        found[f'speculative_primary[{name}]'] = lambda d=data: dumps(speculative_primary_data(d, DATE_CTX))
+        found[f'inject_system_prompt[{name}]'] = (
+            lambda m=messages: inject_system_prompt([dict(x) for x in m], XAI_SYSTEM_PROMPT, DATE_CTX))
+        found[f'SessionLogger.set_query[{name}]'] = lambda m=messages: SessionLogger().set_query(m)
+        found[f'SessionLogger.save[{name}]'] = _finished_session(messages).save
+    found['_log_request_summary[1msg]'] = lambda s=_finished_session(CONVERSATIONS['1msg']): _log_request_summary(s)
+    for granularity in ('minute', 'hour', 'day'):
+        found[f'date_context[{granularity}]'] = lambda g=granularity: date_context(g)
+    return found
+
+
+def measure(fn, repeat, min_time) -> float:
+    """Best µs per call over repeat runs of at least min_time seconds."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def compare(results, baseline, tolerance, floor) -> list:
+    """Cases slower than the baseline by more than tolerance and floor µs."""
+    regressions = []
+    for name, us in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base and us > base * (1 + tolerance) and us - base > floor:
+            regressions.append((name, base, us))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--filter', help='Only cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeats per case; the best counts (default 5)')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Seconds per repeat, at least (default 0.1)')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                        help=f'Baseline file (default {DEFAULT_BASELINE})')
+    parser.add_argument('--save', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline, as a fraction (default 0.25)')
+    parser.add_argument('--floor', type=float, default=1.0,
+                        help='Slowdowns of fewer µs than this never fail (default 1)')
+    parser.add_argument('--json', help='Also write the results to this file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'case':<42}{'µs/call':>12}{'baseline':>12}{'change':>9}")
+    for name, fn in cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        us = results[name] = round(measure(fn, args.repeat, args.min_time), 2)
+        base = (baseline or {}).get('results', {}).get(name)
+        change = f"{(us - base) / base * 100:+.1f}%" if base else ''
+        print(f"{name:<42}{us:>12.2f}{base if base else '-':>12}{change:>9}", flush=True)
+
+    report = {'commit': git_commit(), 'python': platform.python_version(), 'machine': platform.node(),
+              'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}", file=_stderr)
+        return
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; --save stores one", file=_stderr)
+        return
+    if baseline.get('machine') != report['machine'] or baseline.get('python') != report['python']:
+        print(f"\nWarning: baseline is from {baseline.get('machine')} / Python {baseline.get('python')}",
+              file=_stderr)
+    regressions = compare(results, baseline, args.tolerance, args.floor)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} against"
+              f" {baseline.get('commit') or 'the baseline'}:", file=_stderr)
+        for name, base, us in regressions:
+            print(f"  {name}: {base:.2f} -> {us:.2f} µs", file=_stderr)
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {baseline.get('commit') or 'the baseline'}",
+          file=_stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Replay logged sessions against the router and report the latency it adds.
+
+Reads session logs (logs/sessions/*.json, see src/session_logger.py) and
+re-sends each session's client request to /v1/chat/completions — same
+messages, streamed or not — at the original inter-arrival times, or
+--speed times faster (--speed 0: as fast as --concurrency allows).
+
+Backends are emulated: a fresh router is started against stub router,
+primary and xAI backends (stubs/) that answer each replayed call after the
+time its session recorded for that step — the classifier with the
+recorded decision — so the router takes the same routes under the same
+backend latencies, and what changes between two runs is what the router
+adds.  Calls are matched to sessions by their user query, and to a
+recorded step by how far into the request they start.  A call the session
+didn't log — speculation abandoned once the route was decided — comes long
+before the step recorded for that backend and borrows its timing without
+using it up.  Streamed steps only record their first byte; their tokens
+follow the stubs' latency models, as does everything for a backend the
+session never called.  Recorded backend failures are not replayed.
+
+Per route (the route each request took in the replay) it reports:
+
+  router    — router-added milliseconds, the `router` entry of the
+              Server-Timing header (streams: the trailer) — time no
+              backend call was running — p50/p95/p99
+  total     — end-to-end milliseconds seen by the client, p50/p95
+  recorded  — total_ms of the same sessions as logged, p50/p95 (for a
+              stream, the time to its first byte)
+  moved     — requests that took a different route than recorded
+
+so changes to caching, speculation or routing policy can be compared on
+real traffic shapes (--json writes the report for diffing between
+commits).  With --url the requests go to an already running router and
+its real backends instead; nothing is emulated.
+
+Usage:
+    python benchmarks/replay.py [--sessions logs/sessions] [--speed 10] [--limit 500]
+                                [--routes primary,xai] [--workers 2] [--json replay.json]
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.harness import RouterProcess, git_commit, percentile, read_stream, server_timing  # noqa: E402
+from stubs import start_stubs, router_env  # noqa: E402
+
+DECISION = re.compile(r'\b(SIMPLE|MODERATE|COMPLEX|ENRICH)\b')
+# Long queries are truncated from the front in the routing prompt; the tail survives
+KEY_CHARS = 200
+# A call may come this much (plus half the recorded start) earlier than the
+# step it replays — the router under test needn't keep the recorded pace
+SLACK_MS = 50
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content or ''
+
+
+def _last_user_text(messages) -> str:
+    for message in reversed(messages or []):
+        if isinstance(message, dict) and message.get('role') == 'user':
+            return _text(message.get('content'))
+    return ''
+
+
+def load_sessions(directory, since=None, routes=None, limit=None) -> list:
+    """Replayable sessions, oldest first."""
+    sessions = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                session = json.load(f)
+            session['_at'] = datetime.fromisoformat(session['timestamp']).timestamp()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"skipping {path}: {e}", file=sys.stderr)
+            continue
+        if not isinstance(session.get('client_messages'), list) or not session['client_messages']:
+            continue
+        if since is not None and session['_at'] < since:
+            continue
+        if routes and session.get('route') not in routes:
+            continue
+        sessions.append(session)
+    sessions.sort(key=lambda s: s['_at'])
+    return sessions[:limit] if limit else sessions
+
+
+def is_stream(session) -> bool:
+    return any(step.get('response_content') == '[streamed]' or (step.get('params') or {}).get('stream')
+               for step in session.get('steps', []) if step.get('step') == 'provider_call')
+
+
+def _recorded_timing(step) -> dict:
+    """What a stub needs to answer like this step did."""
+    if step.get('response_content') == '[streamed]':
+        # Only the first byte was logged; the stub's token rate does the rest
+        return {}
+    phases = step.get('phases') or {}
+    # Time the backend took, without the connection setup the replay redoes itself
+    backend_ms = phases.get('ttfb_ms', step.get('duration_ms') or 0) + phases.get('body_ms', 0)
+    return {'first_token_s': backend_ms / 1000, 'total_s': backend_ms / 1000}
+
+
+def _take(recorded, elapsed_ms):
+    """Timing for a call elapsed_ms into the request, from the recorded
+    (start_ms, timing) steps of its backend: the step whose start is
+    nearest, used up — or, when every step was recorded far later than
+    that, a copy of the first."""
+    if not recorded:
+        return {}
+    eligible = [item for item in recorded if elapsed_ms >= item[0] / 2 - SLACK_MS]
+    if not eligible:
+        return dict(min(recorded, key=lambda i: i[0])[1])
+    item = min(eligible, key=lambda i: abs(i[0] - elapsed_ms))
+    recorded.remove(item)
+    return dict(item[1])
+
+
+def _distance(recorded, elapsed_ms):
+    return min((abs(start - elapsed_ms) for start, _ in recorded or ()), default=float('inf'))
+
+
+class Recordings:
+    """Recorded backend timings of the sessions being replayed, handed to
+    the stubs (Stub.script) as the router makes its calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, session):
+        """Start offering the session's recordings; returns its entry."""
+        steps = {}
+        for step in session.get('steps', []):
+            endpoint = '/v1/responses' if step.get('url', '').endswith('/responses') else '/v1/chat/completions'
+            steps.setdefault((step.get('provider'), endpoint), []).append(
+                (step.get('start_ms') or 0, _recorded_timing(step)))
+        decision = DECISION.search(session.get('classification_raw') or '')
+        entry = {
+            'key': _last_user_text(session['client_messages']).strip()[-KEY_CHARS:],
+            'steps': steps,
+            'answer': decision.group(1) if decision else None,
+            'sent': time.perf_counter(),
+        }
+        with self._lock:
+            self._pending.append(entry)
+        return entry
+
+    def remove(self, entry):
+        with self._lock:
+            self._pending.remove(entry)
+
+    def script(self, kind, endpoint, data):
+        """Stub.script: the recorded timing for a backend call, or None."""
+        items = data.get('messages') or data.get('input') or []
+        text = ' '.join(_text(m.get('content')) for m in items if isinstance(m, dict)) if isinstance(
+            items, list) else str(items)
+        now = time.perf_counter()
+        with self._lock:
+            matches = [entry for entry in self._pending if entry['key'] and entry['key'] in text]
+            if not matches:
+                return None
+            # The longest key wins, so a query of "hi" doesn't take the
+            # recording of "hi, this is urgent"; among sessions with the same
+            # query, the one with a step recorded nearest this far in
+            longest = max(len(entry['key']) for entry in matches)
+            entry = min((entry for entry in matches if len(entry['key']) == longest),
+                        key=lambda e: _distance(e['steps'].get((kind, endpoint)), (now - e['sent']) * 1000))
+            timing = _take(entry['steps'].get((kind, endpoint), []), (now - entry['sent']) * 1000)
+        if kind == 'router':
+            timing['answer'] = entry['answer']
+        return timing or None
+
+
+def _request_body(session):
+    return {'model': 'ai-router', 'messages': session['client_messages'], 'stream': is_stream(session)}
+
+
+def send(http, url, headers, session) -> dict:
+    """Replay one session's request; the client-side measurements."""
+    body = _request_body(session)
+    result = {'session': session['id'], 'recorded_route': session.get('route'),
+              'recorded_ms': session.get('total_ms'), 'stream': body['stream']}
+    started = time.perf_counter()
+    try:
+        with http.post(f"{url}/v1/chat/completions", json=body, headers=headers, stream=body['stream'],
+                       timeout=600) as response:
+            result['status'] = response.status_code
+            result['request_id'] = response.headers.get('X-Request-Id')
+            timings = server_timing(response.headers.get('Server-Timing'))
+            if body['stream']:
+                stream = read_stream(response, started)
+                result['ttft_ms'] = stream['ttft_ms']
+                timings = stream['server_timing'] or timings
+                if stream['error']:
+                    result['error'] = stream['error']
+            else:
+                response.content
+    except requests.RequestException as e:
+        result['status'] = None
+        result['error'] = str(e)
+        return result
+    result['total_ms'] = (time.perf_counter() - started) * 1000
+    result['router_ms'] = timings.get('router')
+    if result['status'] != 200:
+        result['error'] = f"HTTP {result['status']}"
+    return result
+
+
+def replay(sessions, url, speed, concurrency, recordings=None, api_key=None) -> list:
+    """Send every session's request on its (scaled) schedule; the results in order."""
+    headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+    local = threading.local()
+
+    def _send(session):
+        if not hasattr(local, 'http'):
+            local.http = requests.Session()
+        entry = recordings.add(session) if recordings is not None else None
+        try:
+            return send(local.http, url, headers, session)
+        finally:
+            if entry is not None:
+                recordings.remove(entry)
+
+    origin = sessions[0]['_at'] if sessions else 0
+    started = time.time()
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as pool:
+        for i, session in enumerate(sessions):
+            if speed > 0:
+                delay = started + (session['_at'] - origin) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(_send, session))
+            if (i + 1) % 100 == 0:
+                print(f"  sent {i + 1}/{len(sessions)}", file=sys.stderr)
+    return [future.result() for future in futures]
+
+
+def replayed_routes(sessions_dir, results):
+    """Fill in the route each request took, from the replay router's session logs."""
+    routes = {}
+    for path in glob.glob(os.path.join(sessions_dir, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                session = json.load(f)
+            routes[session['id']] = session.get('route')
+        except (OSError, ValueError, KeyError):
+            continue
+    for result in results:
+        result['route'] = routes.get(result.get('request_id'), result['recorded_route'])
+
+
+def _ms(value):
+    return None if value is None else round(value, 1)
+
+
+def summarize(results) -> dict:
+    """Per-route statistics, plus 'all'."""
+    groups = {}
+    for result in results:
+        groups.setdefault(result.get('route') or 'unknown', []).append(result)
+    groups['all'] = results
+    summary = {}
+    for route, group in groups.items():
+        ok = [r for r in group if not r.get('error')]
+        router = [r['router_ms'] for r in ok if r.get('router_ms') is not None]
+        total = [r['total_ms'] for r in ok]
+        recorded = [r['recorded_ms'] for r in group if r.get('recorded_ms') is not None]
+        summary[route] = {
+            'requests': len(group),
+            'errors': len(group) - len(ok),
+            'moved': sum(1 for r in group if r.get('route') != r['recorded_route']),
+            'router_p50_ms': _ms(percentile(router, 50)),
+            'router_p95_ms': _ms(percentile(router, 95)),
+            'router_p99_ms': _ms(percentile(router, 99)),
+            'total_p50_ms': _ms(percentile(total, 50)),
+            'total_p95_ms': _ms(percentile(total, 95)),
+            'recorded_p50_ms': _ms(percentile(recorded, 50)),
+            'recorded_p95_ms': _ms(percentile(recorded, 95)),
+        }
+    return summary
+
+
+def print_summary(summary):
+    columns = ('requests', 'errors', 'moved', 'router_p50_ms', 'router_p95_ms', 'router_p99_ms',
+               'total_p50_ms', 'total_p95_ms', 'recorded_p50_ms', 'recorded_p95_ms')
+    labels = ('reqs', 'errors', 'moved', 'router p50', 'p95', 'p99', 'total p50', 'p95', 'recorded p50', 'p95')
+    print(f"{'route':<10}" + ''.join(f"{label:>13}" for label in labels))
+    for route, stats in summary.items():
+        cells = ('-' if stats[c] is None else stats[c] for c in columns)
+        print(f"{route:<10}" + ''.join(f"{cell:>13}" for cell in cells))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sessions', default=os.path.join(os.getenv('LOG_DIR', 'logs'), 'sessions'),
+                        help='Session log directory (default: $LOG_DIR/sessions, else logs/sessions)')
+    parser.add_argument('--since', help='Only sessions logged at or after this ISO time')
+    parser.add_argument('--routes', help='Only sessions that took these routes (comma-separated)')
+    parser.add_argument('--limit', type=int, help='Replay at most this many sessions (the oldest)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Time compression: 1 = original inter-arrival times, 10 = ten times faster,'
+                             ' 0 = back to back (default 1)')
+    parser.add_argument('--concurrency', type=int, default=64, help='Most requests in flight (default 64)')
+    parser.add_argument('--workers', type=int, default=1, help='WORKERS for the replay router (default 1)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the stubs\' unrecorded delays')
+    parser.add_argument('--url', help='Replay against this running router instead (no backend emulation)')
+    parser.add_argument('--api-key', default=os.getenv('API_KEY'), help='API key for --url (default $API_KEY)')
+    parser.add_argument('--json', help='Also write the report (and per-request results) to this file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    since = datetime.fromisoformat(args.since).timestamp() if args.since else None
+    routes = set(args.routes.split(',')) if args.routes else None
+    sessions = load_sessions(args.sessions, since, routes, args.limit)
+    if not sessions:
+        print(f"No replayable sessions in {args.sessions}", file=sys.stderr)
+        sys.exit(1)
+    span = sessions[-1]['_at'] - sessions[0]['_at']
+    print(f"Replaying {len(sessions)} sessions spanning {span:.0f}s"
+          f" ({'back to back' if args.speed <= 0 else f'{span / args.speed:.0f}s at {args.speed:g}x'})",
+          file=sys.stderr)
+
+    started = time.time()
+    if args.url:
+        results = replay(sessions, args.url.rstrip('/'), args.speed, args.concurrency, api_key=args.api_key)
+        for result in results:
+            result['route'] = result['recorded_route']
+    else:
+        recordings = Recordings()
+        servers = start_stubs(seed=args.seed, ports={'router': 0, 'primary': 0, 'xai': 0},
+                              script=recordings.script)
+        try:
+            with RouterProcess(router_env(servers), workers=args.workers) as router:
+                print(f"Router pid {router.pid} on {router.url}, logs in {router.log_dir}", file=sys.stderr)
+                results = replay(sessions, router.url, args.speed, args.concurrency, recordings)
+            replayed_routes(router.sessions_dir, results)
+        finally:
+            for server in servers.values():
+                server.stop()
+
+    summary = summarize(results)
+    print()
+    print_summary(summary)
+    errors = [r for r in results if r.get('error')]
+    for result in errors[:5]:
+        print(f"  {result['session']}: {result['error']}", file=sys.stderr)
+    if args.json:
+        report = {
+            'commit': git_commit(),
+            'sessions': args.sessions,
+            'speed': args.speed,
+            'concurrency': args.concurrency,
+            'workers': None if args.url else args.workers,
+            'target': args.url or 'stubs',
+            'duration_s': round(time.time() - started, 1),
+            'routes': summary,
+            'results': results,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Compare outbound request overhead over TCP loopback vs a unix domain socket.
+
+Starts two in-process echo servers — one on 127.0.0.1, one on a unix
+socket — and drives them through the router's own transport session
+(src/transport.py), so the numbers reflect exactly what a ROUTER_URL /
+PRIMARY_URL of http:// vs unix:// costs per backend call:
+
+  cold    — Connection: close on every request (connect + transfer)
+  pooled  — keep-alive connection reuse (transfer only)
+
+for several request/response body sizes.  No GPU or backends needed.
+
+Usage:
+    python benchmarks/uds_vs_tcp.py [--requests N] [--sizes 256,16384,262144]
+"""
+
+import argparse
+import logging
+import os
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='ai-router-bench-'))
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Reads the request body and returns it — a stand-in for a JSON API."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            # Tell the client not to return this socket to its pool
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TCPEchoHandler(EchoHandler):
+    # Like uvicorn (vLLM's server), send small writes immediately rather
+    # than letting Nagle + delayed ACK add ~40ms to every pooled request.
+    disable_nagle_algorithm = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_servers(socket_path):
+    tcp = ThreadingHTTPServer(('127.0.0.1', 0), TCPEchoHandler)
+    uds = ThreadingUnixHTTPServer(socket_path, EchoHandler)
+    for server in (tcp, uds):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return tcp, uds
+
+
+def measure(session, url, body, n, close):
+    headers = {'Content-Type': 'application/json'}
+    if close:
+        headers['Connection'] = 'close'
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = session.post(url, data=body, headers=headers, timeout=10)
+        response.content
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TCP vs unix socket transport overhead")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per cell (default: 500)")
+    parser.add_argument('--sizes', default='256,16384,262144,1048576',
+                        help="Comma-separated body sizes in bytes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='ai-router-uds-'), 'echo.sock')
+    tcp, _ = start_servers(socket_path)
+    tcp_base = f"http://127.0.0.1:{tcp.server_address[1]}"
+    uds_base = f"unix://{socket_path}"
+
+    # The transport mounts adapters for unix URLs found in the backend
+    # config at import time — point PRIMARY_URL at the echo socket.
+    os.environ['PRIMARY_URL'] = uds_base
+    from src.transport import HTTP
+    logging.getLogger('ai_router').setLevel(logging.WARNING)
+
+    print(f"{'mode':<8} {'size':>9} {'TCP p50':>10} {'UDS p50':>10} {'TCP p95':>10} {'UDS p95':>10} {'p50 saved':>10}")
+    for close in (True, False):
+        mode = 'cold' if close else 'pooled'
+        for size in sizes:
+            body = b'x' * size
+            # Warm up both paths (imports, pool creation, page cache)
+            measure(HTTP, f"{tcp_base}/v1/chat/completions", body, 20, close)
+            measure(HTTP, f"{uds_base}/v1/chat/completions", body, 20, close)
+            tcp_p50, tcp_p95 = measure(HTTP, f"{tcp_base}/v1/chat/completions", body, args.requests, close)
+            uds_p50, uds_p95 = measure(HTTP, f"{uds_base}/v1/chat/completions", body, args.requests, close)
+            saved = (tcp_p50 - uds_p50) / tcp_p50 * 100
+            print(f"{mode:<8} {size:>9} {tcp_p50:>8.0f}µs {uds_p50:>8.0f}µs "
+                  f"{tcp_p95:>8.0f}µs {uds_p95:>8.0f}µs {saved:>9.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,58 @@
 """Flask application and route handlers."""
 
 import hmac
-import json
+import math
+import os
 import time
 from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify, Response
 from werkzeug.middleware.proxy_fix import ProxyFix
-import requests
 
 from src.config import (
     logger, date_context,
-    PRIMARY_URL, PRIMARY_MODEL,
+    PRIMARY_MODEL,
     XAI_API_KEY, XAI_API_URL,
-    ROUTER_URL,
     VIRTUAL_MODEL,
     ENRICHMENT_INJECTION_PROMPT,
     META_SYSTEM_PROMPT,
     XAI_MIN_MAX_TOKENS,
     API_KEY,
+    OVERFLOW_BUDGET_PER_HOUR,
+    WORKERS,
+    PORT,
+    SSE_HEARTBEAT_INTERVAL, SSE_PROGRESS_EVENTS,
+    PROFILING,
 )
 from src.session_logger import SessionLogger
+from src.codec import loads, CodecJSONProvider
+from src.log_pipeline import fields
+from src.timing import breakdown, annotate
+from src.tracing import trace_request, finish_trace, span, current_span, in_context
+from src.profiler import PROFILE_HEADER, profile_request, finish_profile, profile_process
+from src.transport import HTTP, connection_phase_stats
+from src.backends import ROUTER_POOL, PRIMARY_POOL, start_health_prober
+from src.conversation import conversation_fingerprint, CLASSIFIER_CONTEXT, ROUTE_MEMORY
+from src.load_monitor import LOAD_MONITOR, OVERFLOW_BUDGET
+from src.warmup import is_ready, start_warmup
+from src.tokens import TOKENS, fit_context, message_chars
+from src.deadline import Deadline, DEADLINE_HEADER, deadline_stats
+from src.resilience import is_context_length_error, resilience_stats
+from src.sse import open_stream
+from src.generation import policy_name, policy_for
 from src.providers import (
     determine_route,
+    is_meta_prompt,
     fetch_enrichment_context,
     get_model_url,
     forward_request,
     start_speculative_primary,
+    start_speculative_enrichment,
+    speculative_enrichment_stats,
 )
 
 app = Flask(__name__)
+# request.get_json() and jsonify() go through the fast codec as well
+app.json = CodecJSONProvider(app)
 
 # Trust proxy headers from traefik (and cloudflared behind it).
 # x_for=2: two proxies in the chain (cloudflared → traefik → app).
@@ -80,21 +104,16 @@ def _log_request_summary(session):
     Fires a slow-request warning if total_ms exceeds the route's threshold.
     Called before save(), so compute total_ms from the session start time."""
     d = session.data
-    total_ms = round((time.time() - session.start_time) * 1000)
     route = d.get('route', 'unknown')
-    classify_ms = d.get('classification_ms') or 0
     stream = any(s.get('response_content') == '[streamed]' for s in d.get('steps', []))
 
-    # Sum provider call durations (excludes classification and enrichment)
-    inference_ms = sum(
-        s.get('duration_ms', 0) for s in d.get('steps', [])
-        if s.get('step') == 'provider_call'
-    )
-    # Enrichment duration (xAI context fetch, only present on enrich route)
-    enrich_ms = sum(
-        s.get('duration_ms', 0) for s in d.get('steps', [])
-        if s.get('step') == 'enrichment'
-    )
+    # Provider call and enrichment (xAI context fetch) durations, summed
+    # over their steps; see src/timing.py
+    timings = breakdown(session)
+    total_ms = timings['total']
+    classify_ms = timings['classification']
+    inference_ms = timings['inference']
+    enrich_ms = timings['enrichment']
 
     client_ip = d.get('client_ip', '-')
     parts = [
@@ -103,7 +122,10 @@ def _log_request_summary(session):
     if enrich_ms:
         parts.append(f"enrichment_ms={enrich_ms}")
     parts.append(f"inference_ms={inference_ms} total_ms={total_ms} stream={stream}")
-    logger.info(" ".join(parts))
+    summary = dict(session=d['id'], client=client_ip, route=route, classification_ms=classify_ms,
+                   enrichment_ms=enrich_ms, inference_ms=inference_ms, router_ms=timings['router'],
+                   total_ms=total_ms, stream=stream)
+    logger.info(" ".join(parts), extra=fields(event='request', **summary))
 
     threshold = SLOW_REQUEST_THRESHOLDS.get(route, 10000)
     if total_ms > threshold:
@@ -114,13 +136,13 @@ def _log_request_summary(session):
         if enrich_ms:
             slow_parts.append(f"enrichment_ms={enrich_ms}")
         slow_parts.append(f"inference_ms={inference_ms}")
-        logger.warning(" ".join(slow_parts))
+        logger.warning(" ".join(slow_parts), extra=fields(event='slow_request', threshold_ms=threshold, **summary))
 
 
 def _check_health(url, headers=None):
     """Check a single backend's health. Returns True if reachable and 200."""
     try:
-        return requests.get(url, headers=headers, timeout=5).status_code == 200
+        return HTTP.get(url, headers=headers, timeout=5).status_code == 200
     except Exception:
         return False
 
@@ -131,12 +153,21 @@ def health():
 
     Checks all backends in parallel so a single slow/down backend
     doesn't block the others. Worst case drops from 15s to 5s.
+    Each local pool is healthy if at least one of its replicas is;
+    per-replica state is reported under 'replicas'.
+
+    Reports 'warming' (503) until startup warm-up has finished, so the
+    process only counts as ready once its connections and prompt prefix
+    caches are warm.
     """
+    if not is_ready():
+        return jsonify({'status': 'warming'}), 503
+
     health_start = time.time()
     try:
         with ThreadPoolExecutor(max_workers=3) as pool:
-            router_future = pool.submit(_check_health, f"{ROUTER_URL}/health")
-            primary_future = pool.submit(_check_health, f"{PRIMARY_URL}/health")
+            router_future = pool.submit(ROUTER_POOL.probe)
+            primary_future = pool.submit(PRIMARY_POOL.probe)
             xai_future = None
             if XAI_API_KEY:
                 xai_future = pool.submit(
@@ -152,7 +183,11 @@ def health():
         health_status = {
             'status': 'healthy' if (router_health and primary_health) else 'degraded',
             'router_model': 'healthy' if router_health else 'unhealthy',
-            'primary_model': 'healthy' if primary_health else 'unhealthy'
+            'primary_model': 'healthy' if primary_health else 'unhealthy',
+            'replicas': {
+                'router': ROUTER_POOL.snapshot(),
+                'primary': PRIMARY_POOL.snapshot(),
+            },
         }
 
         if xai_health is not None:
@@ -172,15 +207,16 @@ def health():
         }), 503
 
 
-def _handle_speculative_primary(spec_response, spec_start, data, is_stream, session):
+def _handle_speculative_primary(spec_response, spec_start, spec_lease, data, is_stream, session):
     """Handle a successful speculative primary response.
 
     Logs the provider call step and returns a Flask Response.
     For streaming, returns an SSE iterator wrapping the speculative connection.
     For non-streaming, returns the already-complete response body.
+    The replica lease is released when the stream ends or the body is read.
     """
     logger.info("Using speculative primary response")
-    spec_url = f"{PRIMARY_URL}/v1/chat/completions"
+    spec_url = f"{spec_lease.url}/v1/chat/completions"
     log_params = {k: v for k, v in data.items()
                   if k not in ('messages', '_route', 'max_tokens')}
 
@@ -191,9 +227,13 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
         # connection was established.
         session.begin_step('provider_call', 'primary', spec_url, PRIMARY_MODEL,
                            params=log_params)
+        # Backdate like the non-streaming path: the step ran from the
+        # speculative start to the response headers
+        session._step_start = spec_start
         session.end_step(status=spec_response.status_code,
-                         response_content='[streamed]')
+                         response_content='[streamed]', phases=spec_response.phases)
         connect_ms = (time.time() - spec_start) * 1000
+        spec_lease.observe_response(spec_response)
 
         def _stream_chunks():
             first_chunk = True
@@ -203,7 +243,11 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
                     logger.info(
                         f"Provider response: primary status={spec_response.status_code}"
                         f" connect_ms={connect_ms:.0f} ttft_ms={ttft_ms:.0f}"
-                        f" stream=true speculative=true"
+                        f" stream=true speculative=true",
+                        extra=fields(event='provider_response', session=session.id, provider='primary',
+                                     status=spec_response.status_code, connect_ms=round(connect_ms),
+                                     ttft_ms=round(ttft_ms), stream=True, speculative=True,
+                                     phases=spec_response.phases)
                     )
                     first_chunk = False
                 yield chunk
@@ -211,16 +255,20 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
         data['_route'] = 'primary'
         _log_request_summary(session)
         session.save()
-        return Response(
+        stream_response = Response(
             _stream_chunks(),
             status=spec_response.status_code,
             content_type='text/event-stream'
         )
+        stream_response.call_on_close(spec_lease.release)
+        return stream_response
 
     # Non-streaming: the full response body is already available because
     # inference ran in parallel with classification.
     response_body = spec_response.content
     forward_ms = (time.time() - spec_start) * 1000
+    spec_lease.observe_response(spec_response)
+    spec_lease.release()
 
     session.begin_step('provider_call', 'primary', spec_url, PRIMARY_MODEL,
                        params=log_params)
@@ -229,7 +277,7 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
 
     finish_reason = None
     try:
-        resp_json = json.loads(response_body)
+        resp_json = loads(response_body)
         choice = resp_json.get('choices', [{}])[0]
         finish_reason = choice.get('finish_reason')
         msg = choice.get('message', {})
@@ -237,18 +285,26 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
         session.end_step(
             status=spec_response.status_code,
             response_content=resp_text or response_body.decode('utf-8', errors='replace'),
-            finish_reason=finish_reason
+            finish_reason=finish_reason,
+            phases=spec_response.phases
         )
-    except (json.JSONDecodeError, IndexError, KeyError):
+        sent = spec_response.sent_messages
+        TOKENS.calibrate(message_chars(sent), len(sent), resp_json.get('usage'))
+    except (ValueError, IndexError, KeyError):
         session.end_step(
             status=spec_response.status_code,
-            response_content=response_body.decode('utf-8', errors='replace')
+            response_content=response_body.decode('utf-8', errors='replace'),
+            phases=spec_response.phases
         )
 
     logger.info(
         f"Provider response: primary status={spec_response.status_code}"
         f" duration_ms={forward_ms:.0f} finish_reason={finish_reason}"
-        f" stream=false speculative=true"
+        f" stream=false speculative=true",
+        extra=fields(event='provider_response', session=session.id, provider='primary',
+                     status=spec_response.status_code, duration_ms=round(forward_ms),
+                     finish_reason=finish_reason, stream=False, speculative=True,
+                     phases=spec_response.phases)
     )
 
     data['_route'] = 'primary'
@@ -261,46 +317,96 @@ def _handle_speculative_primary(spec_response, spec_start, data, is_stream, sess
     )
 
 
-def _handle_primary(data, is_stream, session, date_ctx, spec_response, spec_start):
+def _handle_primary(data, is_stream, session, date_ctx, spec_response, spec_start, spec_lease,
+                    affinity_key=None, deadline=None):
     """Handle primary route: use speculative response or fall back to normal forwarding.
 
     The speculative request was fired in parallel with classification.  If it
     succeeded (status 2xx), we reuse it directly — saving the full classification
-    latency.  Otherwise we close it and forward normally.
+    latency.  If it failed on the server side we close it and forward normally.
+    A 4xx would only fail again — the fallback request is identical — so it
+    is returned as-is, except that a prompt over the primary's context
+    window goes to xAI's larger one when a key is configured.
+
+    The speculative request carries the moderate generation policy.  A
+    streamed SIMPLE turn whose policy differs (typically thinking off) is
+    re-sent with its own — the stream has only just started, and skipping
+    the reasoning pass beats waiting it out.  A non-streamed speculative
+    response is already complete by now, so it is always used.
     """
     if 'max_tokens' in data:
         logger.info(f"Primary route: removing client max_tokens ({data['max_tokens']})")
 
+    policy = policy_name('primary', session.data['classification_raw'])
+    policy_resend = False
+    if (spec_response is not None and is_stream and spec_response.ok
+            and policy_for(policy) != policy_for('moderate')):
+        logger.info(f"Re-sending with the {policy} generation policy instead of the speculative primary")
+        spec_response.close()
+        spec_lease.release()
+        spec_response = None
+        policy_resend = True
+
     if spec_response is not None and spec_response.ok:
         return _handle_speculative_primary(
-            spec_response, spec_start, data, is_stream, session
+            spec_response, spec_start, spec_lease, data, is_stream, session
         )
 
-    # Speculative request failed — fall back to normal forwarding
+    if spec_response is not None and 400 <= spec_response.status_code < 500 and spec_response.status_code != 429:
+        body = spec_response.content
+        spec_lease.release()
+        if is_context_length_error(spec_response.status_code, body) and XAI_API_KEY:
+            logger.warning("Speculative primary rejected the prompt as too long, sending it to xAI")
+            session.data['context'] = {'action': 'xai', 'reason': 'backend_context_length'}
+            session.set_route('xai', f"[context_overflow] {session.data['classification_raw']}",
+                              session.data['classification_ms'] or 0)
+            if deadline:
+                deadline.set_route('xai')
+            return _handle_xai(data, 'xai', session, date_ctx, deadline)
+        logger.warning(f"Speculative primary status {spec_response.status_code}, not retrying an identical request")
+        session.set_error(f'primary status {spec_response.status_code}')
+        data['_route'] = 'primary'
+        _log_request_summary(session)
+        session.save()
+        return Response(body, status=spec_response.status_code,
+                        content_type=spec_response.headers.get('Content-Type', 'application/json'))
+
+    # Speculative request failed — fall back to normal forwarding.  The
+    # fallback is the same request, so its already-encoded body is resent.
+    body = None
     if spec_response is not None:
         logger.warning(f"Speculative primary status {spec_response.status_code}, falling back")
         spec_response.close()
-    else:
-        logger.warning("Speculative primary failed, falling back")
+        spec_lease.release(error=spec_response.status_code >= 500)
+        if policy_for(policy) == policy_for('moderate'):
+            body = spec_response.request.body
+    elif not policy_resend:
+        logger.warning("Speculative primary unavailable, falling back")
 
     if 'max_tokens' in data:
         del data['max_tokens']
     data['_route'] = 'primary'
-    result = forward_request(PRIMARY_URL, '/v1/chat/completions', data, 'primary',
-                             session=session, date_ctx=date_ctx)
+    result = forward_request(PRIMARY_POOL, '/v1/chat/completions', data, 'primary',
+                             session=session, date_ctx=date_ctx, affinity_key=affinity_key,
+                             deadline=deadline, policy=policy, body=body)
     _log_request_summary(session)
     session.save()
     return result
 
 
-def _handle_enrich(data, session, date_ctx):
+def _handle_enrich(data, session, date_ctx, affinity_key=None, spec_enrich=None, deadline=None):
     """Handle enrichment pipeline: fetch context from xAI, then forward to primary.
 
     Two-hop pipeline — xAI retrieves real-time context, which is injected into the
-    conversation before the primary model generates the final response.
+    conversation before the primary model generates the final response.  When
+    the search was already started speculatively, its result is used instead.
     """
     logger.info("Entering enrichment pipeline")
-    context = fetch_enrichment_context(data['messages'], session=session, date_ctx=date_ctx)
+    if spec_enrich is not None:
+        context = spec_enrich.take(session)
+    else:
+        context = fetch_enrichment_context(data['messages'], session=session, date_ctx=date_ctx,
+                                           deadline=deadline)
 
     if context:
         injection = ENRICHMENT_INJECTION_PROMPT.format(
@@ -329,14 +435,15 @@ def _handle_enrich(data, session, date_ctx):
         del data['max_tokens']
 
     data['_route'] = 'enrich'
-    result = forward_request(PRIMARY_URL, '/v1/chat/completions', data, 'primary',
-                             session=session, date_ctx=date_ctx)
+    result = forward_request(PRIMARY_POOL, '/v1/chat/completions', data, 'primary',
+                             session=session, date_ctx=date_ctx, affinity_key=affinity_key,
+                             deadline=deadline, policy='enrich')
     _log_request_summary(session)
     session.save()
     return result
 
 
-def _handle_meta(data, session, date_ctx):
+def _handle_meta(data, session, date_ctx, affinity_key=None, deadline=None):
     """Handle meta pipeline: client-generated meta-prompts (titles, follow-ups, summaries).
 
     These are self-contained prompts from clients like Open WebUI that embed their
@@ -351,14 +458,15 @@ def _handle_meta(data, session, date_ctx):
         del data['max_tokens']
 
     data['_route'] = 'meta'
-    result = forward_request(PRIMARY_URL, '/v1/chat/completions', data, 'primary',
-                             session=session, date_ctx=date_ctx)
+    result = forward_request(PRIMARY_POOL, '/v1/chat/completions', data, 'primary',
+                             session=session, date_ctx=date_ctx, affinity_key=affinity_key,
+                             deadline=deadline, policy='meta')
     _log_request_summary(session)
     session.save()
     return result
 
 
-def _handle_xai(data, route, session, date_ctx):
+def _handle_xai(data, route, session, date_ctx, deadline=None):
     """Handle xAI route: forward to cloud API with max_tokens floor.
 
     Enforces XAI_MIN_MAX_TOKENS so Open WebUI's low defaults (100–300) don't
@@ -373,12 +481,160 @@ def _handle_xai(data, route, session, date_ctx):
 
     data['_route'] = route
     result = forward_request(target_url, '/v1/chat/completions', data, route,
-                             session=session, date_ctx=date_ctx)
+                             session=session, date_ctx=date_ctx, deadline=deadline, policy='xai')
     _log_request_summary(session)
     session.save()
     return result
 
 
+def _should_overflow(saturation, session):
+    """Decide whether a primary-bound request overflows to xAI.
+
+    Only called when every primary replica is over a saturation threshold
+    and the xAI key and budget allowed overflow as the request arrived (the
+    budget may have run out since).  Every decision — taken or declined — is logged and recorded in the
+    session so overflow behaviour can be audited against the budget.
+    """
+    load = ' '.join(saturation['reasons'])
+    if not XAI_API_KEY:
+        decision, reason = 'primary', 'no_xai_key'
+    elif not OVERFLOW_BUDGET.try_consume():
+        decision, reason = 'primary', 'budget_exhausted'
+    else:
+        decision, reason = 'xai', 'saturated'
+
+    used = OVERFLOW_BUDGET.used()
+    session.data['overflow'] = {
+        'decision': decision,
+        'reason': reason,
+        'load': {k: saturation[k] for k in ('url', 'running', 'waiting', 'kv_cache')},
+        'budget_used': used,
+    }
+    line = (f"OVERFLOW session={session.id} decision={decision} reason={reason} {load}"
+            f" budget_used={used}/{OVERFLOW_BUDGET_PER_HOUR}")
+    if decision == 'xai':
+        logger.info(line)
+    else:
+        logger.warning(line)
+    return decision == 'xai'
+
+
+def _fit_context(data, session, date_ctx):
+    """Apply the context budget (src/tokens.py) to the request in place.
+
+    Returns 'xai' when the conversation should skip classification and go
+    straight to xAI's larger window, otherwise None.  Meta-prompts are left
+    alone — determine_route truncates their embedded history itself.
+    """
+    if is_meta_prompt(data['messages']):
+        return None
+    fit = fit_context(data['messages'], date_ctx)
+    if fit['action'] is None:
+        return None
+
+    if 'messages' in fit:
+        data['messages'] = fit['messages']
+    session.data['context'] = {k: v for k, v in fit.items() if k != 'messages'}
+    line = (f"CONTEXT session={session.id} action={fit['action']} tokens={fit['tokens']}"
+            f" budget={fit['budget']} exact={fit['exact']}")
+    if 'dropped' in fit:
+        line += f" dropped={fit['dropped']} kept_tokens={fit['kept_tokens']}"
+    logger.warning(line)
+    return 'xai' if fit['action'] == 'xai' else None
+
+
+def _route_chat(data, session, is_stream, date_ctx, deadline, affinity_key):
+    """Classify a chat request and hand it to its route's handler."""
+    spec_response = None  # track for cleanup on error
+    spec_lease = None
+    spec_enrich = None
+    try:
+        # Measure the conversation against the primary's context window
+        # before anything is sent — trim it or move it to xAI rather than
+        # pay for classification and a prefill that would fail.
+        with span('context_fit'):
+            overflow = _fit_context(data, session, date_ctx)
+        if overflow == 'xai':
+            session.set_route('xai', '[context_overflow]', 0)
+            deadline.set_route('xai')
+            return _handle_xai(data, 'xai', session, date_ctx, deadline)
+
+        # A saturated primary would only queue the speculative request
+        # behind the backlog — skip it and consider overflow after
+        # classification instead.  Only while overflow can actually
+        # happen: without an xAI key or budget the request goes to the
+        # primary anyway, and speculation still saves it the wait.
+        saturation = None
+        if OVERFLOW_BUDGET_PER_HOUR and XAI_API_KEY and OVERFLOW_BUDGET.available():
+            saturation = LOAD_MONITOR.saturation()
+
+        # The enrichment search dwarfs classification — when the query
+        # looks like it needs one, don't wait for the classifier to say so.
+        spec_enrich = start_speculative_enrichment(data['messages'], date_ctx, deadline)
+
+        # Fire classification and speculative primary inference in parallel.
+        # determine_route() calls the Orchestrator 8B classifier (~1–1.8s).
+        # start_speculative_primary() sends the same request to the primary
+        # model immediately, betting that classification will return primary.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            classify_future = pool.submit(
+                in_context(determine_route), data['messages'], session=session, date_ctx=date_ctx,
+                affinity_key=affinity_key, deadline=deadline,
+            )
+            spec_future = None
+            if saturation is None:
+                spec_future = pool.submit(
+                    in_context(start_speculative_primary), data, date_ctx, is_stream, affinity_key, deadline
+                )
+            route = classify_future.result()
+            deadline.set_route(route)
+            if spec_future is not None:
+                spec_response, spec_start, spec_lease = spec_future.result()
+            else:
+                spec_response, spec_start, spec_lease = None, 0, None
+
+        # Non-primary routes: cancel the speculative request immediately
+        if route != 'primary' and spec_response is not None:
+            spec_response.close()
+            spec_lease.release()
+            logger.info(f"Cancelled speculative primary (route={route})")
+            spec_response = None
+
+        if spec_enrich is not None and route != 'enrich':
+            spec_enrich.discard(route, session)
+
+        if route == 'primary' and saturation is not None and _should_overflow(saturation, session):
+            session.set_route('xai', f"[overflow] {session.data['classification_raw']}",
+                              session.data['classification_ms'] or 0)
+            deadline.set_route('xai')
+            return _handle_xai(data, 'xai', session, date_ctx, deadline)
+
+        # Dispatch to route handler
+        if route == 'primary':
+            return _handle_primary(data, is_stream, session, date_ctx,
+                                   spec_response, spec_start, spec_lease, affinity_key, deadline)
+        if route == 'enrich':
+            return _handle_enrich(data, session, date_ctx, affinity_key, spec_enrich, deadline)
+        if route == 'meta':
+            return _handle_meta(data, session, date_ctx, affinity_key, deadline)
+        return _handle_xai(data, route, session, date_ctx, deadline)
+
+    except Exception as e:
+        if spec_response is not None:
+            spec_response.close()
+            spec_lease.release(error=True)
+        if spec_enrich is not None:
+            spec_enrich.discard('error', session)
+        logger.error(f"Error in chat_completions: {str(e)}")
+        session.set_error(str(e))
+        _log_request_summary(session)
+        session.save()
+        return jsonify({
+            'error': 'Internal error',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/v1/chat/completions', methods=['POST'])
 def chat_completions():
     """
@@ -392,17 +648,35 @@ def chat_completions():
 
     Cost: one wasted local inference start per COMPLEX/ENRICH request
     (~200–400ms GPU time), negligible at single-user homelab concurrency.
+
+    Speculative enrichment: queries with temporal/news keywords can start
+    the xAI enrichment search alongside classification as well, within a
+    daily budget of discarded searches (SPECULATIVE_ENRICH_BUDGET_PER_DAY).
+
+    Load-aware overflow: when every primary replica's vLLM queue is past
+    the saturation thresholds, speculation is skipped and SIMPLE/MODERATE
+    requests go to xAI instead, within OVERFLOW_BUDGET_PER_HOUR.
+
+    Streams open immediately (src/sse.py): heartbeats, and optionally
+    progress events, flow while the pipeline runs on another thread.
+
+    Each request is traced (src/tracing.py) until its response is done,
+    and profiled (src/profiler.py) when it asks to be with X-Profile.
     """
     session = SessionLogger()
-    spec_response = None  # track for cleanup on error
+    with trace_request(session) as trace, profile_request(session, request.headers.get(PROFILE_HEADER)) as profile:
+        return finish_trace(trace, finish_profile(profile, _chat_completions(session)))
+
+
+def _chat_completions(session):
     try:
         data = request.get_json()
 
         if not data or 'messages' not in data:
-            return jsonify({
+            return annotate((jsonify({
                 'error': 'Invalid request',
                 'message': 'Missing required field: messages'
-            }), 400
+            }), 400), session)
 
         session.set_query(data['messages'])
         session.data['client_ip'] = request.remote_addr
@@ -412,50 +686,35 @@ def chat_completions():
         total_chars = sum(len(m.get('content', '')) for m in data['messages'])
         is_stream = data.get('stream', False)
         logger.info(f"Incoming request: client={request.remote_addr} messages={msg_count} total_chars={total_chars} stream={is_stream}")
+        current_span().set(messages=msg_count, chars=total_chars, stream=is_stream)
 
         # Compute temporal context once for the entire request pipeline
         date_ctx = date_context()
-
-        # Fire classification and speculative primary inference in parallel.
-        # determine_route() calls the Orchestrator 8B classifier (~1–1.8s).
-        # start_speculative_primary() sends the same request to the primary
-        # model immediately, betting that classification will return primary.
-        with ThreadPoolExecutor(max_workers=2) as pool:
-            classify_future = pool.submit(
-                determine_route, data['messages'], session=session, date_ctx=date_ctx
-            )
-            spec_future = pool.submit(
-                start_speculative_primary, data, date_ctx, is_stream
-            )
-            route = classify_future.result()
-            spec_response, spec_start = spec_future.result()
-
-        # Non-primary routes: cancel the speculative request immediately
-        if route != 'primary' and spec_response is not None:
-            spec_response.close()
-            logger.info(f"Cancelled speculative primary (route={route})")
-            spec_response = None
-
-        # Dispatch to route handler
-        if route == 'primary':
-            return _handle_primary(data, is_stream, session, date_ctx, spec_response, spec_start)
-        if route == 'enrich':
-            return _handle_enrich(data, session, date_ctx)
-        if route == 'meta':
-            return _handle_meta(data, session, date_ctx)
-        return _handle_xai(data, route, session, date_ctx)
-
+        # Every stage below gets what's left of this, not a fixed timeout
+        deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+        session.data['deadline'] = deadline.record
+        # Pins every turn of this conversation to the same backend replicas
+        affinity_key = conversation_fingerprint(data['messages'])
     except Exception as e:
-        if spec_response is not None:
-            spec_response.close()
         logger.error(f"Error in chat_completions: {str(e)}")
         session.set_error(str(e))
         _log_request_summary(session)
         session.save()
-        return jsonify({
+        return annotate((jsonify({
             'error': 'Internal error',
             'message': str(e)
-        }), 500
+        }), 500), session)
+
+    if is_stream and SSE_HEARTBEAT_INTERVAL > 0:
+        def _run(progress):
+            if SSE_PROGRESS_EVENTS:
+                session.progress = progress
+            with app.app_context():
+                return _route_chat(data, session, is_stream, date_ctx, deadline, affinity_key)
+
+        # Opened before the pipeline runs: the timing follows the stream
+        return annotate(open_stream(in_context(_run), SSE_HEARTBEAT_INTERVAL), session, header=False)
+    return annotate(_route_chat(data, session, is_stream, date_ctx, deadline, affinity_key), session)
 
 
 @app.route('/v1/completions', methods=['POST'])
@@ -474,7 +733,7 @@ def completions():
             }), 400
 
         # Use primary model for legacy completions
-        return forward_request(PRIMARY_URL, '/v1/completions', data)
+        return forward_request(PRIMARY_POOL, '/v1/completions', data)
 
     except Exception as e:
         logger.error(f"Error in completions: {str(e)}")
@@ -542,14 +801,57 @@ def api_route():
 
 @app.route('/stats', methods=['GET'])
 def stats():
-    """Get routing statistics (placeholder for future implementation)."""
-    # This would track routing decisions in a production system
+    """Get routing statistics: replica load/latency, affinity hit rates, overflow."""
     return jsonify({
-        'message': 'Statistics endpoint - not yet implemented',
         'routes': {
             'primary': 'Local model for simple and moderate queries',
             'xai': 'Cloud model for complex queries and enrichment'
-        }
+        },
+        'backends': {
+            'router': ROUTER_POOL.snapshot(),
+            'primary': PRIMARY_POOL.snapshot(),
+        },
+        'affinity': {
+            'router': ROUTER_POOL.affinity_stats(),
+            'primary': PRIMARY_POOL.affinity_stats(),
+        },
+        'primary_load': LOAD_MONITOR.snapshot(),
+        'overflow': {
+            'budget_per_hour': OVERFLOW_BUDGET_PER_HOUR,
+            'used_last_hour': OVERFLOW_BUDGET.used(),
+        },
+        'speculative_enrichment': speculative_enrichment_stats(),
+        'deadlines': deadline_stats(),
+        'resilience': resilience_stats(),
+        'connection_phases': connection_phase_stats(),
+        'classifier_context': CLASSIFIER_CONTEXT.stats(),
+        'route_memory': ROUTE_MEMORY.stats(),
+        'server': {
+            'workers': WORKERS,
+            'pid': os.getpid(),
+        },
+    })
+
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Sample this worker's threads for ?seconds= (default 10) and return the
+    stacks in collapsed format, for flamegraph.pl / speedscope."""
+    if not PROFILING:
+        return jsonify({'error': 'Not found', 'message': 'Profiling is disabled (PROFILING=false)'}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid request', 'message': 'seconds must be a number'}), 400
+    if not math.isfinite(seconds) or seconds <= 0:
+        return jsonify({'error': 'Invalid request', 'message': 'seconds must be a positive number'}), 400
+    sampler = profile_process(seconds)
+    if sampler is None:
+        return jsonify({'error': 'Conflict', 'message': 'A profile is already running in this worker'}), 409
+    logger.info(f"Profile: {sampler.samples} samples over {sampler.duration_ms}ms, {len(sampler.stacks)} stacks")
+    return Response(sampler.collapsed(), mimetype='text/plain', headers={
+        'X-Profile-Pid': str(os.getpid()),
+        'X-Profile-Samples': str(sampler.samples),
     })
 
 
@@ -571,15 +873,37 @@ def root():
     })
 
 
+def start_background_tasks():
+    """Start per-process background work: warm-up, health probes, load scraping.
+
+    Called once per server process — by main() for the single-process
+    server, and after each fork by the multi-worker server (src/server.py).
+    Connection pools are per process, so each one warms its own.
+    """
+    start_warmup()
+    start_health_prober()
+    LOAD_MONITOR.start()
+
+
 def main():
-    """Start the Flask application."""
+    """Start the Flask application.
+
+    WORKERS > 1 runs the pre-forked production server instead of the
+    Werkzeug server (see src/server.py).
+    """
     logger.info("Starting AI Router service...")
-    logger.info(f"Router model: {ROUTER_URL}")
-    logger.info(f"Primary model: {PRIMARY_URL}")
+    logger.info(f"Router model: {', '.join(ROUTER_POOL.urls)}")
+    logger.info(f"Primary model: {', '.join(PRIMARY_POOL.urls)}")
+
+    if WORKERS > 1:
+        from src.server import serve
+        serve(app)
+        return
 
+    start_background_tasks()
     app.run(
         host='0.0.0.0',
-        port=8002,
+        port=PORT,
         debug=False,
         threaded=True
     )
@@ -0,0 +1,306 @@
+"""Replica pools for the local vLLM backends (router model and primary)."""
+
+import bisect
+import hashlib
+import os
+import random
+import threading
+import time
+
+from src.config import (
+    logger,
+    ROUTER_URLS, PRIMARY_URLS,
+    HEALTH_PROBE_INTERVAL,
+    AFFINITY_MAX_OUTSTANDING,
+)
+from src.transport import HTTP
+from src.shared_state import SharedState, claim_leadership
+
+# Weight of the newest sample in the per-replica latency EWMA (time to
+# response headers, see Lease.observe_response)
+LATENCY_EWMA_ALPHA = 0.3
+# Consecutive request failures before a replica is marked unhealthy without
+# waiting for the next probe.  The prober marks it healthy again.
+FAILURE_THRESHOLD = 3
+# Points per replica on the affinity hash ring.  More points spread
+# conversations more evenly and move fewer of them when replicas change.
+RING_VNODES = 64
+
+
+def _ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+def _new_replica():
+    """Live load/latency/health state of one replica (JSON, shared by workers)."""
+    return {
+        'outstanding': {},     # worker pid -> requests in flight from that worker
+        'latency_ms': None,    # EWMA of observed time to response headers
+        'healthy': True,       # optimistic until the first probe says otherwise
+        'failures': 0,
+        'requests': 0,
+        'last_probe': None,
+    }
+
+
+def _outstanding(replica):
+    return sum(replica['outstanding'].values())
+
+
+def _score(replica, default_latency):
+    """Expected wait if one more request lands here (lower is better)."""
+    latency = replica['latency_ms'] if replica['latency_ms'] is not None else default_latency
+    return (_outstanding(replica) + 1) * latency
+
+
+class Lease:
+    """A claim on one replica for the duration of a single request.
+
+    Outstanding counts stay accurate only if every lease is released exactly
+    once — release() is idempotent so error paths can call it defensively.
+    """
+
+    def __init__(self, pool, url):
+        self.pool = pool
+        self.url = url
+        self.start = time.time()
+        self._observed = False
+        self._released = False
+
+    def observe(self, latency_ms=None, error=False):
+        """Record the replica's response latency/outcome (first call wins)."""
+        if self._observed:
+            return
+        self._observed = True
+        self.pool._record(self.url, latency_ms, error)
+
+    def observe_response(self, response):
+        """Record a response's time to headers and outcome (first call wins).
+
+        Every call site feeds the latency EWMA this one measure — streamed
+        or not — so replicas are compared on like numbers.
+        """
+        phases = getattr(response, 'phases', None) or {}
+        self.observe(phases.get('ttfb_ms'), error=response.status_code >= 500)
+
+    def release(self, latency_ms=None, error=False):
+        """Record the outcome (if not already observed) and free the slot."""
+        self.observe(latency_ms, error)
+        if self._released:
+            return
+        self._released = True
+        self.pool._release(self.url)
+
+
+class BackendPool:
+    """Least-outstanding-requests balancer over a set of replicas.
+
+    Each pick scores replicas by (outstanding + 1) × an EWMA of observed time
+    to response headers and takes the lowest, so a replica that is both busy
+    and slow is avoided while an idle slow replica still gets work.
+    Unhealthy replicas are skipped unless every replica is unhealthy, in
+    which case all are eligible — a stale probe result shouldn't take the
+    whole route down.
+
+    Requests that carry an affinity key (a conversation fingerprint) are
+    pinned to a replica by consistent hashing instead, so every turn of a
+    chat lands where its KV prefix is already cached.  The pin is abandoned
+    for least-loaded selection when that replica has AFFINITY_MAX_OUTSTANDING
+    requests in flight.
+
+    Replica state lives in a SharedState, so with several server workers
+    the outstanding counts, latency and health seen by each pick cover
+    requests from every worker.  Outstanding counts are kept per worker pid
+    so a crashed worker's leases can be dropped (forget_process).
+    """
+
+    def __init__(self, name, urls):
+        if not urls:
+            raise ValueError(f"Backend pool '{name}' needs at least one URL")
+        self.name = name
+        self.urls = list(dict.fromkeys(u.rstrip('/') for u in urls))
+        self._state = SharedState(f'pool-{name}', lambda: {
+            'replicas': {url: _new_replica() for url in self.urls},
+            'affinity': {'requests': 0, 'hits': 0, 'overflows': 0},
+        })
+        self._ring = sorted(
+            (_ring_hash(f"{url}#{i}"), url)
+            for url in self.urls
+            for i in range(RING_VNODES)
+        )
+        self._ring_keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _least_loaded(replicas):
+        candidates = {u: r for u, r in replicas.items() if r['healthy']} or replicas
+        known = [r['latency_ms'] for r in replicas.values() if r['latency_ms'] is not None]
+        default = min(known) if known else 1.0
+        scores = {u: _score(r, default) for u, r in candidates.items()}
+        best = min(scores.values())
+        # Random tie-break so equally idle replicas share cold traffic
+        return random.choice([u for u, s in scores.items() if s == best])
+
+    def _affinity_target(self, replicas, key):
+        """Walk the ring clockwise from the key to the first healthy replica."""
+        start = bisect.bisect(self._ring_keys, _ring_hash(key))
+        for i in range(len(self._ring)):
+            url = self._ring[(start + i) % len(self._ring)][1]
+            if replicas[url]['healthy']:
+                return url
+        return None
+
+    def acquire(self, affinity_key=None):
+        """Pick a replica and count the request against it.
+
+        Args:
+            affinity_key: Optional conversation fingerprint.  Ignored for
+                single-replica pools, where every pick is trivially a hit.
+        """
+        pid = str(os.getpid())
+
+        def _acquire(state):
+            replicas = state['replicas']
+            url = None
+            if affinity_key and len(self.urls) > 1:
+                affinity = state['affinity']
+                affinity['requests'] += 1
+                target = self._affinity_target(replicas, affinity_key)
+                if target is not None and _outstanding(replicas[target]) < AFFINITY_MAX_OUTSTANDING:
+                    url = target
+                    affinity['hits'] += 1
+                else:
+                    affinity['overflows'] += 1
+            if url is None:
+                url = self._least_loaded(replicas)
+            replica = replicas[url]
+            replica['outstanding'][pid] = replica['outstanding'].get(pid, 0) + 1
+            replica['requests'] += 1
+            return url
+
+        return Lease(self, self._state.update(_acquire))
+
+    def _release(self, url):
+        pid = str(os.getpid())
+
+        def _release(state):
+            outstanding = state['replicas'][url]['outstanding']
+            remaining = outstanding.get(pid, 0) - 1
+            if remaining > 0:
+                outstanding[pid] = remaining
+            else:
+                outstanding.pop(pid, None)
+
+        self._state.update(_release)
+
+    def _record(self, url, latency_ms, error):
+        def _record(state):
+            replica = state['replicas'][url]
+            if latency_ms is not None:
+                if replica['latency_ms'] is None:
+                    replica['latency_ms'] = latency_ms
+                else:
+                    replica['latency_ms'] += LATENCY_EWMA_ALPHA * (latency_ms - replica['latency_ms'])
+            if not error:
+                replica['failures'] = 0
+                return None
+            replica['failures'] += 1
+            if replica['failures'] >= FAILURE_THRESHOLD and replica['healthy']:
+                replica['healthy'] = False
+                return replica['failures']
+            return None
+
+        tripped = self._state.update(_record)
+        if tripped:
+            logger.warning(f"Backend {self.name} replica {url} marked unhealthy after {tripped} failures")
+
+    def probe(self, timeout=5):
+        """Check every replica's /health endpoint and update its state.
+
+        Returns True if at least one replica is healthy.
+        """
+        results = {}
+        for url in self.urls:
+            try:
+                results[url] = HTTP.get(f"{url}/health", timeout=timeout).status_code == 200
+            except Exception:
+                results[url] = False
+
+        def _apply(state):
+            changed = []
+            for url, ok in results.items():
+                replica = state['replicas'][url]
+                if ok != replica['healthy']:
+                    changed.append((url, ok))
+                replica['healthy'] = ok
+                replica['last_probe'] = time.time()
+                if ok:
+                    replica['failures'] = 0
+            return changed
+
+        for url, ok in self._state.update(_apply):
+            logger.info(f"Backend {self.name} replica {url} is now {'healthy' if ok else 'unhealthy'}")
+        return any(results.values())
+
+    def forget_process(self, pid):
+        """Drop the in-flight counts of a worker process that has exited."""
+        pid = str(pid)
+
+        def _forget(state):
+            for replica in state['replicas'].values():
+                replica['outstanding'].pop(pid, None)
+
+        self._state.update(_forget)
+
+    def snapshot(self):
+        replicas = self._state.read()['replicas']
+        return [
+            {
+                'url': url,
+                'healthy': r['healthy'],
+                'outstanding': _outstanding(r),
+                'latency_ms': round(r['latency_ms']) if r['latency_ms'] is not None else None,
+                'requests': r['requests'],
+                'failures': r['failures'],
+            }
+            for url, r in ((u, replicas[u]) for u in self.urls)
+        ]
+
+    def affinity_stats(self):
+        """Share of affinity-keyed picks that landed on the pinned replica."""
+        affinity = self._state.read()['affinity']
+        total = affinity['requests']
+        return {
+            'requests': total,
+            'hits': affinity['hits'],
+            'overflows': affinity['overflows'],
+            'hit_rate': round(affinity['hits'] / total, 3) if total else None,
+        }
+
+
+ROUTER_POOL = BackendPool('router', ROUTER_URLS)
+PRIMARY_POOL = BackendPool('primary', PRIMARY_URLS)
+POOLS = (ROUTER_POOL, PRIMARY_POOL)
+
+_prober = None
+
+
+def start_health_prober(interval=HEALTH_PROBE_INTERVAL):
+    """Probe every replica in the background so picks skip dead backends.
+
+    Each server worker runs the loop, but only the one holding the prober
+    lease sends probes — results land in the shared pool state.
+    """
+    global _prober
+    if _prober is not None or interval <= 0:
+        return
+
+    def _loop():
+        while True:
+            if claim_leadership('backend-prober', ttl=3 * interval):
+                for pool in POOLS:
+                    pool.probe()
+            time.sleep(interval)
+
+    _prober = threading.Thread(target=_loop, name='backend-prober', daemon=True)
+    _prober.start()
+    logger.info(f"Backend health prober started (interval={interval}s)")
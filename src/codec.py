@@ -0,0 +1,60 @@
+"""JSON encoding for the request path.
+
+Every chat request is decoded once by Flask and then encoded again for
+each outbound call — speculative primary, classification, fallback,
+hedges and retries — plus the session log and, with several workers,
+every shared-state update.  With conversations of tens of kilobytes,
+stdlib json is a measurable share of router overhead.  This module uses
+orjson when it is installed (several times faster in both directions) and
+falls back to the stdlib with the same compact output otherwise.
+
+Outbound bodies are encoded to bytes once with dumps() and sent with
+data=, so the same bytes can be reused rather than re-encoded by
+requests' json= on every attempt.
+"""
+
+import json
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional — stdlib json is used instead
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def dumps(obj, pretty=False, default=None) -> bytes:
+    """Encode obj as UTF-8 JSON bytes (compact unless pretty)."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, ensure_ascii=False,
+                      indent=2 if pretty else None,
+                      separators=None if pretty else (',', ':')).encode()
+
+
+def loads(data):
+    """Decode JSON from bytes or str.  Raises json.JSONDecodeError."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CodecJSONProvider(JSONProvider):
+    """Flask JSON provider backed by this module, so request.get_json()
+    and jsonify() use the fast codec too."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, default=kwargs.get('default')).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype='application/json')
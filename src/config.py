@@ -1,33 +1,86 @@
 """Configuration, environment variables, and prompt loading."""
 
+import json
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
-# Configure logging — writes to both stdout and a rotating file.
-# The file lives under LOG_DIR (default /var/log/ai-router/) so the
+from src.log_pipeline import LogPipeline
+
+# Configure logging — writes to stdout, a rotating file and (with LOG_JSON)
+# a rotating JSON-lines file, all from a background thread fed by a queue
+# (src/log_pipeline.py) so logging never adds to request latency.
+# The files live under LOG_DIR (default /var/log/ai-router/) so the
 # session-review agent can read application logs alongside session JSONs.
 LOG_DIR = os.getenv('LOG_DIR', '/var/log/ai-router')
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_JSON = os.getenv('LOG_JSON', 'true').lower() in ('1', 'true', 'yes')
 
 logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
 logger = logging.getLogger('ai_router')
 
-# Rotating file handler: 5 MB per file, keep 3 backups (≈20 MB max)
 os.makedirs(LOG_DIR, exist_ok=True)
-_file_handler = RotatingFileHandler(
-    os.path.join(LOG_DIR, 'app.log'),
-    maxBytes=5 * 1024 * 1024,
-    backupCount=3,
-)
-_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
-logger.addHandler(_file_handler)
+LogPipeline(LOG_DIR, LOG_FORMAT, json_lines=LOG_JSON).attach(logger)
 
 # Model endpoints
 ROUTER_URL = os.getenv('ROUTER_URL', 'http://router:8001')
 PRIMARY_URL = os.getenv('PRIMARY_URL', 'http://primary:8000')
+
+
+def _url_list(value, default):
+    """Parse a comma-separated URL list, falling back to a single URL."""
+    urls = [u.strip() for u in (value or '').split(',') if u.strip()]
+    return urls or [default]
+
+
+# Replica sets for the local backends (comma-separated).  When unset, each
+# pool is just the single ROUTER_URL / PRIMARY_URL.  See src/backends.py.
+ROUTER_URLS = _url_list(os.getenv('ROUTER_URLS'), ROUTER_URL)
+PRIMARY_URLS = _url_list(os.getenv('PRIMARY_URLS'), PRIMARY_URL)
+
+# Max pooled keep-alive connections per backend host in the shared outbound
+# session (src/transport.py).  ROUTER_URL/PRIMARY_URL (and the *_URLS lists)
+# also accept unix:///path/to/socket for vLLM servers started with --uds.
+OUTBOUND_POOL_MAXSIZE = int(os.getenv('OUTBOUND_POOL_MAXSIZE', '32'))
+
+# Seconds between background /health probes of every replica (0 disables)
+HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '10'))
+
+# Conversation affinity: with several replicas, turns of the same chat are
+# pinned to one replica (by consistent hash of the conversation fingerprint)
+# unless it already has this many requests in flight.  Matches the vLLM
+# --max-num-seqs default in infra/docker-compose.yml — beyond that, new
+# requests queue on the replica and load balancing wins over cache reuse.
+AFFINITY_MAX_OUTSTANDING = int(os.getenv('AFFINITY_MAX_OUTSTANDING', '3'))
+
+# Startup warm-up (src/warmup.py): each server process opens this many
+# pooled connections to every backend (and the xAI API) and sends one-token
+# priming requests carrying the routing and primary system prompts, so
+# vLLM's prefix cache already holds them when real traffic arrives.
+# /health reports 'warming' (503) until it finishes.  0 skips warm-up.
+WARMUP_CONNECTIONS = int(os.getenv('WARMUP_CONNECTIONS', '4'))
+
+# Production serving (src/server.py): with WORKERS > 1, main() runs gunicorn
+# with that many pre-forked worker processes, WORKER_THREADS request threads
+# each, instead of the single-process Werkzeug server.  Prompts and config
+# are loaded once in the master before forking.  SIGHUP to the master
+# reloads them and replaces the workers gracefully — in-flight requests
+# (including long enrich streams) get GRACEFUL_TIMEOUT seconds to finish.
+WORKERS = int(os.getenv('WORKERS', '1'))
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', '16'))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', '120'))
+
+# Port the router listens on, under either server.  Benchmarks that start
+# their own router (benchmarks/replay.py) move it off the production port.
+PORT = int(os.getenv('PORT', '8002'))
+
+# Directory for the mmap'd files workers share replica health, load samples,
+# counters and budgets through (src/shared_state.py).  Defaults to /dev/shm
+# (tmpfs, never hits disk) when WORKERS > 1; empty keeps state in-process.
+SHARED_STATE_DIR = os.getenv('SHARED_STATE_DIR', '/dev/shm/ai-router' if WORKERS > 1 else '')
+
+
 def read_secret(name, default=''):
     """Read a secret from a Docker secret file, falling back to env var.
 
@@ -50,7 +103,7 @@ def read_secret(name, default=''):
 
 XAI_API_KEY = read_secret('XAI_API_KEY')
 API_KEY = read_secret('API_KEY')
-XAI_API_URL = 'https://api.x.ai'  # Base URL without /v1
+XAI_API_URL = os.getenv('XAI_API_URL', 'https://api.x.ai')  # Base URL without /v1; overridable for stubs
 # Available models: grok-4-1-fast-non-reasoning, grok-4-1-fast-reasoning, grok-code-fast-1
 XAI_MODEL = os.getenv('XAI_MODEL', 'grok-4-1-fast-reasoning')
 ROUTER_MODEL = os.getenv('ROUTER_MODEL', 'cyankiwi/Nemotron-Orchestrator-8B-AWQ-4bit')
@@ -85,6 +138,151 @@ XAI_SEARCH_TOOLS = os.getenv('XAI_SEARCH_TOOLS', 'web_search,x_search')
 # default (often 100-300 from Open WebUI) truncates substantive answers.
 XAI_MIN_MAX_TOKENS = int(os.getenv('XAI_MIN_MAX_TOKENS', '16384'))
 
+# Per-route generation policies (src/generation.py), as JSON keyed by
+# simple, moderate, enrich, meta or xai.  Each policy may set:
+#   enable_thinking — false turns the primary's <think> phase off via
+#                     chat_template_kwargs (nano_v3_reasoning_parser.py
+#                     then returns the output as content)
+#   max_tokens      — a total token budget, reasoning included; caps the
+#                     client's max_tokens (xAI keeps XAI_MIN_MAX_TOKENS as
+#                     a floor).  With thinking on this can cut reasoning
+#                     off and leave content=null (see above) — prefer
+#                     enable_thinking
+#   temperature, top_p, top_k, min_p, presence_penalty,
+#   frequency_penalty, repetition_penalty — sampling defaults, used
+#                     when the client doesn't send its own
+# Meta-prompts (titles, tags, follow-up suggestions) don't benefit from
+# reasoning, so thinking is off for them by default.  The speculative
+# primary request carries the moderate policy; SIMPLE turns whose policy
+# differs re-send instead of reusing it.
+GENERATION_POLICIES = json.loads(os.getenv('GENERATION_POLICIES', '{"meta": {"enable_thinking": false}}'))
+
+# Load-aware overflow: the router scrapes each primary replica's vLLM
+# /metrics every LOAD_SCRAPE_INTERVAL seconds (0 disables).  When every
+# replica exceeds any of the thresholds below (0 disables a threshold),
+# SIMPLE/MODERATE requests skip speculation and go to xAI instead of
+# queueing — at most OVERFLOW_BUDGET_PER_HOUR times per rolling hour.
+# The budget defaults to 0 (overflow off) since every overflow is a paid
+# cloud call that also leaves the local network.
+LOAD_SCRAPE_INTERVAL = float(os.getenv('LOAD_SCRAPE_INTERVAL', '2'))
+OVERFLOW_MAX_WAITING = int(os.getenv('OVERFLOW_MAX_WAITING', '2'))
+OVERFLOW_MAX_RUNNING = int(os.getenv('OVERFLOW_MAX_RUNNING', '0'))
+OVERFLOW_MAX_KV_CACHE = float(os.getenv('OVERFLOW_MAX_KV_CACHE', '0.95'))
+OVERFLOW_BUDGET_PER_HOUR = int(os.getenv('OVERFLOW_BUDGET_PER_HOUR', '0'))
+
+# Speculative enrichment: when the latest user message matches
+# SPECULATIVE_ENRICH_PATTERN (case-insensitive; temporal and news words),
+# the xAI enrichment search starts alongside classification instead of
+# after it, hiding the classifier's latency behind the 11–26s search.  If
+# the route turns out not to be ENRICH the search result is discarded and
+# the call counts against SPECULATIVE_ENRICH_BUDGET_PER_DAY wasted calls
+# per rolling 24 hours; once that is spent, speculation pauses.  Defaults
+# to 0 (off) since every wasted call is paid.
+SPECULATIVE_ENRICH_BUDGET_PER_DAY = int(os.getenv('SPECULATIVE_ENRICH_BUDGET_PER_DAY', '0'))
+SPECULATIVE_ENRICH_PATTERN = os.getenv(
+    'SPECULATIVE_ENRICH_PATTERN',
+    r'\b(today|tonight|yesterday|tomorrow|this (morning|week|weekend|month|year)|right now|currently'
+    r'|latest|recent(ly)?|breaking|news|headlines?|weather|forecast|score|standings|stock|price'
+    r'|election|release date|just (announced|released))\b',
+)
+
+# Per-request deadlines (src/deadline.py): the time a client will wait for
+# an answer, split across classification, enrichment and inference.  A
+# client can set its own in the X-Request-Deadline header (seconds);
+# otherwise REQUEST_DEADLINE applies until the route is known and then
+# that route's entry in ROUTE_DEADLINES ("primary=120,enrich=180"), if
+# any.  Classification and enrichment only get what is left after
+# DEADLINE_INFERENCE_RESERVE seconds are set aside for the answer — when
+# that is too little they are skipped (default route, no enrichment)
+# rather than overrunning.
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '370'))
+ROUTE_DEADLINES = {
+    route.strip(): float(seconds)
+    for route, seconds in (item.split('=', 1) for item in os.getenv('ROUTE_DEADLINES', '').split(',') if '=' in item)
+}
+DEADLINE_INFERENCE_RESERVE = float(os.getenv('DEADLINE_INFERENCE_RESERVE', '10'))
+
+# Hedging and retries for classification and xAI calls (src/resilience.py).
+# HEDGE_PERCENTILES sets, per call kind, the percentile of recent latencies
+# after which an identical duplicate is sent and the first answer wins
+# (0 or absent disables).  Hedged enrichment and xAI calls are paid twice
+# (an enrichment hedge doubles the search cost), so only classification,
+# on the local router model, is hedged by default.  Connection errors and 429/502/503/504 are
+# retried up to RETRY_ATTEMPTS times with full-jitter exponential backoff
+# starting at RETRY_BACKOFF seconds, within the stage's deadline.
+HEDGE_PERCENTILES = {
+    kind.strip(): float(pct)
+    for kind, pct in (item.split('=', 1) for item in
+                      os.getenv('HEDGE_PERCENTILES', 'classification=95').split(',') if '=' in item)
+}
+RETRY_ATTEMPTS = int(os.getenv('RETRY_ATTEMPTS', '2'))
+RETRY_BACKOFF = float(os.getenv('RETRY_BACKOFF', '0.25'))
+
+# Streaming responses open immediately (src/sse.py): an SSE comment goes out
+# at once and every SSE_HEARTBEAT_INTERVAL seconds while classification,
+# enrichment and the backend connection are still pending, so proxies keep
+# the connection and clients see it is alive (0 disables — the stream then
+# starts when the backend's does).  SSE_PROGRESS_EVENTS additionally sends
+# each pipeline stage as an `event: progress` frame; off by default since
+# not every client tolerates named events.
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '5'))
+SSE_PROGRESS_EVENTS = os.getenv('SSE_PROGRESS_EVENTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Request tracing (src/tracing.py): each chat request records nested spans
+# for classification, speculation, enrichment, forwarding and every
+# outbound HTTP call, exported as OTLP/JSON.  'file' appends them to
+# LOG_DIR/traces.jsonl (`make trace SESSION=<id>` draws the waterfall); an
+# http(s) URL POSTs them to that OTLP/HTTP collector's /v1/traces; 'off'
+# disables tracing.
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', 'file')
+
+# On-demand CPU profiling (src/profiler.py).  With PROFILING on,
+# GET /debug/profile?seconds=N returns a collapsed-stack profile of every
+# thread in the worker (at most PROFILE_MAX_SECONDS), and a chat request
+# sent with X-Profile: 1 gets its own profile in its session log.  Both
+# need the API key when API_KEY is set.  Off: no sampler ever runs.
+PROFILING = os.getenv('PROFILING', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '60'))
+
+# Context budgets.  Each request is measured in tokens (src/tokens.py) —
+# exactly with a local tokenizer.json at TOKENIZER_PATH (needs the optional
+# `tokenizers` package), otherwise with a chars-per-token estimate that is
+# calibrated from the prompt_tokens the primary reports.  A conversation
+# that would not fit the primary's window (vLLM --max-model-len, minus
+# CONTEXT_RESERVE_TOKENS held back for reasoning + answer) is handled per
+# CONTEXT_OVERFLOW_POLICY:
+#   trim — drop the oldest turns, keeping system messages and the latest
+#          user turn; fall back to xAI if even that doesn't fit
+#   xai  — send it to xAI's larger window unchanged
+TOKENIZER_PATH = os.getenv('TOKENIZER_PATH', '')
+PRIMARY_CONTEXT_TOKENS = int(os.getenv('PRIMARY_CONTEXT_TOKENS', '32768'))
+XAI_CONTEXT_TOKENS = int(os.getenv('XAI_CONTEXT_TOKENS', '2000000'))
+CONTEXT_RESERVE_TOKENS = int(os.getenv('CONTEXT_RESERVE_TOKENS', '4096'))
+CONTEXT_OVERFLOW_POLICY = os.getenv('CONTEXT_OVERFLOW_POLICY', 'trim')
+
+# Conversation context sent to the routing classifier, in tokens: the
+# newest prior messages verbatim, then one-line digests of older ones
+# (src/conversation.py).  Keeps classification prefill flat as chats grow
+# instead of linear in their length.  0 sends the whole conversation.
+CLASSIFIER_CONTEXT_TOKENS = int(os.getenv('CLASSIFIER_CONTEXT_TOKENS', '2048'))
+
+# Route stickiness (src/conversation.py): a short follow-up turn ("and
+# tomorrow?", "explain more") reuses the route classified for the previous
+# turn of the same conversation instead of waiting on the classifier.  A
+# follow-up is a final user message of at most ROUTE_STICKY_MAX_CHARS (0
+# disables stickiness) matching ROUTE_STICKY_PATTERN (case-insensitive).
+# Remembered routes expire after ROUTE_STICKY_TTL seconds.  A sample of
+# reused decisions (ROUTE_STICKY_AUDIT_RATE) is re-classified in the
+# background and disagreements are counted as drift in /stats.
+ROUTE_STICKY_MAX_CHARS = int(os.getenv('ROUTE_STICKY_MAX_CHARS', '80'))
+ROUTE_STICKY_PATTERN = os.getenv(
+    'ROUTE_STICKY_PATTERN',
+    r'^(and|but|also|so|what about|how about|why|how come|explain|elaborate|continue|go on|more|tell me more)\b',
+)
+ROUTE_STICKY_TTL = float(os.getenv('ROUTE_STICKY_TTL', '1800'))
+ROUTE_STICKY_AUDIT_RATE = float(os.getenv('ROUTE_STICKY_AUDIT_RATE', '0.1'))
+
 # Timezone configuration (defaults to US Pacific / Happy Valley, OR)
 LOCAL_TZ = ZoneInfo(os.getenv('TZ', 'America/Los_Angeles'))
 
@@ -94,7 +292,26 @@ def now():
     return datetime.now(LOCAL_TZ)
 
 
-def date_context():
+# Resolution of the clock time in date_context():
+#   minute — "8:42 PM PST" (default)
+#   hour   — "8 PM PST"
+#   day    — date, weekday/weekend and season only, no time of day
+# Coarser values keep the temporal context byte-identical for longer, which
+# matters when PROMPT_LAYOUT=legacy puts it at the head of every prompt.
+DATE_CONTEXT_GRANULARITY = os.getenv('DATE_CONTEXT_GRANULARITY', 'minute')
+
+# Where temporal context goes in prompts sent to the local vLLM backends:
+#   stable — static system prompts and the client conversation come first,
+#            byte-identical across requests; temporal context is appended
+#            to the final user message.  Lets vLLM automatic prefix caching
+#            reuse the KV cache for the system prompt and prior turns.
+#   legacy — temporal context leads the system prompt.  The prefix changes
+#            whenever the rendered time does, so prefix caching only helps
+#            within that window.
+PROMPT_LAYOUT = os.getenv('PROMPT_LAYOUT', 'stable')
+
+
+def date_context(granularity=None):
     """
     Build a rich temporal context string from the current local time.
     Injected into system messages so models can reason about "today",
@@ -103,7 +320,12 @@ def date_context():
     Example output:
       Today is Saturday, February 15, 2026. It is evening (8:42 PM PST).
       It is a weekend. The current season is winter.
+
+    Args:
+        granularity: 'minute', 'hour' or 'day' (defaults to
+            DATE_CONTEXT_GRANULARITY).
     """
+    granularity = granularity or DATE_CONTEXT_GRANULARITY
     t = now()
 
     # Day type
@@ -138,7 +360,17 @@ def date_context():
     tz_abbr = t.strftime('%Z')
 
     date_str = t.strftime('%A, %B %d, %Y')          # Saturday, February 15, 2026
-    time_str = t.strftime('%-I:%M %p')               # 8:42 PM
+
+    if granularity == 'day':
+        return (
+            f"Today is {date_str}. "
+            f"It is a {day_type}. The current season is {season}."
+        )
+
+    if granularity == 'hour':
+        time_str = t.strftime('%-I %p')              # 8 PM
+    else:
+        time_str = t.strftime('%-I:%M %p')           # 8:42 PM
 
     return (
         f"Today is {date_str}. It is {period} ({time_str} {tz_abbr}). "
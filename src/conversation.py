@@ -0,0 +1,259 @@
+"""Per-conversation state: fingerprints, classifier context, route memory."""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from src.config import (
+    CLASSIFIER_CONTEXT_TOKENS,
+    ROUTE_STICKY_MAX_CHARS, ROUTE_STICKY_PATTERN, ROUTE_STICKY_TTL,
+)
+from src.tokens import TOKENS, content_text
+from src.shared_state import SharedState
+
+
+def _digest(parts) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        h.update(part.encode('utf-8', errors='replace'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def conversation_fingerprint(messages: list) -> str:
+    """Identify a chat by the messages every one of its turns starts with.
+
+    Clients resend the whole history on each turn, so the first system
+    message (if any) and the first user message are identical across all
+    turns of one conversation while differing between conversations.
+    Returns None when there is no user message to key on.
+    """
+    first_system = next((m for m in messages if m.get('role') == 'system'), None)
+    first_user = next((m for m in messages if m.get('role') == 'user'), None)
+    if first_user is None:
+        return None
+    parts = [str(first_user.get('content', ''))]
+    if first_system is not None:
+        parts.insert(0, str(first_system.get('content', '')))
+    return _digest(parts)
+
+
+# Characters of an older message kept as its one-line digest
+DIGEST_CHARS = 200
+# Per-message lines kept across requests (one entry per message per chat)
+CONTEXT_CACHE_SIZE = 8192
+CONTEXT_HEADER = "Recent conversation context (for resolving references):\n"
+
+# Reasoning blocks some clients fold into assistant replies
+_DETAILS_RE = re.compile(r'<details[^>]*>.*?</details>\s*', flags=re.DOTALL)
+
+
+def _digest_line(role, text):
+    if len(text) <= DIGEST_CHARS:
+        return f"{role}: {text}"
+    return f"{role}: {text[:DIGEST_CHARS].rsplit(' ', 1)[0]}…"
+
+
+class ClassifierContext:
+    """Bounded conversation context for the routing classifier.
+
+    The classifier only needs enough history to resolve references like
+    "that school" or "it", so instead of the whole conversation it gets the
+    newest prior messages verbatim and one-line digests of older ones, up
+    to budget_tokens (0 = everything verbatim).
+
+    Both renderings of each message are cached under a running hash of the
+    conversation up to and including it.  Clients resend the full history
+    every turn, so a turn only strips and renders the messages added since
+    the previous one — the rest is a hash walk and cache lookups.  The cache
+    is per worker: it only saves work, and every worker renders the same
+    context from the same messages.
+    """
+
+    def __init__(self, budget_tokens, max_entries=CONTEXT_CACHE_SIZE):
+        self.budget_tokens = budget_tokens
+        self.max_entries = max_entries
+        self._lines = OrderedDict()   # prefix hash -> (full line, digest line)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _render(self, prior):
+        prefix = hashlib.blake2b(digest_size=16)
+        rendered = []
+        for m in prior:
+            role = m.get('role', 'unknown')
+            text = content_text(m.get('content'))
+            prefix.update(role.encode())
+            prefix.update(b'\x00')
+            prefix.update(text.encode('utf-8', errors='replace'))
+            prefix.update(b'\x01')
+            key = prefix.digest()
+            with self._lock:
+                lines = self._lines.get(key)
+                if lines is not None:
+                    self._lines.move_to_end(key)
+                    self.hits += 1
+            if lines is None:
+                # Strip <details> reasoning so the classifier sees the
+                # actual answer, not internal chain-of-thought
+                text = _DETAILS_RE.sub('', text).strip()
+                lines = (f"{role}: {text}", _digest_line(role, text))
+                with self._lock:
+                    self._lines[key] = lines
+                    self.misses += 1
+                    if len(self._lines) > self.max_entries:
+                        self._lines.popitem(last=False)
+            rendered.append(lines)
+        return rendered
+
+    def build(self, prior: list) -> str:
+        """Render the context prefix for the messages before the query.
+
+        Returns '' when there is no prior conversation.
+        """
+        if not prior:
+            return ''
+        rendered = self._render(prior)
+        if not self.budget_tokens:
+            return CONTEXT_HEADER + "\n".join(full for full, _ in rendered) + "\n\n"
+
+        remaining = self.budget_tokens
+        # A quarter of the budget is kept for digests, so one long recent
+        # reply can't crowd out the rest of the conversation
+        digest_share = self.budget_tokens // 4
+        body = []
+        i = len(rendered)
+        # Newest messages verbatim while they fit...
+        while i > 0:
+            cost = TOKENS.count_text(rendered[i - 1][0]) + 1
+            if cost > remaining - digest_share:
+                break
+            body.append(rendered[i - 1][0])
+            remaining -= cost
+            i -= 1
+        # ...then digests of older ones
+        while i > 0:
+            cost = TOKENS.count_text(rendered[i - 1][1]) + 1
+            if cost > remaining:
+                break
+            body.append(rendered[i - 1][1])
+            remaining -= cost
+            i -= 1
+        if i:
+            body.append(f"({i} earlier messages omitted)")
+        body.reverse()
+        return CONTEXT_HEADER + "\n".join(body) + "\n\n"
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'budget_tokens': self.budget_tokens,
+                'cached_lines': len(self._lines),
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+
+CLASSIFIER_CONTEXT = ClassifierContext(CLASSIFIER_CONTEXT_TOKENS)
+
+
+# Conversations whose last route is remembered
+ROUTE_MEMORY_SIZE = 4096
+# Shared documents the remembered routes are spread over, so each
+# remember/recall re-encodes a small one rather than all of them
+ROUTE_MEMORY_SHARDS = 16
+
+
+def prefix_key(messages: list) -> str:
+    """Identify a conversation prefix by every message in it."""
+    return _digest(f"{m.get('role', '')}\x01{content_text(m.get('content'))}" for m in messages)
+
+
+class RouteMemory:
+    """Last classified route per conversation, reused for short follow-ups.
+
+    A turn's route is remembered under the hash of the conversation up to
+    and including its user message.  On the next turn that prefix is
+    everything before the assistant's reply, so the lookup is independent
+    of the reply text.  Routes and the reuse and audit counters are shared
+    across workers, so a follow-up reuses its route whichever worker
+    serves it.
+    """
+
+    def __init__(self, max_chars, pattern, ttl, max_entries=ROUTE_MEMORY_SIZE, shards=ROUTE_MEMORY_SHARDS):
+        self.max_chars = max_chars
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._shard_entries = max(1, max_entries // shards)
+        # prefix key -> [route, decision, at], oldest first
+        self._shards = [SharedState(f'route-memory-{i}') for i in range(shards)]
+        self._stats = SharedState('route-memory', lambda: {
+            'reused': 0, 'audited': 0, 'agreed': 0, 'drift': {},
+        })
+
+    def is_follow_up(self, query) -> bool:
+        query = query.strip() if isinstance(query, str) else ''
+        return 0 < len(query) <= self.max_chars and bool(self.pattern.search(query))
+
+    def _shard(self, key) -> SharedState:
+        return self._shards[int(key[:4], 16) % len(self._shards)]
+
+    def remember(self, messages: list, route: str, decision: str) -> None:
+        if not self.max_chars or not messages or messages[-1].get('role') != 'user':
+            return
+        key = prefix_key(messages)
+        entry = [route, decision, time.time()]
+
+        def _remember(routes):
+            routes.pop(key, None)
+            routes[key] = entry
+            while len(routes) > self._shard_entries:
+                del routes[next(iter(routes))]
+
+        self._shard(key).update(_remember)
+
+    def recall(self, messages: list):
+        """Return (route, decision) from the previous turn if this turn is a
+        follow-up that may reuse it, else None."""
+        if not self.max_chars or len(messages) < 3 or messages[-1].get('role') != 'user':
+            return None
+        if not self.is_follow_up(messages[-1].get('content')):
+            return None
+        previous_user = next((i for i in range(len(messages) - 2, -1, -1)
+                              if messages[i].get('role') == 'user'), None)
+        if previous_user is None:
+            return None
+        key = prefix_key(messages[:previous_user + 1])
+        entry = self._shard(key).read().get(key)
+        if entry is None or time.time() - entry[2] > self.ttl:
+            return None
+
+        def _reused(s):
+            s['reused'] += 1
+
+        self._stats.update(_reused)
+        return entry[0], entry[1]
+
+    def record_audit(self, reused_route: str, classified_route: str) -> None:
+        def _record(s):
+            s['audited'] += 1
+            if reused_route == classified_route:
+                s['agreed'] += 1
+            else:
+                pair = f"{reused_route}->{classified_route}"
+                s['drift'][pair] = s['drift'].get(pair, 0) + 1
+
+        self._stats.update(_record)
+
+    def stats(self):
+        s = self._stats.read()
+        s['remembered'] = sum(len(shard.read()) for shard in self._shards)
+        s['drift_rate'] = round(1 - s['agreed'] / s['audited'], 3) if s['audited'] else None
+        return s
+
+
+ROUTE_MEMORY = RouteMemory(ROUTE_STICKY_MAX_CHARS, ROUTE_STICKY_PATTERN, ROUTE_STICKY_TTL)
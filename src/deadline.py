@@ -0,0 +1,120 @@
+"""Per-request deadlines split across the pipeline stages.
+
+Each outbound call used to carry its own fixed timeout — 10s to classify,
+60s to enrich, 300s to generate — regardless of how long the client would
+actually wait.  A Deadline is created per request (from the
+X-Request-Deadline header, or REQUEST_DEADLINE / ROUTE_DEADLINES) and every
+stage asks it for a timeout: the stage's usual cap, cut down to what is
+left of the deadline.  Classification and enrichment also leave
+DEADLINE_INFERENCE_RESERVE seconds for the answer.  A stage that couldn't
+do useful work in what remains is skipped, and the request degrades —
+default route, no enrichment context, or a 504 instead of a generation
+the client has already given up on.
+
+Skipped stages and stage timeouts are counted per stage in /stats and
+listed in the session log.
+
+requests' timeout bounds the connect and each socket read, not the whole
+call, so a streamed answer is bounded on time to first byte and on gaps
+between chunks rather than on total stream length.
+"""
+
+import time
+
+from src.config import (
+    logger,
+    REQUEST_DEADLINE, ROUTE_DEADLINES, DEADLINE_INFERENCE_RESERVE,
+)
+from src.shared_state import SharedState
+
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+# The fixed timeouts each stage had before deadlines — still the cap
+STAGE_TIMEOUTS = {
+    'classification': 10,
+    'enrichment': 60,
+    'inference': 300,
+}
+# Below this, starting the stage isn't worth it: the classifier needs
+# ~1s, an xAI search several seconds
+STAGE_MINIMUMS = {
+    'classification': 0.5,
+    'enrichment': 3,
+    'inference': 1,
+}
+
+_MISSES = SharedState('deadline-misses')
+
+
+class Deadline:
+    """The time left to answer one request."""
+
+    def __init__(self, seconds, source):
+        self.start = time.time()
+        self.seconds = seconds
+        self.source = source
+        # Shared with the session log (session.data['deadline'])
+        self.record = {'seconds': seconds, 'source': source, 'misses': []}
+
+    @classmethod
+    def from_header(cls, value):
+        """The client's deadline if the header holds a positive number of
+        seconds, otherwise REQUEST_DEADLINE."""
+        if value:
+            try:
+                seconds = float(value)
+                if seconds > 0:
+                    return cls(seconds, 'header')
+            except ValueError:
+                pass
+            logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {value!r}")
+        return cls(REQUEST_DEADLINE, 'default')
+
+    def set_route(self, route):
+        """Switch to the route's own deadline once classification is done.
+
+        A client-supplied deadline always wins.
+        """
+        if self.source != 'header' and route in ROUTE_DEADLINES:
+            self.seconds = ROUTE_DEADLINES[route]
+            self.source = f'route:{route}'
+            self.record.update(seconds=self.seconds, source=self.source)
+
+    def remaining(self):
+        return self.start + self.seconds - time.time()
+
+    def timeout(self, stage):
+        """Seconds the stage may take, or None if it should be skipped."""
+        available = self.remaining()
+        if stage != 'inference':
+            available -= DEADLINE_INFERENCE_RESERVE
+        seconds = min(STAGE_TIMEOUTS[stage], available)
+        return seconds if seconds >= STAGE_MINIMUMS[stage] else None
+
+    def miss(self, stage, kind):
+        """Record that a stage was skipped ('skipped') or ran out of time
+        ('timeout')."""
+        remaining = self.remaining()
+        self.record['misses'].append({'stage': stage, 'kind': kind, 'remaining_s': round(remaining, 2)})
+        logger.warning(f"DEADLINE stage={stage} kind={kind} remaining_s={remaining:.1f}"
+                       f" deadline_s={self.seconds:g} source={self.source}")
+
+        def _count(misses):
+            counts = misses.setdefault(stage, {'skipped': 0, 'timeout': 0})
+            counts[kind] += 1
+
+        _MISSES.update(_count)
+
+
+def stage_timeout(deadline, stage):
+    """Timeout for a stage, for callers that may not have a deadline."""
+    return STAGE_TIMEOUTS[stage] if deadline is None else deadline.timeout(stage)
+
+
+def deadline_stats():
+    return {
+        'default_s': REQUEST_DEADLINE,
+        'routes_s': ROUTE_DEADLINES,
+        'inference_reserve_s': DEADLINE_INFERENCE_RESERVE,
+        'misses': _MISSES.read(),
+    }
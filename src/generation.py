@@ -0,0 +1,65 @@
+"""Per-route generation policies: reasoning on/off, token budget, sampling.
+
+The primary is a reasoning model, and by default every request it serves
+thinks at full length — including meta-prompts (a chat title) and SIMPLE
+questions where the <think> phase is most of the latency.  A policy from
+GENERATION_POLICIES is applied to the outbound request body just before
+it is sent, keyed by what the request turned out to be:
+
+  simple, moderate  — primary route, by classification decision
+  enrich, meta, xai — the other routes
+
+Policies only ever add to the body: client-supplied sampling parameters
+win, a policy max_tokens caps the client's (and never lowers an xAI
+request below XAI_MIN_MAX_TOKENS), and requests with no policy are sent
+unchanged.
+"""
+
+from src.config import logger, GENERATION_POLICIES, XAI_MIN_MAX_TOKENS
+
+# Policy keys sent as request parameters when the client didn't set them
+SAMPLING_PARAMS = ('temperature', 'top_p', 'top_k', 'min_p',
+                   'presence_penalty', 'frequency_penalty', 'repetition_penalty')
+POLICY_NAMES = ('simple', 'moderate', 'enrich', 'meta', 'xai')
+
+
+def _check_policies():
+    for name, policy in GENERATION_POLICIES.items():
+        unknown = set(policy) - set(SAMPLING_PARAMS) - {'enable_thinking', 'max_tokens'}
+        if name not in POLICY_NAMES:
+            logger.warning(f"GENERATION_POLICIES: unknown policy '{name}' is never applied")
+        elif unknown:
+            logger.warning(f"GENERATION_POLICIES: {name} keys {sorted(unknown)} are ignored")
+
+
+_check_policies()
+
+
+def policy_name(route: str, decision: str = None) -> str:
+    """Policy key for a route; primary splits on the classifier's decision."""
+    if route == 'primary':
+        return 'simple' if decision and 'SIMPLE' in decision else 'moderate'
+    return route
+
+
+def policy_for(name: str) -> dict:
+    return GENERATION_POLICIES.get(name, {})
+
+
+def apply_policy(data: dict, name: str) -> None:
+    """Apply a generation policy to an outbound request body in place."""
+    policy = policy_for(name)
+    if not policy:
+        return
+    for key in SAMPLING_PARAMS:
+        if key in policy:
+            data.setdefault(key, policy[key])
+    if 'max_tokens' in policy:
+        client_max = data.get('max_tokens')
+        data['max_tokens'] = min(client_max, policy['max_tokens']) if client_max else policy['max_tokens']
+        if name == 'xai':
+            data['max_tokens'] = max(data['max_tokens'], XAI_MIN_MAX_TOKENS)
+    # chat_template_kwargs only means something to the local vLLM models
+    if 'enable_thinking' in policy and name != 'xai':
+        data['chat_template_kwargs'] = {**data.get('chat_template_kwargs', {}),
+                                        'enable_thinking': policy['enable_thinking']}
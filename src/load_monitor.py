@@ -0,0 +1,127 @@
+"""Primary backend load scraping and overflow-to-xAI budget."""
+
+import threading
+import time
+
+from src.config import (
+    logger,
+    LOAD_SCRAPE_INTERVAL,
+    OVERFLOW_MAX_WAITING, OVERFLOW_MAX_RUNNING, OVERFLOW_MAX_KV_CACHE,
+    OVERFLOW_BUDGET_PER_HOUR,
+)
+from src.backends import PRIMARY_POOL
+from src.transport import HTTP
+from src.shared_state import SharedState, RollingBudget, claim_leadership
+
+# vLLM Prometheus gauges.  The KV cache gauge was renamed in the V1 engine;
+# whichever one the server exports is used.
+RUNNING_METRIC = 'vllm:num_requests_running'
+WAITING_METRIC = 'vllm:num_requests_waiting'
+KV_CACHE_METRICS = ('vllm:kv_cache_usage_perc', 'vllm:gpu_cache_usage_perc')
+
+
+def parse_vllm_metrics(text: str) -> dict:
+    """Extract the queue/KV gauges from a Prometheus text exposition.
+
+    Samples with different label sets (e.g. one per model name) are summed
+    for the request counts and max'd for KV cache usage.
+    """
+    running = waiting = 0.0
+    kv_cache = None
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name_part, _, value = line.rpartition(' ')
+        name = name_part.split('{', 1)[0]
+        try:
+            v = float(value)
+        except ValueError:
+            continue
+        if name == RUNNING_METRIC:
+            running += v
+        elif name == WAITING_METRIC:
+            waiting += v
+        elif name in KV_CACHE_METRICS:
+            kv_cache = v if kv_cache is None else max(kv_cache, v)
+    return {'running': running, 'waiting': waiting, 'kv_cache': kv_cache}
+
+
+class LoadMonitor:
+    """Background scraper of every primary replica's vLLM /metrics.
+
+    Samples are kept in shared state: one worker scrapes (whichever holds
+    the lease) and every worker's saturation() check sees the result.
+    """
+
+    def __init__(self, pool, interval):
+        self.pool = pool
+        self.interval = interval
+        self._samples = SharedState(f'load-{pool.name}')   # url -> metrics dict + 'at' timestamp
+        self._thread = None
+
+    def scrape(self):
+        fresh = {}
+        for url in self.pool.urls:
+            try:
+                response = HTTP.get(f"{url}/metrics", timeout=2)
+                if response.status_code != 200:
+                    continue
+                sample = parse_vllm_metrics(response.text)
+            except Exception:
+                continue
+            sample['at'] = time.time()
+            fresh[url] = sample
+        self._samples.update(lambda samples: samples.update(fresh))
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+
+        def _loop():
+            while True:
+                if claim_leadership('load-monitor', ttl=3 * self.interval):
+                    self.scrape()
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=_loop, name='load-monitor', daemon=True)
+        self._thread.start()
+        logger.info(f"Primary load monitor started (interval={self.interval}s)")
+
+    def snapshot(self):
+        return self._samples.read()
+
+    def saturation(self):
+        """Return the least-loaded replica's metrics if every replica is saturated.
+
+        A replica counts as saturated when any configured threshold is
+        exceeded.  The pool can still route around one busy replica, so
+        overflow is only worth it when none has headroom.  Samples older than
+        three scrape intervals are treated as unknown (not saturated).
+        Returns None when at least one replica has headroom.
+        """
+        if self.interval <= 0:
+            return None
+        stale = time.time() - 3 * self.interval
+        samples = self.snapshot()
+        least_loaded = None
+        for url in self.pool.urls:
+            s = samples.get(url)
+            if s is None or s['at'] < stale:
+                return None
+            reasons = []
+            if OVERFLOW_MAX_WAITING and s['waiting'] >= OVERFLOW_MAX_WAITING:
+                reasons.append(f"waiting={s['waiting']:.0f}")
+            if OVERFLOW_MAX_RUNNING and s['running'] >= OVERFLOW_MAX_RUNNING:
+                reasons.append(f"running={s['running']:.0f}")
+            if (OVERFLOW_MAX_KV_CACHE and s['kv_cache'] is not None
+                    and s['kv_cache'] >= OVERFLOW_MAX_KV_CACHE):
+                reasons.append(f"kv_cache={s['kv_cache']:.2f}")
+            if not reasons:
+                return None
+            if least_loaded is None or s['waiting'] < least_loaded['waiting']:
+                least_loaded = {'url': url, 'reasons': reasons, **s}
+        return least_loaded
+
+
+LOAD_MONITOR = LoadMonitor(PRIMARY_POOL, LOAD_SCRAPE_INTERVAL)
+OVERFLOW_BUDGET = RollingBudget('overflow-budget', OVERFLOW_BUDGET_PER_HOUR)
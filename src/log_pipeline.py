@@ -0,0 +1,127 @@
+"""Queue-backed logging: request threads never format or write log output.
+
+Handlers attached straight to the logger run on the calling thread, so
+every hot-path log line (classification, provider response, REQUEST
+summary, session saved) used to format its record and write it to stdout
+and app.log before the request could continue — including the occasional
+inline rotation of app.log.  LogPipeline puts a QueueHandler on the logger
+instead; a QueueListener thread drains the queue into the real handlers:
+
+  stderr     — the human format (what `docker logs` shows)
+  app.log    — the same human format, rotated
+  app.jsonl  — one JSON object per record, rotated (LOG_JSON)
+
+Records can carry structured key/value fields, which appear as top-level
+keys in app.jsonl:
+
+    logger.info(f"REQUEST session={sid} route={route}", extra=fields(session=sid, route=route))
+
+A fork only copies the calling thread, so each gunicorn worker starts its
+own queue and listener after the fork.
+"""
+
+import logging
+import os
+import queue
+import sys
+import weakref
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from src.codec import dumps
+
+# 5 MB per file, keep 3 backups (≈20 MB per log)
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+
+def fields(**kwargs) -> dict:
+    """extra= for a log call carrying structured fields."""
+    return {'fields': kwargs}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record: time, level, message, fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return dumps(entry, default=str).decode()
+
+
+class _PipelineHandler(QueueHandler):
+    """The logger's only handler; closing it stops the listener, flushing
+    whatever is still queued (on exit, or when src.config is re-imported)."""
+
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self._pipeline = pipeline
+
+    def close(self):
+        self._pipeline.stop()
+        super().close()
+
+
+class LogPipeline:
+    """Route a logger's records through a queue to its output handlers."""
+
+    def __init__(self, log_dir, fmt, json_lines=True):
+        self.handlers = [logging.StreamHandler(sys.stderr), _rotating(os.path.join(log_dir, 'app.log'))]
+        for handler in self.handlers:
+            handler.setFormatter(logging.Formatter(fmt))
+        if json_lines:
+            handler = _rotating(os.path.join(log_dir, 'app.jsonl'))
+            handler.setFormatter(JsonLinesFormatter())
+            self.handlers.append(handler)
+        self.queue = None
+        self.listener = None
+        self._start()
+        self.handler = _PipelineHandler(self)
+        # Fork callbacks can't be unregistered; don't keep a replaced
+        # pipeline alive just for them
+        ref = weakref.ref(self)
+
+        def _restart():
+            pipeline = ref()
+            if pipeline is not None:
+                pipeline._after_fork()
+
+        os.register_at_fork(after_in_child=_restart)
+
+    def _start(self):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self):
+        if self.listener is None:
+            return
+        # The parent's listener thread doesn't exist here, and records it
+        # had not yet written stay with the parent
+        self._start()
+        self.handler.queue = self.queue
+
+    def attach(self, logger):
+        """Make the pipeline the logger's only output."""
+        logger.addHandler(self.handler)
+        # Root's stderr handler would write on the calling thread again
+        logger.propagate = False
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            for handler in self.handlers:
+                handler.close()
+
+
+def _rotating(path):
+    return RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
@@ -0,0 +1,186 @@
+"""On-demand sampling CPU profiles of the live router process.
+
+Two ways in, both only with PROFILING on (and, like every non-public
+endpoint, behind API_KEY):
+
+  GET /debug/profile?seconds=10   samples every thread of the worker that
+                                  serves it for that long and returns the
+                                  stacks in collapsed format
+  X-Profile: 1                    on a chat request, samples only the
+                                  threads working on that request and adds
+                                  the stacks to its session log (`profile`)
+
+Collapsed format is one line per distinct stack, root first, with its
+sample count — what flamegraph.pl, speedscope and inferno read:
+
+    Thread-3;src.app:chat_completions;src.app:_chat_completions;src.providers:determine_route 12
+
+A sampler thread wakes every PROFILE_INTERVAL_MS and walks the frames of
+the threads it watches (sys._current_frames()).  Samples are wall-clock:
+a thread blocked on a socket or a lock is counted in the frame it waits
+in, which is what makes the router's own waits visible next to its CPU.
+It only exists while a profile is running; with PROFILING off nothing is
+started and a request pays one header lookup.  Under gunicorn each worker is profiled on its
+own — the X-Profile-Pid response header says which one answered.
+"""
+
+import contextvars
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from src.config import logger, PROFILING, PROFILE_INTERVAL_MS, PROFILE_MAX_SECONDS
+
+PROFILE_HEADER = 'X-Profile'
+
+_current = contextvars.ContextVar('profile', default=None)
+# One process-wide profile at a time: two samplers would skew each other
+_live_lock = threading.Lock()
+_labels = {}
+# Pool threads are told apart by a trailing _<n>; one flame per pool reads better
+_THREAD_SUFFIX = re.compile(r'_\d+$')
+
+
+def _label(code, module):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{module}:{code.co_qualname}"
+    return label
+
+
+def collapse(frame) -> str:
+    """A frame's stack, root first, as ;-separated module:function names."""
+    names = []
+    while frame is not None:
+        names.append(_label(frame.f_code, frame.f_globals.get('__name__', '?')))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Counts the stacks of a set of threads (None: all) at a fixed interval."""
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS, threads=None):
+        self.interval = interval_ms / 1000
+        self.threads = threads
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = None
+        self.duration_ms = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration_ms = round((time.time() - self.started) * 1000)
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: _THREAD_SUFFIX.sub('', t.name) for t in threading.enumerate()}
+            watched = self.threads
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (watched is not None and ident not in watched):
+                    continue
+                self.stacks[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The stacks in collapsed format, most sampled first."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_process(seconds) -> Sampler:
+    """Sample every thread of this process for `seconds` (capped at
+    PROFILE_MAX_SECONDS).  Returns None if a profile is already running."""
+    if not _live_lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = Sampler().start()
+        time.sleep(min(seconds, PROFILE_MAX_SECONDS))
+        return sampler.stop()
+    finally:
+        _live_lock.release()
+
+
+class RequestProfile:
+    """A sampler following the threads that work on one request."""
+
+    def __init__(self, session):
+        self.session = session
+        self._threads = Counter()
+        self.sampler = Sampler(threads=self._threads)
+        self._finished = False
+
+    @contextmanager
+    def thread(self):
+        """Sample the calling thread while the block runs."""
+        ident = threading.get_ident()
+        self._threads[ident] += 1
+        try:
+            yield
+        finally:
+            self._threads[ident] -= 1
+            if not self._threads[ident]:
+                del self._threads[ident]
+
+    def finish(self):
+        """Stop sampling and add the stacks to the session log (saved again)."""
+        if self._finished:
+            return
+        self._finished = True
+        self.sampler.stop()
+        self.session.data['profile'] = {
+            'interval_ms': PROFILE_INTERVAL_MS,
+            'samples': self.sampler.samples,
+            'duration_ms': self.sampler.duration_ms,
+            'stacks': dict(self.sampler.stacks.most_common()),
+        }
+        logger.info(f"Request profile: session={self.session.id} samples={self.sampler.samples}"
+                    f" stacks={len(self.sampler.stacks)}")
+        self.session.save()
+
+
+@contextmanager
+def profile_request(session, header):
+    """Profile a request handler when PROFILING is on and the client sent
+    X-Profile; threads given work through tracing.in_context() are
+    followed.  Yields the RequestProfile, or None."""
+    if not PROFILING or not header or header.lower() in ('0', 'false', 'no'):
+        yield None
+        return
+    profile = RequestProfile(session)
+    token = _current.set(profile)
+    try:
+        with profile.thread():
+            profile.sampler.start()
+            yield profile
+    finally:
+        _current.reset(token)
+
+
+def finish_profile(profile, result):
+    """End a request profile when the response is done — on close for a
+    stream, now otherwise.  Returns result unchanged."""
+    if profile is None:
+        return result
+    response = result[0] if isinstance(result, tuple) else result
+    if response.is_streamed:
+        response.call_on_close(profile.finish)
+    else:
+        profile.finish()
+    return result
+
+
+def current_profile():
+    return _current.get()
@@ -1,33 +1,175 @@
 """Routing logic and request forwarding to model providers."""
 
-import json
+import random
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import jsonify, Response
 import requests
 from typing import Dict, Any, Optional
 
 from src.config import (
     logger, date_context,
-    ROUTER_URL, PRIMARY_URL,
     XAI_API_KEY, XAI_API_URL, XAI_MODEL,
     ROUTER_MODEL, PRIMARY_MODEL,
     PRIMARY_SYSTEM_PROMPT, XAI_SYSTEM_PROMPT,
     ROUTING_SYSTEM_PROMPT, ROUTING_PROMPT,
     ENRICHMENT_SYSTEM_PROMPT,
     XAI_SEARCH_TOOLS,
+    PROMPT_LAYOUT,
+    META_SYSTEM_PROMPT,
+    PRIMARY_CONTEXT_TOKENS,
+    ROUTE_STICKY_AUDIT_RATE,
+    SPECULATIVE_ENRICH_BUDGET_PER_DAY, SPECULATIVE_ENRICH_PATTERN,
+    WORKER_THREADS,
 )
 from src.session_logger import SessionLogger
+from src.transport import HTTP
+from src.codec import dumps, loads, JSON_HEADERS
+from src.log_pipeline import fields
+from src.tracing import traced, current_span, in_context
+from src.backends import BackendPool, ROUTER_POOL, PRIMARY_POOL
+from src.tokens import TOKENS, prompt_budget, message_chars, content_text
+from src.conversation import CLASSIFIER_CONTEXT, ROUTE_MEMORY
+from src.shared_state import SharedState, RollingBudget
+from src.deadline import Deadline, stage_timeout
+from src.resilience import send_resilient
+from src.generation import apply_policy
+
+# Sampling parameters of every classifier call
+CLASSIFY_PARAMS = {"temperature": 0.0}
+
+# Background re-classification of reused routes (see _audit_reused_route)
+_audit_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='route-audit')
+
+# Speculative enrichment searches outlive their request when the route
+# isn't ENRICH, so they run here rather than in the request's own pool.
+_enrich_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='speculative-enrich')
+_ENRICH_SIGNAL = re.compile(SPECULATIVE_ENRICH_PATTERN, re.IGNORECASE) if SPECULATIVE_ENRICH_PATTERN else None
+ENRICH_WASTE_BUDGET = RollingBudget('speculative-enrich-budget', SPECULATIVE_ENRICH_BUDGET_PER_DAY, 86400)
+_ENRICH_STATS = SharedState('speculative-enrich', lambda: {
+    'started': 0, 'used': 0, 'wasted': 0, 'wasted_ms': 0, 'skipped_budget': 0,
+})
+
+
+def inject_system_prompt(messages: list, system_prompt: str, date_ctx: str) -> None:
+    """Add a route's system prompt and temporal context to messages in place.
+
+    With PROMPT_LAYOUT=legacy the temporal context leads the first system
+    message, ahead of the static prompt.  With PROMPT_LAYOUT=stable the
+    static prompt (plus any client system message) stays byte-identical
+    across requests and the temporal context is appended to the final user
+    message, so everything before it is a reusable vLLM prefix-cache hit.
+    Multimodal (list) content gets it as a trailing text part; only a
+    conversation without a user message falls back to the end of the
+    leading system message (chat templates expect system messages first).
+    """
+    if PROMPT_LAYOUT == 'legacy':
+        head = f"{date_ctx}\n{system_prompt}"
+    else:
+        head = system_prompt
+
+    first_system = next((m for m in messages if m.get('role') == 'system'), None)
+    if first_system:
+        first_system['content'] = f"{head}\n\n{first_system['content']}"
+    else:
+        first_system = {"role": "system", "content": head}
+        messages.insert(0, first_system)
+
+    if PROMPT_LAYOUT == 'legacy':
+        return
+
+    last_user = next((m for m in reversed(messages) if m.get('role') == 'user'), None)
+    content = last_user.get('content') if last_user else None
+    if isinstance(content, str):
+        last_user['content'] = f"{content}\n\n{date_ctx}"
+    elif isinstance(content, list):
+        # A new list: the parts are shared with the caller's messages
+        last_user['content'] = [*content, {"type": "text", "text": date_ctx}]
+    else:
+        first_system['content'] = f"{first_system['content']}\n\n{date_ctx}"
+
+
+def build_classify_messages(routing_prompt: str, date_ctx: str) -> list:
+    """Wrap a rendered routing prompt in the classifier's message layout.
+
+    Stable layout keeps the routing system prompt and the conversation
+    context as a cacheable prefix; the temporal context trails the request.
+    Shared with the startup warm-up so its priming request caches exactly
+    the prefix real classifications start with.
+    """
+    if PROMPT_LAYOUT == 'legacy':
+        return [
+            {"role": "system", "content": f"{date_ctx}\n\n{ROUTING_SYSTEM_PROMPT}"},
+            {"role": "user", "content": routing_prompt}
+        ]
+    return [
+        {"role": "system", "content": ROUTING_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{routing_prompt}\n\n{date_ctx}"}
+    ]
+
+
+def build_routing_request(messages: list, date_ctx: str) -> tuple:
+    """The classifier call for a conversation: (classify messages, encoded body).
+
+    Prior turns are included so the classifier can resolve references like
+    "that school" or "it" — the newest messages verbatim and digests of
+    older ones, capped at CLASSIFIER_CONTEXT_TOKENS.  The body is encoded
+    once; hedges and retries send the same bytes.
+    """
+    context_prefix = CLASSIFIER_CONTEXT.build(messages[:-1])
+
+    # Build routing classification prompt from external template
+    routing_prompt = context_prefix + ROUTING_PROMPT.format(
+        query=messages[-1].get('content', ''), truncation_note=""
+    )
+
+    classify_messages = build_classify_messages(routing_prompt, date_ctx)
+    return classify_messages, dumps({"messages": classify_messages, **CLASSIFY_PARAMS})
+
+
+# Markers of a conversation transcript embedded in a single message
+META_PROMPT_MARKERS = ('USER:', 'ASSISTANT:', '<chat_history>', '### Task:', '### Guidelines:')
 
 
-def determine_route(messages: list, session: SessionLogger = None, date_ctx: str = None) -> str:
+def is_meta_prompt(messages: list) -> bool:
+    """True for client-generated meta-prompts (follow-up suggestions, title
+    generation, summaries, etc.): single-message requests that embed their
+    own conversation history."""
+    if len(messages) != 1 or messages[0].get('role') != 'user':
+        return False
+    content = messages[0].get('content', '')
+    return (isinstance(content, str) and len(content) > 300
+            and any(marker in content for marker in META_PROMPT_MARKERS))
+
+
+def _audit_reused_route(messages, reused_route, affinity_key):
+    """Classify a follow-up whose route was reused and count any drift."""
+    classified = determine_route(messages, affinity_key=affinity_key, use_memory=False)
+    ROUTE_MEMORY.record_audit(reused_route, classified)
+    if classified != reused_route:
+        logger.info(f"Route drift: reused={reused_route} classified={classified}")
+
+
+@traced('classification')
+def determine_route(messages: list, session: SessionLogger = None, date_ctx: str = None,
+                    affinity_key: str = None, use_memory: bool = True,
+                    deadline: Deadline = None) -> str:
     """
     Use Orchestrator 8B to determine routing via prompt-based classification.
     Routes to: 'primary' (local Nano 30B), 'xai' (xAI API), or 'enrich' (xAI context → primary).
 
+    Short follow-ups to a turn routed earlier in the same conversation reuse
+    that route without calling the classifier (see RouteMemory).
+
     Args:
         messages: List of message dictionaries
         session: Optional SessionLogger for request tracking
+        affinity_key: Conversation fingerprint for router replica affinity
+        use_memory: Allow reusing the previous turn's route (False when
+            auditing a reused decision)
+        deadline: Request deadline bounding the classifier call; with too
+            little time left, classification is skipped
 
     Returns:
         'primary', 'xai', or 'enrich'
@@ -38,104 +180,101 @@ def determine_route(messages: list, session: SessionLogger = None, date_ctx: str
     # Get the last user message
     last_message = messages[-1].get('content', '')
 
-    # Fast-path: single-message requests that embed their own conversation
-    # history are client-generated meta-prompts (follow-up suggestions,
-    # title generation, summaries, etc.). They're self-contained and don't
+    # Fast-path: client-generated meta-prompts are self-contained and don't
     # need classification or enrichment — route to meta pipeline.
-    if len(messages) == 1 and len(last_message) > 300:
-        user_msgs = [m for m in messages if m.get('role') == 'user']
-        if len(user_msgs) == 1 and any(marker in last_message for marker in (
-            'USER:', 'ASSISTANT:', '<chat_history>', '### Task:', '### Guidelines:'
-        )):
-            # Guard rail: truncate embedded chat history if it would blow
-            # the primary model's context (~32K tokens ≈ ~120K chars).
-            # Leave ~4K tokens of headroom for system prompt + generation.
-            max_chars = 112000  # ~28K tokens
-            if len(last_message) > max_chars:
-                logger.warning(f"Meta-prompt too long ({len(last_message)} chars), truncating")
-                # Try to truncate within <chat_history> tags, keeping recent messages
-                start = last_message.find('<chat_history>')
-                end = last_message.find('</chat_history>')
-                if start >= 0 and end > start:
-                    prefix = last_message[:start + len('<chat_history>\n')]
-                    suffix = last_message[end:]
-                    history = last_message[start + len('<chat_history>\n'):end]
-                    # Keep the tail of the history (most recent exchanges)
-                    budget = max_chars - len(prefix) - len(suffix)
-                    history = history[-budget:]
-                    # Snap to the next complete line to avoid mid-message cuts
-                    nl = history.find('\n')
-                    if nl >= 0:
-                        history = history[nl + 1:]
-                    messages[-1]['content'] = prefix + history + suffix
-                else:
-                    # No tags found — just truncate from the front
-                    messages[-1]['content'] = last_message[-max_chars:]
-
-            logger.info("Detected meta-prompt, routing to meta pipeline")
-            if session:
-                session.set_route('meta', 'META', 0)
-            return 'meta'
-
-    # Include prior conversation so the classifier can resolve references
-    # like "that school" or "it".  Both the classifier and primary now
-    # share the same 32K context window, so no truncation is needed.
-    context_prefix = ''
-    prior = messages[:-1]
-    if prior:
-        lines = []
-        for m in prior:
-            role = m.get('role', 'unknown')
-            content = m.get('content', '')
-            # Strip <details> reasoning tags so the classifier sees
-            # the actual answer, not internal chain-of-thought
-            content = re.sub(r'<details[^>]*>.*?</details>\s*', '', content, flags=re.DOTALL)
-            content = content.strip()
-            lines.append(f"{role}: {content}")
-        context_prefix = (
-            "Recent conversation context (for resolving references):\n"
-            + "\n".join(lines)
-            + "\n\n"
+    if is_meta_prompt(messages):
+        # Guard rail: truncate embedded chat history if it would blow
+        # the primary model's context — the token budget left after the
+        # meta system prompt and generation reserve, in characters.
+        max_chars = TOKENS.chars_for(
+            prompt_budget(PRIMARY_CONTEXT_TOKENS, META_SYSTEM_PROMPT, date_ctx or '')
         )
+        if len(last_message) > max_chars:
+            logger.warning(f"Meta-prompt too long ({len(last_message)} chars), truncating")
+            # Try to truncate within <chat_history> tags, keeping recent messages
+            start = last_message.find('<chat_history>')
+            end = last_message.find('</chat_history>')
+            if start >= 0 and end > start:
+                prefix = last_message[:start + len('<chat_history>\n')]
+                suffix = last_message[end:]
+                history = last_message[start + len('<chat_history>\n'):end]
+                # Keep the tail of the history (most recent exchanges)
+                budget = max_chars - len(prefix) - len(suffix)
+                history = history[-budget:]
+                # Snap to the next complete line to avoid mid-message cuts
+                nl = history.find('\n')
+                if nl >= 0:
+                    history = history[nl + 1:]
+                messages[-1]['content'] = prefix + history + suffix
+            else:
+                # No tags found — just truncate from the front
+                messages[-1]['content'] = last_message[-max_chars:]
 
-    # Build routing classification prompt from external template
-    routing_prompt = context_prefix + ROUTING_PROMPT.format(
-        query=last_message, truncation_note=""
-    )
+        logger.info("Detected meta-prompt, routing to meta pipeline")
+        if session:
+            session.set_route('meta', 'META', 0)
+        return 'meta'
+
+    recalled = ROUTE_MEMORY.recall(messages) if use_memory else None
+    if recalled is not None:
+        route, decision = recalled
+        logger.info(f"Classification reused: {decision} -> {route} (follow-up turn)")
+        current_span().set(route=route, decision=decision, reused=True)
+        if session:
+            session.set_route(route, f"[reused] {decision}", 0)
+        ROUTE_MEMORY.remember(messages, route, decision)
+        if random.random() < ROUTE_STICKY_AUDIT_RATE:
+            # Private copy — the request path mutates its messages in place
+            _audit_pool.submit(_audit_reused_route, [dict(m) for m in messages], route, affinity_key)
+        return route
 
-    classify_messages = [
-        {"role": "system", "content": f"{date_ctx or date_context()}\n\n{ROUTING_SYSTEM_PROMPT}"},
-        {"role": "user", "content": routing_prompt}
-    ]
-    classify_params = {"temperature": 0.0}
-    classify_url = f"{ROUTER_URL}/v1/chat/completions"
+    timeout = stage_timeout(deadline, 'classification')
+    if timeout is None:
+        deadline.miss('classification', 'skipped')
+        logger.warning("No time left to classify, defaulting to primary")
+        if session:
+            session.set_route('primary', '[deadline]', 0)
+        return 'primary'
+
+    classify_messages, classify_body = build_routing_request(messages, date_ctx or date_context())
+    # The conversation's pinned replica first; hedges and retries go to
+    # whichever replica is least loaded
+    lease = ROUTER_POOL.acquire(affinity_key)
+    classify_url = f"{lease.url}/v1/chat/completions"
+
+    def _send(attempt_timeout, first):
+        attempt_lease = lease if first else ROUTER_POOL.acquire()
+        try:
+            response = HTTP.post(f"{attempt_lease.url}/v1/chat/completions",
+                                 data=classify_body, headers=JSON_HEADERS, timeout=attempt_timeout)
+        except Exception:
+            attempt_lease.release(error=True)
+            raise
+        attempt_lease.observe_response(response)
+        attempt_lease.release()
+        return response
 
     if session:
         session.begin_step('classification', 'router', classify_url, ROUTER_MODEL,
-                           messages=classify_messages, params=classify_params)
+                           messages=classify_messages, params=CLASSIFY_PARAMS)
 
     classify_start = time.time()
     try:
         # Ask Orchestrator 8B router to classify the query
-        response = requests.post(
-            classify_url,
-            json={
-                "messages": classify_messages,
-                **classify_params,
-            },
-            timeout=10  # Timeout for routing decision
-        )
-
+        response, attempts = send_resilient('classification', _send, timeout)
         classify_ms = (time.time() - classify_start) * 1000
+        if session and (attempts['attempts'] > 1 or attempts['hedged']):
+            session.data['steps'][-1]['attempts'] = attempts
 
         if response.status_code != 200:
             logger.warning(f"Routing classification returned status {response.status_code}, defaulting to primary")
             if session:
-                session.end_step(status=response.status_code, error=f'status {response.status_code}')
+                session.end_step(status=response.status_code, error=f'status {response.status_code}',
+                             phases=response.phases)
                 session.set_route('primary', f'[error: status {response.status_code}]', classify_ms)
             return 'primary'
 
-        result = response.json()
+        result = loads(response.content)
         # Extract decision from response (handle both content and reasoning_content).
         # The Orchestrator 8B wraps its reasoning in <think>...</think> tags.
         # Strip closed blocks first, then any unclosed trailing block (the
@@ -150,6 +289,7 @@ def determine_route(messages: list, session: SessionLogger = None, date_ctx: str
         decision = decision.strip().upper()
 
         route = 'primary'  # default
+        understood = True
         if 'ENRICH' in decision:
             route = 'enrich'
         elif 'SIMPLE' in decision:
@@ -160,17 +300,28 @@ def determine_route(messages: list, session: SessionLogger = None, date_ctx: str
             route = 'xai'
         else:
             logger.warning(f"Routing classification unclear: '{decision}', defaulting to primary")
+            understood = False
 
-        logger.info(f"Classification completed: {decision} -> {route} in {classify_ms:.0f}ms (finish_reason={finish_reason})")
+        logger.info(f"Classification completed: {decision} -> {route} in {classify_ms:.0f}ms (finish_reason={finish_reason})",
+                    extra=fields(event='classification', session=session.id if session else None,
+                                 decision=decision, route=route, classification_ms=round(classify_ms),
+                                 finish_reason=finish_reason, attempts=attempts['attempts']))
+        current_span().set(route=route, decision=decision, attempts=attempts['attempts'],
+                           hedged=attempts['hedged'])
+        if understood:
+            ROUTE_MEMORY.remember(messages, route, decision)
 
         if session:
-            session.end_step(status=response.status_code, response_content=raw, finish_reason=finish_reason)
+            session.end_step(status=response.status_code, response_content=raw, finish_reason=finish_reason,
+                             phases=response.phases)
             session.set_route(route, decision, classify_ms)
         return route
 
     except requests.exceptions.Timeout:
         classify_ms = (time.time() - classify_start) * 1000
         logger.warning("Routing classification timeout, defaulting to primary")
+        if deadline:
+            deadline.miss('classification', 'timeout')
         if session:
             session.end_step(error='timeout')
             session.set_route('primary', '[timeout]', classify_ms)
@@ -184,47 +335,64 @@ def determine_route(messages: list, session: SessionLogger = None, date_ctx: str
         return 'primary'
 
 
-def start_speculative_primary(data: dict, date_ctx: str, is_stream: bool):
+def speculative_primary_data(data: dict, date_ctx: str) -> dict:
+    """The speculative primary request for a client request, as
+    forward_request would send it on a MODERATE primary route."""
+    # Independent copy so we don't mutate the caller's data.
+    # Shallow-copy each message dict so system prompt injection
+    # doesn't affect the original messages list.
+    spec_data = dict(data)
+    spec_data['messages'] = [dict(m) for m in data['messages']]
+    spec_data.pop('max_tokens', None)
+    spec_data.pop('_route', None)
+    spec_data['model'] = PRIMARY_MODEL
+    # Most primary turns are MODERATE; see _handle_primary for SIMPLE
+    apply_policy(spec_data, 'moderate')
+
+    # Inject temporal context + primary system prompt (mirrors forward_request)
+    inject_system_prompt(spec_data['messages'], PRIMARY_SYSTEM_PROMPT, date_ctx)
+    return spec_data
+
+
+@traced('speculative_primary')
+def start_speculative_primary(data: dict, date_ctx: str, is_stream: bool, affinity_key: str = None,
+                              deadline: Deadline = None):
     """Fire a speculative primary model request (runs in parallel with classification).
 
     Prepares an independent copy of the request data with system prompt and
-    model set for the primary backend, then sends it.  The caller must close
-    the returned response if the route turns out to be non-primary.
+    model set for the primary backend, then sends it to a primary replica
+    (the conversation's pinned replica when affinity_key is given, otherwise
+    the least-loaded one).  The caller must close the returned response and
+    release the lease if the route turns out to be non-primary.
 
     Returns:
-        (requests.Response, float) — the HTTP response and request start time,
-        or (None, 0) if the request fails to start.
+        (requests.Response, float, Lease) — the HTTP response (with the
+        messages it sent as response.sent_messages), request start time and
+        primary replica lease, or (None, 0, None) if the request fails to
+        start or the deadline leaves no time for it.
     """
+    timeout = stage_timeout(deadline, 'inference')
+    if timeout is None:
+        return None, 0, None
     start = time.time()
+    lease = PRIMARY_POOL.acquire(affinity_key)
     try:
-        # Independent copy so we don't mutate the caller's data.
-        # Shallow-copy each message dict so system prompt injection
-        # doesn't affect the original messages list.
-        spec_data = dict(data)
-        spec_data['messages'] = [dict(m) for m in data['messages']]
-        spec_data.pop('max_tokens', None)
-        spec_data.pop('_route', None)
-        spec_data['model'] = PRIMARY_MODEL
-
-        # Inject temporal context + primary system prompt (mirrors forward_request)
-        context_line = f"{date_ctx}\n{PRIMARY_SYSTEM_PROMPT}"
-        first_system = next((m for m in spec_data['messages'] if m.get('role') == 'system'), None)
-        if first_system:
-            first_system['content'] = f"{context_line}\n\n{first_system['content']}"
-        else:
-            spec_data['messages'].insert(0, {"role": "system", "content": context_line})
-
-        response = requests.post(
-            f"{PRIMARY_URL}/v1/chat/completions",
-            json=spec_data,
-            headers={'Content-Type': 'application/json'},
+        spec_data = speculative_primary_data(data, date_ctx)
+        response = HTTP.post(
+            f"{lease.url}/v1/chat/completions",
+            data=dumps(spec_data),
+            headers=JSON_HEADERS,
             stream=is_stream,
-            timeout=300,
+            timeout=timeout,
         )
-        return response, start
+        # The messages as sent (system prompt and date context injected),
+        # which the reported prompt_tokens count
+        response.sent_messages = spec_data['messages']
+        return response, start, lease
     except Exception as e:
+        lease.release(error=True)
         logger.warning(f"Speculative primary failed to start: {e}")
-        return None, 0
+        return None, 0, None
 
 
 def _build_search_tools() -> list:
@@ -234,12 +402,21 @@ def _build_search_tools() -> list:
     return [{"type": t.strip()} for t in XAI_SEARCH_TOOLS.split(',') if t.strip()]
 
 
-def fetch_enrichment_context(messages: list, session: SessionLogger = None, date_ctx: str = None) -> Optional[str]:
+@traced('enrichment')
+def fetch_enrichment_context(messages: list, session: SessionLogger = None, date_ctx: str = None,
+                             deadline: Deadline = None) -> Optional[str]:
     """
     Call xAI /v1/responses to retrieve current/real-time context for the user's query.
     Uses web_search and x_search tools when configured via XAI_SEARCH_TOOLS.
-    Returns the enrichment text, or None if the call fails.
+    Returns the enrichment text, or None if the call fails or the deadline
+    leaves no time for it.
     """
+    timeout = stage_timeout(deadline, 'enrichment')
+    if timeout is None:
+        deadline.miss('enrichment', 'skipped')
+        logger.warning("No time left for enrichment, skipping it")
+        return None
+
     # Pass full conversation history so Grok can resolve references
     # (e.g. "that school") via the prior turns.
     enrich_input = [
@@ -267,22 +444,29 @@ def fetch_enrichment_context(messages: list, session: SessionLogger = None, date
                            messages=enrich_input,
                            params={k: v for k, v in request_body.items() if k != 'input'})
 
-    enrich_start = time.time()
-    try:
-        response = requests.post(
+    payload = dumps(request_body)
+
+    def _send(attempt_timeout, first):
+        return HTTP.post(
             enrich_url,
-            json=request_body,
+            data=payload,
             headers={
                 'Content-Type': 'application/json',
                 'Authorization': f'Bearer {XAI_API_KEY}'
             },
-            timeout=60
+            timeout=attempt_timeout
         )
 
+    enrich_start = time.time()
+    try:
+        response, attempts = send_resilient('enrichment', _send, timeout)
+
         enrich_ms = (time.time() - enrich_start) * 1000
+        if session and (attempts['attempts'] > 1 or attempts['hedged']):
+            session.data['steps'][-1]['attempts'] = attempts
 
         if response.status_code == 200:
-            result = response.json()
+            result = loads(response.content)
             # Extract text from /v1/responses output format
             context = ''
             for item in result.get('output', []):
@@ -294,17 +478,20 @@ def fetch_enrichment_context(messages: list, session: SessionLogger = None, date
             if context:
                 logger.info(f"Enrichment context retrieved: {len(context)} chars in {enrich_ms:.0f}ms")
                 if session:
-                    session.end_step(status=200, response_content=context)
+                    session.end_step(status=200, response_content=context, phases=response.phases)
                 return context
 
         logger.warning(f"Enrichment call failed: status={response.status_code} in {enrich_ms:.0f}ms")
         if session:
-            session.end_step(status=response.status_code, error=f'status {response.status_code}')
+            session.end_step(status=response.status_code, error=f'status {response.status_code}',
+                             phases=response.phases)
         return None
 
     except requests.exceptions.Timeout:
         enrich_ms = (time.time() - enrich_start) * 1000
         logger.warning(f"Enrichment context fetch timed out after {enrich_ms:.0f}ms")
+        if deadline:
+            deadline.miss('enrichment', 'timeout')
         if session:
             session.end_step(error='timeout')
         return None
@@ -316,47 +503,174 @@ def fetch_enrichment_context(messages: list, session: SessionLogger = None, date
         return None
 
 
-def get_model_url(route: str) -> str:
-    """Get the appropriate model URL based on route."""
+def _count_enrichment(field):
+    def _increment(s):
+        s[field] += 1
+
+    _ENRICH_STATS.update(_increment)
+
+
+class SpeculativeEnrichment:
+    """An enrichment search started before classification finished.
+
+    fetch_enrichment_context runs on _enrich_pool and records its step into
+    a scratch session (the request's session is busy with the
+    classification step at the same time).  The route then decides:
+    take() waits for the context and moves the step into the real session;
+    discard() leaves the call to finish in the background and charges it
+    to ENRICH_WASTE_BUDGET.  Only the first of the two calls has effect.
+    """
+
+    def __init__(self, messages: list, date_ctx: str, deadline: Deadline = None):
+        self.start = time.time()
+        self._settled = False
+        self._scratch = SessionLogger()
+        self._future = _enrich_pool.submit(in_context(fetch_enrichment_context), messages,
+                                           session=self._scratch, date_ctx=date_ctx,
+                                           deadline=deadline)
+        _count_enrichment('started')
+
+    def take(self, session: SessionLogger) -> Optional[str]:
+        """Return the enrichment context for an ENRICH request."""
+        self._settled = True
+        head_start_ms = (time.time() - self.start) * 1000
+        context = self._future.result()
+        # Step offsets were taken against the scratch session's start
+        offset_ms = round((self._scratch.start_time - session.start_time) * 1000)
+        for step in self._scratch.data['steps']:
+            step['speculative'] = True
+            if step.get('start_ms') is not None:
+                step['start_ms'] += offset_ms
+            session.data['steps'].append(step)
+        session.data['speculative_enrichment'] = {'used': True, 'head_start_ms': round(head_start_ms)}
+        _count_enrichment('used')
+        logger.info(f"Using speculative enrichment (started {head_start_ms:.0f}ms before it was needed)")
+        return context
+
+    def discard(self, route: str, session: SessionLogger) -> None:
+        """The route isn't ENRICH: record the wasted call once it completes."""
+        if self._settled:
+            return
+        self._settled = True
+        # Charge the budget now so concurrent requests see it immediately
+        ENRICH_WASTE_BUDGET.record()
+        session.data['speculative_enrichment'] = {'used': False}
+
+        def _wasted(future):
+            wasted_ms = (time.time() - self.start) * 1000
+            steps = self._scratch.data['steps']
+            status = steps[-1]['status'] if steps else None
+
+            def _count(s):
+                s['wasted'] += 1
+                s['wasted_ms'] += round(wasted_ms)
+
+            _ENRICH_STATS.update(_count)
+            logger.info(f"Discarded speculative enrichment: route={route} status={status}"
+                        f" duration_ms={wasted_ms:.0f}"
+                        f" wasted_today={ENRICH_WASTE_BUDGET.used()}/{SPECULATIVE_ENRICH_BUDGET_PER_DAY}")
+
+        self._future.add_done_callback(_wasted)
+
+
+def start_speculative_enrichment(messages: list, date_ctx: str,
+                                 deadline: Deadline = None) -> Optional[SpeculativeEnrichment]:
+    """Start the enrichment search early if the query looks like it needs one.
+
+    The signal is a keyword match (SPECULATIVE_ENRICH_PATTERN) on the
+    latest user message — cheap enough to run before classification.
+    Returns None when speculation is off, the signal doesn't fire, the
+    deadline leaves no time for a search, or today's waste budget is spent.
+    """
+    if not (XAI_API_KEY and SPECULATIVE_ENRICH_BUDGET_PER_DAY and _ENRICH_SIGNAL) or is_meta_prompt(messages):
+        return None
+    if stage_timeout(deadline, 'enrichment') is None:
+        return None
+    query = next((content_text(m.get('content')) for m in reversed(messages) if m.get('role') == 'user'), '')
+    if not _ENRICH_SIGNAL.search(query):
+        return None
+    if ENRICH_WASTE_BUDGET.used() >= SPECULATIVE_ENRICH_BUDGET_PER_DAY:
+        _count_enrichment('skipped_budget')
+        logger.info("Speculative enrichment skipped: daily waste budget spent")
+        return None
+    logger.info("Starting speculative enrichment alongside classification")
+    # Snapshot the list: handlers insert system messages into the original
+    return SpeculativeEnrichment(list(messages), date_ctx, deadline)
+
+
+def speculative_enrichment_stats() -> dict:
+    stats = _ENRICH_STATS.read()
+    stats['budget_per_day'] = SPECULATIVE_ENRICH_BUDGET_PER_DAY
+    stats['wasted_last_day'] = ENRICH_WASTE_BUDGET.used()
+    return stats
+
+
+def get_model_url(route: str):
+    """Get the appropriate model target based on route.
+
+    xAI is a single base URL; local routes return the primary BackendPool,
+    which forward_request resolves to a replica per request.
+    """
     if route == 'xai':
         return XAI_API_URL
     else:
-        return PRIMARY_URL
+        return PRIMARY_POOL
 
 
-def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str = None, session: SessionLogger = None, date_ctx: str = None) -> Response:
+@traced('provider_call')
+def forward_request(target_url, path: str, data: Dict[Any, Any], route: str = None, session: SessionLogger = None, date_ctx: str = None,
+                    affinity_key: str = None, deadline: Deadline = None, policy: str = None,
+                    body: bytes = None) -> Response:
     """
     Forward request to target model with proper error handling.
 
     Args:
-        target_url: Base URL of target model
+        target_url: Base URL of target model, or a BackendPool to pick a
+            replica from
         path: API path (e.g., '/v1/chat/completions')
         data: Request payload
         route: Route type ('primary', 'xai')
         session: Optional SessionLogger for request tracking
+        affinity_key: Conversation fingerprint for replica affinity (pools only)
+        deadline: Request deadline bounding the call; if it has already
+            passed, a 504 is returned without calling the backend
+        policy: Generation policy to apply (see src/generation.py)
+        body: Already-encoded request to send instead of encoding data —
+            the speculative primary's bytes when falling back to the same
+            request.  data is still prepared as usual for the session log.
 
     Returns:
         Flask Response object
     """
+    timeout = stage_timeout(deadline, 'inference')
+    if timeout is None:
+        deadline.miss('inference', 'skipped')
+        if session:
+            session.set_error('deadline exceeded')
+        return jsonify({
+            'error': 'Request timeout',
+            'message': 'The request deadline passed before the model could be called'
+        }), 504
+
+    lease = None
+    if isinstance(target_url, BackendPool):
+        lease = target_url.acquire(affinity_key)
+        target_url = lease.url
+    current_span().set(route=route or 'primary', backend=target_url, policy=policy)
     try:
         url = f"{target_url}{path}"
         logger.info(f"Forwarding request to {url}")
 
-        # Inject temporal context + route-specific system prompt into the
-        # first system message, or prepend one.  Each route has its own
+        # Inject temporal context + route-specific system prompt (see
+        # inject_system_prompt for placement).  Each route has its own
         # behavioral prompt: primary gets conciseness + reasoning guidance,
         # xAI gets conciseness tuned for a cloud model.
         if 'messages' in data:
             system_prompt = XAI_SYSTEM_PROMPT if route == 'xai' else PRIMARY_SYSTEM_PROMPT
-            context_line = f"{date_ctx or date_context()}\n{system_prompt}"
-            first_system = next((m for m in data['messages'] if m.get('role') == 'system'), None)
-            if first_system:
-                first_system['content'] = f"{context_line}\n\n{first_system['content']}"
-            else:
-                data['messages'].insert(0, {"role": "system", "content": context_line})
+            inject_system_prompt(data['messages'], system_prompt, date_ctx or date_context())
 
         # Set up headers
-        headers = {'Content-Type': 'application/json'}
+        headers = dict(JSON_HEADERS)
 
         # Override model to match the target backend
         if route == 'xai' and XAI_API_KEY:
@@ -365,6 +679,9 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
         else:
             data['model'] = PRIMARY_MODEL
 
+        if policy:
+            apply_policy(data, policy)
+
         is_stream = data.get('stream', False)
 
         # Log the outbound request (exclude internal _route key)
@@ -373,20 +690,35 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
             session.begin_step('provider_call', route or 'primary', url, data.get('model'),
                                messages=data.get('messages'), params=log_params)
 
-        # Forward the request
+        # Encoded once (without the internal _route key); xAI hedges and
+        # retries resend the same bytes
+        payload = body if body is not None else dumps({k: v for k, v in data.items() if k != '_route'})
+
+        def _send(attempt_timeout, first):
+            return HTTP.post(
+                url,
+                data=payload,
+                headers=headers,
+                stream=is_stream,
+                timeout=attempt_timeout
+            )
+
+        # Forward the request.  xAI calls are hedged and retried; primary
+        # generations go to the chosen replica once.
         forward_start = time.time()
-        response = requests.post(
-            url,
-            json=data,
-            headers=headers,
-            stream=is_stream,
-            timeout=300  # 5 minute timeout for long generations
-        )
+        if route == 'xai' and lease is None:
+            response, attempts = send_resilient('xai', _send, timeout)
+            if session and (attempts['attempts'] > 1 or attempts['hedged']):
+                session.data['steps'][-1]['attempts'] = attempts
+        else:
+            response = _send(timeout, True)
 
         if is_stream:
             forward_ms = (time.time() - forward_start) * 1000
             if session:
-                session.end_step(status=response.status_code, response_content='[streamed]')
+                session.end_step(status=response.status_code, response_content='[streamed]', phases=response.phases)
+            if lease:
+                lease.observe_response(response)
 
             # Wrap the SSE iterator to log TTFT (time from request start
             # to first data chunk reaching the client) without buffering.
@@ -397,26 +729,37 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
                         ttft_ms = (time.time() - start_time) * 1000
                         logger.info(
                             f"Provider response: {route_name} status={response.status_code}"
-                            f" connect_ms={connect_ms:.0f} ttft_ms={ttft_ms:.0f} stream=true"
+                            f" connect_ms={connect_ms:.0f} ttft_ms={ttft_ms:.0f} stream=true",
+                            extra=fields(event='provider_response', session=session.id if session else None,
+                                         provider=route_name, status=response.status_code,
+                                         connect_ms=round(connect_ms), ttft_ms=round(ttft_ms), stream=True,
+                                         phases=response.phases)
                         )
                         first_chunk = False
                     yield chunk
 
-            return Response(
+            stream_response = Response(
                 _stream_with_ttft(response.iter_content(chunk_size=None),
                                   route or 'primary', forward_start, forward_ms),
                 status=response.status_code,
                 content_type='text/event-stream'
             )
-
-        forward_ms = (time.time() - forward_start) * 1000
+            if lease:
+                # WSGI servers close the response when the stream ends or the
+                # client disconnects — free the replica slot either way.
+                stream_response.call_on_close(lease.release)
+            return stream_response
 
         # Capture response content for logging
         response_body = response.content
+        forward_ms = (time.time() - forward_start) * 1000
+        if lease:
+            lease.observe_response(response)
+            lease.release()
         finish_reason = None
         if session:
             try:
-                resp_json = json.loads(response_body)
+                resp_json = loads(response_body)
                 # Extract the assistant's response text for the log.
                 # Reasoning models may put all output in reasoning_content
                 # with content=null (especially when max_tokens is tight).
@@ -424,11 +767,19 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
                 finish_reason = choice.get('finish_reason')
                 msg = choice.get('message', {})
                 resp_text = msg.get('content') or msg.get('reasoning_content') or ''
-                session.end_step(status=response.status_code, response_content=resp_text or response_body.decode('utf-8', errors='replace'), finish_reason=finish_reason)
-            except (json.JSONDecodeError, IndexError, KeyError):
-                session.end_step(status=response.status_code, response_content=response_body.decode('utf-8', errors='replace'))
-
-        logger.info(f"Provider response: {route or 'primary'} status={response.status_code} duration_ms={forward_ms:.0f} finish_reason={finish_reason} stream=false")
+                session.end_step(status=response.status_code, response_content=resp_text or response_body.decode('utf-8', errors='replace'), finish_reason=finish_reason,
+                                 phases=response.phases)
+                if lease and 'messages' in data:
+                    TOKENS.calibrate(message_chars(data['messages']), len(data['messages']), resp_json.get('usage'))
+            except (ValueError, IndexError, KeyError):
+                session.end_step(status=response.status_code, response_content=response_body.decode('utf-8', errors='replace'),
+                                 phases=response.phases)
+
+        logger.info(f"Provider response: {route or 'primary'} status={response.status_code} duration_ms={forward_ms:.0f} finish_reason={finish_reason} stream=false",
+                    extra=fields(event='provider_response', session=session.id if session else None,
+                                 provider=route or 'primary', status=response.status_code,
+                                 duration_ms=round(forward_ms), finish_reason=finish_reason, stream=False,
+                                 phases=response.phases))
 
         # Return buffered response with same status code
         return Response(
@@ -438,7 +789,11 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
         )
 
     except requests.exceptions.Timeout:
+        if lease:
+            lease.release(error=True)
         logger.error(f"Request timeout to {target_url}")
+        if deadline:
+            deadline.miss('inference', 'timeout')
         if session:
             session.end_step(error='timeout')
         return jsonify({
@@ -447,6 +802,8 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
         }), 504
 
     except requests.exceptions.ConnectionError:
+        if lease:
+            lease.release(error=True)
         logger.error(f"Connection error to {target_url}")
         if session:
             session.end_step(error='connection_error')
@@ -456,6 +813,8 @@ def forward_request(target_url: str, path: str, data: Dict[Any, Any], route: str
         }), 503
 
     except Exception as e:
+        if lease:
+            lease.release(error=True)
         logger.error(f"Error forwarding request: {str(e)}")
         if session:
             session.end_step(error=str(e))
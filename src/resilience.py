@@ -0,0 +1,230 @@
+"""Hedged requests and retries for classification and xAI calls.
+
+Classification and xAI latencies have long tails (enrichment searches run
+11–26s), and a single slow or failed call either stalls the request or
+drops it to a default route.  send_resilient() wraps one outbound call:
+
+  hedging — once the call has run longer than the HEDGE_PERCENTILES
+            percentile of its recent latencies, an identical duplicate is
+            sent and whichever answers first wins; the loser is closed
+            when it completes.
+  retries — connection errors and transient statuses (429, 502, 503, 504)
+            are retried up to RETRY_ATTEMPTS times with full-jitter
+            exponential backoff, inside the caller's timeout.
+
+Both are only safe because these calls are idempotent — they have no side
+effects beyond what they cost.  Primary generations are not wrapped: they
+are local, long, and already load-balanced across replicas.
+
+The latency windows and the hedge and retry counters in /stats are shared
+across workers, so each worker hedges on the percentiles of all traffic.
+"""
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from src.config import (
+    logger,
+    HEDGE_PERCENTILES, RETRY_ATTEMPTS, RETRY_BACKOFF,
+    WORKER_THREADS,
+)
+from src.shared_state import SharedState
+from src.tracing import span, in_context
+
+# Transient statuses worth another attempt; everything else is returned
+RETRIABLE_STATUSES = frozenset([429, 502, 503, 504])
+# Ceiling on a single backoff sleep (and on an honoured Retry-After)
+MAX_BACKOFF = 5.0
+# Recent latencies kept per call kind, and how many are needed before the
+# percentile is trusted enough to hedge on
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# Substrings vLLM and OpenAI-compatible APIs use when a prompt exceeds the
+# model's context window
+CONTEXT_LENGTH_MARKERS = (
+    'maximum context length',
+    'context length',
+    'context_length_exceeded',
+    'prompt is too long',
+)
+
+_hedge_pool = ThreadPoolExecutor(max_workers=WORKER_THREADS * 2, thread_name_prefix='hedge')
+_STATS = SharedState('resilience')
+
+
+class LatencyWindow:
+    """Recent successful call durations for one kind of call."""
+
+    def __init__(self, kind, size=LATENCY_WINDOW):
+        self.size = size
+        self._samples = SharedState(f'latency-{kind}', lambda: {'samples': []})
+
+    def observe(self, seconds):
+        def _append(window):
+            window['samples'].append(round(seconds, 4))
+            del window['samples'][:-self.size]
+
+        self._samples.update(_append)
+
+    def percentile(self, pct):
+        """The pct-th percentile in seconds, or None with too few samples."""
+        samples = self._samples.read()['samples']
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+_LATENCY = {kind: LatencyWindow(kind) for kind in ('classification', 'enrichment', 'xai')}
+
+
+def _count(kind, field):
+    def _increment(stats):
+        counts = stats.setdefault(kind, {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'retries': 0})
+        counts[field] += 1
+
+    _STATS.update(_increment)
+
+
+def is_context_length_error(status, body) -> bool:
+    """True if a backend rejected the prompt for exceeding its context window."""
+    if status != 400 or not body:
+        return False
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    body = body.lower()
+    return any(marker in body for marker in CONTEXT_LENGTH_MARKERS)
+
+
+def hedge_delay(kind):
+    """Seconds to wait before hedging this kind of call, or None to never hedge."""
+    pct = HEDGE_PERCENTILES.get(kind, 0)
+    if pct <= 0:
+        return None
+    return _LATENCY[kind].percentile(pct)
+
+
+def _timed(kind, send, timeout, first):
+    with span('attempt', call=kind, first=first):
+        start = time.time()
+        response = send(timeout, first)
+        if response.status_code < 500:
+            _LATENCY[kind].observe(time.time() - start)
+        return response
+
+
+def _close_when_done(future):
+    def _close(f):
+        if f.exception() is None:
+            f.result().close()
+
+    future.add_done_callback(_close)
+
+
+def _hedged(kind, send, timeout, first, info):
+    """One attempt, duplicated if it outlasts the hedge delay."""
+    delay = hedge_delay(kind)
+    if delay is None or delay >= timeout:
+        return _timed(kind, send, timeout, first)
+
+    original = _hedge_pool.submit(in_context(_timed), kind, send, timeout, first)
+    done, _ = wait([original], timeout=delay)
+    if done:
+        return original.result()
+
+    info['hedged'] = True
+    _count(kind, 'hedged')
+    hedge = _hedge_pool.submit(in_context(_timed), kind, send, timeout - delay, False)
+    pending = {original, hedge}
+    failure = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except Exception as e:
+                failure = e
+                continue
+            if response.status_code in RETRIABLE_STATUSES and pending:
+                # The other copy may still succeed
+                response.close()
+                continue
+            for other in pending:
+                _close_when_done(other)
+            if future is hedge:
+                info['hedge_won'] = True
+                _count(kind, 'hedge_wins')
+            return response
+    raise failure
+
+
+def _backoff(attempt, response):
+    delay = random.uniform(0, min(MAX_BACKOFF, RETRY_BACKOFF * 2 ** attempt))
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, min(MAX_BACKOFF, float(retry_after)))
+        except ValueError:
+            pass
+    return delay
+
+
+def send_resilient(kind, send, timeout):
+    """Make an idempotent call with hedging and retries.
+
+    Args:
+        kind: 'classification', 'enrichment' or 'xai' — selects the latency
+            window and HEDGE_PERCENTILES entry
+        send: send(timeout, first) makes one attempt and returns a
+            requests.Response; first is False for hedges and retries (so a
+            pooled caller can pick a different replica)
+        timeout: Seconds for the whole call, retries included
+
+    Returns:
+        (requests.Response, dict) — the winning response and a summary of
+        attempts, hedging and retries for the session log.  The last
+        response is returned once retries are exhausted; the last
+        connection error is raised.  Timeouts are raised as-is (the time
+        is spent).
+    """
+    end = time.time() + timeout
+    info = {'attempts': 0, 'hedged': False, 'hedge_won': False}
+    _count(kind, 'calls')
+    for attempt in range(RETRY_ATTEMPTS + 1):
+        info['attempts'] += 1
+        response = None
+        try:
+            response = _hedged(kind, send, end - time.time(), attempt == 0, info)
+            if response.status_code not in RETRIABLE_STATUSES:
+                return response, info
+        except requests.exceptions.ConnectionError:
+            if attempt == RETRY_ATTEMPTS:
+                raise
+        if attempt == RETRY_ATTEMPTS:
+            return response, info
+
+        delay = _backoff(attempt, response)
+        if time.time() + delay >= end:
+            if response is not None:
+                return response, info
+            raise requests.exceptions.ConnectionError(f"{kind}: no time left to retry")
+        if response is not None:
+            response.close()
+        status = response.status_code if response is not None else 'connection_error'
+        logger.warning(f"Retrying {kind} call after {status} in {delay * 1000:.0f}ms"
+                       f" (attempt {attempt + 2}/{RETRY_ATTEMPTS + 1})")
+        _count(kind, 'retries')
+        time.sleep(delay)
+
+
+def resilience_stats():
+    stats = _STATS.read()
+    for kind in _LATENCY:
+        delay = hedge_delay(kind)
+        stats.setdefault(kind, {})['hedge_delay_ms'] = None if delay is None else round(delay * 1000)
+    stats['retry_attempts'] = RETRY_ATTEMPTS
+    return stats
@@ -0,0 +1,97 @@
+"""Production server: pre-forked gunicorn workers around the Flask app.
+
+The master imports the app (config, prompts, pools) once and forks WORKERS
+processes from it, each serving WORKER_THREADS requests concurrently.  The
+background loops (health prober, load monitor) start in each worker after
+the fork, never in the master — a fork only copies the calling thread.
+Shared replica/load/budget state goes through src/shared_state.py.
+
+SIGHUP to the master re-imports src.* (picking up edited prompts and
+code), then replaces the workers gracefully.  If the re-import fails the
+old app keeps serving.
+"""
+
+import importlib
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+from src.config import logger, WORKERS, WORKER_THREADS, GRACEFUL_TIMEOUT, PORT
+
+
+def _reimport_app(current):
+    """Drop every src.* module and import src.app afresh.
+
+    Returns the new Flask app, or current (with the old modules restored)
+    if the import raises.
+    """
+    old = {name: mod for name, mod in sys.modules.items()
+           if name.startswith('src.') and name != __name__}
+    handlers = list(logger.handlers)
+    for name in old:
+        del sys.modules[name]
+    # src.config attaches a new log pipeline on import
+    for handler in handlers:
+        logger.removeHandler(handler)
+    try:
+        app = importlib.import_module('src.app').app
+    except Exception as e:
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+        sys.modules.update(old)
+        logger.error(f"Reload failed, keeping the running app: {e}")
+        return current
+    for handler in handlers:
+        handler.close()
+    logger.info("Reloaded app modules and prompts")
+    return app
+
+
+def _post_fork(server, worker):
+    importlib.import_module('src.app').start_background_tasks()
+
+
+def _child_exit(server, worker):
+    # A worker that died mid-request never released its leases
+    for pool in importlib.import_module('src.backends').POOLS:
+        pool.forget_process(worker.pid)
+
+
+class RouterServer(BaseApplication):
+    """gunicorn application serving an already-imported WSGI app."""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+    def reload(self):
+        super().reload()
+        self.application = _reimport_app(self.application)
+        self.callable = None
+
+
+def serve(app, host='0.0.0.0', port=PORT):
+    """Run app under gunicorn until the master is stopped."""
+    logger.info(f"Starting {WORKERS} workers x {WORKER_THREADS} threads on {host}:{port}")
+    RouterServer(app, {
+        'bind': f'{host}:{port}',
+        'workers': WORKERS,
+        'worker_class': 'gthread',
+        'threads': WORKER_THREADS,
+        'preload_app': True,
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'proc_name': 'ai-router',
+        'post_fork': _post_fork,
+        'child_exit': _child_exit,
+    }).run()
@@ -1,12 +1,14 @@
 """Session-based request logging — one JSON file per request lifecycle."""
 
 import os
-import json
 import uuid
 import time
 import glob as globmod
 
 from src.config import logger, now, LOG_DIR
+from src.codec import dumps
+from src.log_pipeline import fields
+from src.tracing import traced
 
 # Session logging configuration — session JSONs go in a subdirectory of LOG_DIR
 SESSIONS_DIR = os.path.join(LOG_DIR, 'sessions')
@@ -44,7 +46,15 @@ class SessionLogger:
             'error': None,
         }
         self._step_start = None
-        self._messages_json = None  # pre-serialized client messages (set by set_query)
+        self._messages_json = None  # pre-serialized client messages bytes (set by set_query)
+        # Optional callable notified of each pipeline stage as it starts and
+        # ends (streamed to the client as SSE progress events, see src/sse.py)
+        self.progress = None
+
+    def _notify(self, **event):
+        if self.progress is not None:
+            event['elapsed_ms'] = round((time.time() - self.start_time) * 1000)
+            self.progress(event)
 
     def set_query(self, messages):
         """Snapshot the original messages as a JSON string (avoids deep copy).
@@ -54,7 +64,7 @@ class SessionLogger:
         conversations with reasoning blocks.
         """
         if messages:
-            self._messages_json = json.dumps(messages, default=str)
+            self._messages_json = dumps(messages, default=str)
             for msg in reversed(messages):
                 if msg.get('role') == 'user':
                     content = msg.get('content', '')
@@ -65,6 +75,7 @@ class SessionLogger:
         self.data['route'] = route
         self.data['classification_raw'] = raw_decision
         self.data['classification_ms'] = round(duration_ms)
+        self._notify(stage='route', state='done', route=route)
 
     def begin_step(self, step, provider, url, model, messages=None, params=None):
         """Start timing a step and record its request data."""
@@ -79,29 +90,38 @@ class SessionLogger:
             step_entry['messages_sent'] = messages
         if params is not None:
             step_entry['params'] = params
+        step_entry['start_ms'] = None  # offset from the request's start
         step_entry['duration_ms'] = None
         step_entry['status'] = None
         step_entry['response_content'] = None
         self.data['steps'].append(step_entry)
+        self._notify(stage=step, state='started', provider=provider)
 
-    def end_step(self, status=None, response_content=None, finish_reason=None, error=None):
-        """Finish timing the current step and record its result."""
+    def end_step(self, status=None, response_content=None, finish_reason=None, error=None, phases=None):
+        """Finish timing the current step and record its result (and the
+        connection phases of its HTTP call, from src/transport.py)."""
         if not self.data['steps']:
             return
         step = self.data['steps'][-1]
         if self._step_start:
+            step['start_ms'] = round((self._step_start - self.start_time) * 1000)
             step['duration_ms'] = round((time.time() - self._step_start) * 1000)
         step['status'] = status
         step['finish_reason'] = finish_reason
+        if phases:
+            step['phases'] = phases
         if error:
             step['response_content'] = f"[error: {error}]"
         elif response_content is not None:
             step['response_content'] = response_content[:2000] if len(str(response_content)) > 2000 else response_content
         self._step_start = None
+        self._notify(stage=step['step'], state='streaming' if response_content == '[streamed]' else 'done',
+                     status=status)
 
     def set_error(self, error):
         self.data['error'] = str(error)
 
+    @traced('session_save')
     def save(self):
         """Write session to a JSON file and run cleanup."""
         self.data['total_ms'] = round((time.time() - self.start_time) * 1000)
@@ -115,10 +135,10 @@ class SessionLogger:
             # so we don't re-serialize the (potentially large) conversation.
             if self._messages_json:
                 self.data['client_messages'] = '__MESSAGES_PLACEHOLDER__'
-            with open(filepath, 'w') as f:
-                raw = json.dumps(self.data, indent=2, default=str)
+            with open(filepath, 'wb') as f:
+                raw = dumps(self.data, pretty=True, default=str)
                 if self._messages_json:
-                    raw = raw.replace('"__MESSAGES_PLACEHOLDER__"', self._messages_json)
+                    raw = raw.replace(b'"__MESSAGES_PLACEHOLDER__"', self._messages_json)
                 f.write(raw)
         except Exception as e:
             logger.error(f"Failed to write session log: {e}")
@@ -135,7 +155,9 @@ class SessionLogger:
             SessionLogger._save_count = 0
             SessionLogger._last_cleanup = time.time()
 
-        logger.info(f"Session saved: {self.id} write_ms={write_ms:.0f} cleanup_ms={cleanup_ms:.0f}")
+        logger.info(f"Session saved: {self.id} write_ms={write_ms:.0f} cleanup_ms={cleanup_ms:.0f}",
+                    extra=fields(event='session_saved', session=self.id,
+                                 write_ms=round(write_ms), cleanup_ms=round(cleanup_ms)))
 
     def _cleanup(self):
         """Remove old session files if over age or count limits."""
@@ -0,0 +1,219 @@
+"""Process-shared state for multi-worker serving.
+
+Under the production server (WORKERS > 1, src/server.py) every worker is a
+separate process, so module-level counters would drift apart and /stats or
+the replica circuit breakers would reflect whichever worker happened to
+handle the call.  State that must stay coherent across workers — replica
+health and load, affinity counters, primary load samples, the overflow
+budget, speculation waste, remembered routes, hedge latency windows and
+the token calibration — lives in a SharedState instead.
+
+With SHARED_STATE_DIR set, each SharedState is one small mmap'd file
+holding a JSON document, guarded by flock() for other processes plus a
+thread lock for this one (flock doesn't exclude threads sharing a file
+descriptor).  Without it the document is a plain dict in this process,
+so the single-process server pays nothing for the abstraction.
+"""
+
+import copy
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import SHARED_STATE_DIR
+from src.codec import dumps, loads
+
+# Each file starts with the byte length of the JSON document that follows
+_HEADER = struct.Struct('<I')
+_INITIAL_SIZE = 64 * 1024
+# The pid of the process that first imported this module.  A SIGHUP reload
+# re-imports src.* in the same master (src/server.py) and must keep the
+# documents the old workers are still using; a fresh start discards
+# whatever a previous run left behind.
+_OWNER_ENV = 'AI_ROUTER_SHARED_STATE_PID'
+_FRESH_PROCESS = os.environ.get(_OWNER_ENV) != str(os.getpid())
+os.environ[_OWNER_ENV] = str(os.getpid())
+
+
+class SharedState:
+    """A JSON document shared by every worker process.
+
+    Callers mutate it only through update(fn), which runs fn on the current
+    document under an exclusive lock and writes the result back, so
+    read-modify-write sequences (counters, leases) are atomic across
+    processes.  Values must be JSON types; dict keys must be strings.
+
+    Instances are created at import time in the server master, before
+    workers fork.  The first import in a process resets the file to
+    default_factory(); a re-import on reload keeps the current document,
+    initialising only a file that is new or empty.
+    """
+
+    def __init__(self, name, default_factory=dict):
+        self.name = name
+        self._default_factory = default_factory
+        self._lock = threading.Lock()
+        self._path = os.path.join(SHARED_STATE_DIR, f"{name}.state") if SHARED_STATE_DIR else None
+        self._local = None
+        self._pid = None
+        self._fd = None
+        self._map = None
+        if self._path is None:
+            self._local = default_factory()
+        else:
+            os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+            with self._locked(fcntl.LOCK_EX):
+                if _FRESH_PROCESS or not _HEADER.unpack_from(self._map, 0)[0]:
+                    self._store(default_factory())
+
+    def _open(self):
+        """(Re)open the file in this process.
+
+        flock() locks belong to the open file description, which a forked
+        child shares with its parent — each process needs its own.
+        """
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self._fd).st_size
+        if size < _INITIAL_SIZE:
+            os.ftruncate(self._fd, _INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        self._pid = os.getpid()
+
+    def _remap(self, size):
+        if size > os.fstat(self._fd).st_size:
+            os.ftruncate(self._fd, size)
+        self._map.close()
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self, mode):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _load(self):
+        # Another process may have grown the file since we mapped it
+        size = os.fstat(self._fd).st_size
+        if size != len(self._map):
+            self._remap(size)
+        (length,) = _HEADER.unpack_from(self._map, 0)
+        if not length:
+            return self._default_factory()
+        return loads(self._map[_HEADER.size:_HEADER.size + length])
+
+    def _store(self, document):
+        data = dumps(document)
+        needed = _HEADER.size + len(data)
+        if needed > len(self._map):
+            self._remap(max(needed * 2, len(self._map) * 2))
+        self._map[_HEADER.size:needed] = data
+        _HEADER.pack_into(self._map, 0, len(data))
+
+    def update(self, fn):
+        """Apply fn(document) atomically and return its result.
+
+        fn mutates the document in place.  If it raises, nothing is written.
+        """
+        if self._path is None:
+            with self._lock:
+                return fn(self._local)
+        with self._locked(fcntl.LOCK_EX):
+            document = self._load()
+            result = fn(document)
+            self._store(document)
+            return result
+
+    def read(self):
+        """Return a private copy of the current document."""
+        if self._path is None:
+            with self._lock:
+                return copy.deepcopy(self._local)
+        with self._locked(fcntl.LOCK_SH):
+            return self._load()
+
+
+_LEADERS = SharedState('leaders')
+
+
+def claim_leadership(role, ttl):
+    """Return True if this process holds the lease on a background role.
+
+    Background loops (health probes, load scraping) run in every worker but
+    only do work while holding the lease, so backends see one prober rather
+    than one per worker.  The lease is renewed on every call and taken over
+    by another worker once the holder stops renewing it for ttl seconds.
+    Always True in single-process mode.
+    """
+    pid = os.getpid()
+    now = time.time()
+
+    def _claim(leaders):
+        holder = leaders.get(role)
+        if holder is None or holder['pid'] == pid or holder['expires'] < now:
+            leaders[role] = {'pid': pid, 'expires': now + ttl}
+            return True
+        return False
+
+    return _LEADERS.update(_claim)
+
+
+class RollingBudget:
+    """Cap on how many times something may happen per rolling window.
+
+    The spend timestamps are shared, so the cap holds across all workers.
+    """
+
+    def __init__(self, name, limit, window=3600):
+        self.limit = limit
+        self.window = window
+        self._state = SharedState(name, lambda: {'spent': []})
+
+    def _expire(self, state, now):
+        state['spent'] = [t for t in state['spent'] if t >= now - self.window]
+
+    def try_consume(self):
+        """Spend one unit if the budget allows.  Returns True on success."""
+        now = time.time()
+
+        def _consume(state):
+            self._expire(state, now)
+            if len(state['spent']) >= self.limit:
+                return False
+            state['spent'].append(now)
+            return True
+
+        return self._state.update(_consume)
+
+    def record(self):
+        """Spend one unit unconditionally — for costs that are only known
+        after the fact."""
+        now = time.time()
+
+        def _record(state):
+            self._expire(state, now)
+            state['spent'].append(now)
+
+        self._state.update(_record)
+
+    def available(self):
+        """True if a unit could be spent now (nothing is spent)."""
+        return self.used() < self.limit
+
+    def used(self):
+        now = time.time()
+
+        def _used(state):
+            self._expire(state, now)
+            return len(state['spent'])
+
+        return self._state.update(_used)
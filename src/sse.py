@@ -0,0 +1,133 @@
+"""Server-sent events: open streaming responses before the backend answers.
+
+A streamed ENRICH or COMPLEX request used to send nothing until
+classification, the xAI search and the backend connection had all
+finished — 30s+ of silence, long enough for cloudflared/traefik to give
+up on the connection and for a user to assume it hung.  open_stream()
+sends the response headers and an SSE comment at once, keeps the
+connection alive with comment frames every SSE_HEARTBEAT_INTERVAL seconds
+while the pipeline runs on another thread, and then relays the backend's
+stream.  SSE clients ignore comment lines, so this is invisible to them.
+
+With SSE_PROGRESS_EVENTS, pipeline stages (classification, enrichment,
+provider call) are also reported as named `event: progress` frames.
+
+Once headers are sent the status is always 200, so a failed request ends
+with an OpenAI-style `data: {"error": ...}` event followed by [DONE].
+"""
+
+import queue
+import threading
+
+from flask import Response
+
+from src.codec import dumps, loads
+
+OPEN_FRAME = b': ai-router\n\n'
+HEARTBEAT_FRAME = b': keep-alive\n\n'
+DONE_FRAME = b'data: [DONE]\n\n'
+
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    # Stop nginx-style proxies from buffering the heartbeats away
+    'X-Accel-Buffering': 'no',
+}
+
+
+def event_frame(name, payload) -> bytes:
+    return b'event: ' + name.encode() + b'\ndata: ' + dumps(payload) + b'\n\n'
+
+
+def error_frame(status, body) -> bytes:
+    """An OpenAI-style streamed error for a response that failed after the
+    stream was opened."""
+    try:
+        detail = loads(body)
+    except (ValueError, TypeError):
+        detail = {}
+    error = detail.get('error')
+    if not isinstance(error, dict):
+        # The router's own {'error': title, 'message': ...} or vLLM's
+        # {'object': 'error', 'message': ...}
+        error = {'message': detail.get('message') or error or 'Request failed'}
+    error.setdefault('code', status)
+    return b'data: ' + dumps({'error': error}) + b'\n\n'
+
+
+def _as_response(result):
+    """Handlers return a Response or a (Response, status) tuple."""
+    if isinstance(result, tuple):
+        response, status = result
+        response.status_code = status
+        return response
+    return result
+
+
+def open_stream(run, heartbeat_interval) -> Response:
+    """Start run(progress) on a thread and stream its response.
+
+    Args:
+        run: Produces the final Flask response.  It may call progress(dict)
+            to emit progress events while it works.
+        heartbeat_interval: Seconds between keep-alive comments
+
+    The inner response is closed (releasing its replica lease) when its
+    stream ends, or as soon as it is ready if the client has already gone.
+    """
+    frames = queue.Queue()
+    lock = threading.Lock()
+    state = {'response': None, 'error': None, 'abandoned': False}
+
+    def _progress(payload):
+        frames.put(event_frame('progress', payload))
+
+    def _worker():
+        try:
+            response = _as_response(run(_progress))
+        except Exception as e:
+            state['error'] = e
+            response = None
+        with lock:
+            if state['abandoned']:
+                if response is not None:
+                    response.close()
+            else:
+                state['response'] = response
+        frames.put(None)
+
+    threading.Thread(target=_worker, name='sse-pipeline', daemon=True).start()
+
+    def _generate():
+        yield OPEN_FRAME
+        while True:
+            try:
+                frame = frames.get(timeout=heartbeat_interval)
+            except queue.Empty:
+                yield HEARTBEAT_FRAME
+                continue
+            if frame is None:
+                break
+            yield frame
+
+        response = state['response']
+        if response is None:
+            yield error_frame(500, dumps({'message': str(state['error'])}))
+            yield DONE_FRAME
+        elif response.status_code >= 400:
+            yield error_frame(response.status_code, response.get_data())
+            yield DONE_FRAME
+        else:
+            yield from response.response
+
+    def _close():
+        # Runs when the stream ends or the client disconnects, even if the
+        # generator never started
+        with lock:
+            state['abandoned'] = True
+            response = state['response']
+        if response is not None:
+            response.close()
+
+    stream = Response(_generate(), content_type='text/event-stream', headers=STREAM_HEADERS)
+    stream.call_on_close(_close)
+    return stream
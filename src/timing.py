@@ -0,0 +1,104 @@
+"""Per-request latency breakdown for clients: Server-Timing and X-Request-Id.
+
+Every /v1/chat/completions response carries
+
+  X-Request-Id   — the session id, which names the session log file
+                   (logs/sessions/<timestamp>_<id>.json)
+  Server-Timing  — classification, enrichment, inference, router overhead
+                   and total, in milliseconds (W3C Server-Timing), e.g.
+                   classification;dur=512, inference;dur=1830, router;dur=4, total;dur=2346
+
+so a benchmark or browser devtools can attribute latency per request
+without the server's logs.  "router" is the time no pipeline step was
+running — request parsing, queueing, handoffs.  Classification and a
+speculative primary overlap, so the stages can add up to more than total.
+
+Headers go out before a stream's body, so for streams the header covers
+the time to the first byte and the full breakdown, generation included,
+follows the last event as an SSE comment (ignored by SSE clients):
+
+    : server-timing classification;dur=512, inference;dur=9120, router;dur=4, total;dur=9640
+"""
+
+import time
+
+REQUEST_ID_HEADER = 'X-Request-Id'
+SERVER_TIMING_HEADER = 'Server-Timing'
+# Session step kinds summed into each stage
+STEP_STAGES = {'enrichment': 'enrichment', 'provider_call': 'inference'}
+
+
+def _covered_ms(intervals):
+    """Length of the union of (start, end) intervals."""
+    covered = 0
+    reach = None
+    for start, end in sorted(intervals):
+        if reach is None or start > reach:
+            covered += end - start
+            reach = end
+        elif end > reach:
+            covered += end - reach
+            reach = end
+    return covered
+
+
+def breakdown(session, stream_end=None) -> dict:
+    """Milliseconds per stage of a request so far.
+
+    Args:
+        session: The request's SessionLogger
+        stream_end: When a streamed response has finished, its end time —
+            streamed steps then run to it rather than to their first byte
+
+    Returns:
+        dict with classification, enrichment, inference, router and total
+    """
+    now = stream_end or time.time()
+    total = (now - session.start_time) * 1000
+    # Includes routes decided without a classifier call (route memory)
+    timings = {'classification': session.data.get('classification_ms') or 0, 'enrichment': 0, 'inference': 0}
+    intervals = []
+    for step in session.data.get('steps', []):
+        duration = step.get('duration_ms') or 0
+        start = step.get('start_ms')
+        if stream_end and start is not None and step.get('response_content') == '[streamed]':
+            duration = total - start
+        if step.get('step') in STEP_STAGES:
+            timings[STEP_STAGES[step['step']]] += duration
+        if start is not None:
+            intervals.append((start, start + duration))
+    timings['router'] = max(0, total - _covered_ms(intervals))
+    timings['total'] = total
+    return {name: round(ms) for name, ms in timings.items()}
+
+
+def server_timing(timings) -> str:
+    """Server-Timing header value; stages that didn't run are left out."""
+    return ', '.join(f"{name};dur={ms}" for name, ms in timings.items()
+                     if ms or name in ('router', 'total'))
+
+
+def _with_trailer(chunks, session):
+    yield from chunks
+    yield f": server-timing {server_timing(breakdown(session, time.time()))}\n\n".encode()
+
+
+def annotate(result, session, header=True):
+    """Add the request id and timing to a handler's response.
+
+    Args:
+        result: A Flask response or (response, status) tuple
+        session: The request's SessionLogger
+        header: False when the response opens before the pipeline runs
+            (src/sse.py) and a Server-Timing header would say nothing
+
+    Returns:
+        result, with streamed bodies wrapped to end with the timing comment
+    """
+    response = result[0] if isinstance(result, tuple) else result
+    response.headers[REQUEST_ID_HEADER] = session.id
+    if header:
+        response.headers[SERVER_TIMING_HEADER] = server_timing(breakdown(session))
+    if response.is_streamed and response.mimetype == 'text/event-stream':
+        response.response = _with_trailer(response.response, session)
+    return result
@@ -0,0 +1,191 @@
+"""Token accounting: measure requests against each backend's context window."""
+
+import math
+from functools import lru_cache
+
+from src.config import (
+    logger,
+    XAI_API_KEY,
+    PRIMARY_SYSTEM_PROMPT, XAI_SYSTEM_PROMPT,
+    TOKENIZER_PATH,
+    PRIMARY_CONTEXT_TOKENS, XAI_CONTEXT_TOKENS, CONTEXT_RESERVE_TOKENS,
+    CONTEXT_OVERFLOW_POLICY,
+)
+from src.shared_state import SharedState
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # optional — the estimator is used instead
+    Tokenizer = None
+
+# Chat-template tokens around each message (role header, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Starting point for the estimator: English prose averages ~4 chars/token
+# on Nemotron's tokenizer; code and non-Latin text run lower, which the
+# calibration picks up from real traffic.
+DEFAULT_CHARS_PER_TOKEN = 4.0
+# Weight of each backend-reported sample in the chars/token EWMA
+CALIBRATION_ALPHA = 0.1
+# Distinct message texts whose exact token counts are kept.  Clients resend
+# the whole history every turn, so earlier messages are counted once.
+COUNT_CACHE_SIZE = 4096
+
+
+def content_text(content) -> str:
+    """Text of a message's content (plain string or OpenAI content parts)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return '\n'.join(p.get('text', '') for p in content
+                         if isinstance(p, dict) and p.get('type') == 'text')
+    return ''
+
+
+def message_chars(messages: list) -> int:
+    return sum(len(content_text(m.get('content'))) for m in messages)
+
+
+class TokenCounter:
+    """Counts tokens exactly with a local tokenizer, or estimates them.
+
+    The estimate divides characters by a chars-per-token ratio that
+    calibrate() keeps fitted to the prompt_tokens the primary reports, so
+    it converges on the real tokenizer's behaviour for this traffic.  The
+    fitted ratio is shared across workers; each worker reads it back when
+    it folds in a sample of its own.
+    """
+
+    def __init__(self, tokenizer_path=''):
+        self._tokenizer = None
+        self._calibration = SharedState('token-calibration', lambda: {'chars_per_token': DEFAULT_CHARS_PER_TOKEN})
+        self.chars_per_token = self._calibration.read()['chars_per_token']
+        if tokenizer_path:
+            if Tokenizer is None:
+                logger.warning("TOKENIZER_PATH is set but the tokenizers package is not installed, estimating tokens")
+            else:
+                try:
+                    self._tokenizer = Tokenizer.from_file(tokenizer_path)
+                    logger.info(f"Loaded tokenizer from {tokenizer_path}")
+                except Exception as e:
+                    logger.error(f"Failed to load tokenizer from {tokenizer_path}: {e}, estimating tokens")
+        self._encode_len = lru_cache(maxsize=COUNT_CACHE_SIZE)(self._encode_len_uncached)
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def _encode_len_uncached(self, text):
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return self._encode_len(text)
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_message(self, message: dict) -> int:
+        return self.count_text(content_text(message.get('content'))) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_messages(self, messages: list) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+    def chars_for(self, tokens: int) -> int:
+        """Approximate character length of a token budget."""
+        return int(tokens * self.chars_per_token)
+
+    def calibrate(self, chars: int, message_count: int, usage) -> None:
+        """Fold a backend-reported prompt size into the chars/token ratio.
+
+        Args:
+            chars: Total content characters of the messages actually sent
+            message_count: Number of messages sent
+            usage: The response's 'usage' object (may be None)
+        """
+        prompt_tokens = (usage or {}).get('prompt_tokens')
+        if self.exact or not prompt_tokens:
+            return
+        content_tokens = prompt_tokens - message_count * MESSAGE_OVERHEAD_TOKENS
+        if content_tokens <= 0 or chars <= 0:
+            return
+        sample = chars / content_tokens
+
+        def _fold(state):
+            state['chars_per_token'] += CALIBRATION_ALPHA * (sample - state['chars_per_token'])
+            return state['chars_per_token']
+
+        self.chars_per_token = self._calibration.update(_fold)
+
+
+TOKENS = TokenCounter(TOKENIZER_PATH)
+
+
+def prompt_budget(window: int, system_prompt: str, date_ctx: str) -> int:
+    """Tokens left for the client's messages once the router's additions
+    and the generation reserve are taken out of a context window."""
+    return (window - CONTEXT_RESERVE_TOKENS - MESSAGE_OVERHEAD_TOKENS
+            - TOKENS.count_text(system_prompt) - TOKENS.count_text(date_ctx))
+
+
+def trim_messages(messages: list, budget: int):
+    """Drop the oldest turns until the conversation fits the budget.
+
+    System messages and the latest user turn (the last user message and
+    everything after it) are always kept.  Older messages go a whole turn
+    at a time — a user message plus the replies that follow it — so the
+    result still alternates the way chat templates expect.
+
+    Returns:
+        (kept messages, number of messages dropped, token count of kept)
+    """
+    last_user = max((i for i, m in enumerate(messages) if m.get('role') == 'user'), default=len(messages))
+    droppable = [i for i in range(last_user) if messages[i].get('role') != 'system']
+    counts = [TOKENS.count_message(m) for m in messages]
+    total = sum(counts)
+
+    dropped = set()
+    while total > budget and droppable:
+        i = droppable.pop(0)
+        dropped.add(i)
+        total -= counts[i]
+        # Take the rest of this turn with it
+        while droppable and messages[droppable[0]].get('role') != 'user':
+            i = droppable.pop(0)
+            dropped.add(i)
+            total -= counts[i]
+
+    kept = [m for i, m in enumerate(messages) if i not in dropped]
+    return kept, len(dropped), total
+
+
+def fit_context(messages: list, date_ctx: str) -> dict:
+    """Measure a conversation against the primary's window and apply
+    CONTEXT_OVERFLOW_POLICY if it doesn't fit.
+
+    Returns a dict with 'tokens' (client messages), 'budget', 'exact',
+    'action' — None (fits), 'trimmed', 'xai' or 'over' (can't be made to
+    fit) — and, when messages were dropped, 'messages' (the shortened list)
+    and 'dropped'.  With action 'xai' the request should skip
+    classification and go straight to xAI.
+    """
+    tokens = TOKENS.count_messages(messages)
+    budget = prompt_budget(PRIMARY_CONTEXT_TOKENS, PRIMARY_SYSTEM_PROMPT, date_ctx)
+    result = {'tokens': tokens, 'budget': budget, 'exact': TOKENS.exact, 'action': None}
+    if tokens <= budget:
+        return result
+
+    if CONTEXT_OVERFLOW_POLICY != 'xai' or not XAI_API_KEY:
+        kept, dropped, kept_tokens = trim_messages(messages, budget)
+        if kept_tokens <= budget or not XAI_API_KEY:
+            # 'over': nothing left to drop and nowhere bigger to send it
+            result.update(action='trimmed' if dropped else 'over',
+                          messages=kept, dropped=dropped, kept_tokens=kept_tokens)
+            return result
+
+    # xAI's window is far larger, but not unbounded
+    result['action'] = 'xai'
+    xai_budget = prompt_budget(XAI_CONTEXT_TOKENS, XAI_SYSTEM_PROMPT, date_ctx)
+    if tokens > xai_budget:
+        kept, dropped, kept_tokens = trim_messages(messages, xai_budget)
+        result.update(messages=kept, dropped=dropped, kept_tokens=kept_tokens)
+    return result
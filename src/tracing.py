@@ -0,0 +1,260 @@
+"""Request tracing: nested, concurrent spans exported as OTLP/JSON.
+
+Session steps are flat and sequential, but a request's work isn't —
+classification runs alongside the speculative primary (and sometimes a
+speculative enrichment search), and hedged calls run alongside their
+originals.  Each chat request gets a Trace whose root span covers the
+whole request; pipeline stages open child spans with
+
+    with span('classification', route_hint=...) as s:
+        ...
+        s.set(decision=decision)
+
+and every outbound HTTP call made through src/transport.py becomes a
+client span under whichever span is current.  The current span lives in a
+context variable, so work handed to a thread pool carries it along when
+submitted through in_context().  Outside a traced request span() does
+nothing.
+
+Finished traces are written by a background thread, per TRACE_EXPORT, to
+LOG_DIR/traces.jsonl (one OTLP ExportTraceServiceRequest per line, as the
+OpenTelemetry file exporter writes them) or POSTed to an OTLP/HTTP
+collector.  `python -m src.waterfall <session-id>` renders one as a
+waterfall.
+"""
+
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from src.config import logger, LOG_DIR, TRACE_EXPORT
+from src.codec import dumps
+from src.profiler import current_profile
+
+TRACE_FILE = os.path.join(LOG_DIR, 'traces.jsonl')
+# traces.jsonl is moved to traces.jsonl.1 past this size
+TRACE_FILE_MAX_BYTES = 20 * 1024 * 1024
+SERVICE_NAME = 'ai-router'
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar('span', default=None)
+_export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='trace-export')
+_file_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(self, trace, name, parent, kind, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.kind = kind
+        self.start = time.time()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = str(error)
+
+    def finish(self, end=None):
+        if self.end is None:
+            self.end = end or time.time()
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            # OTLP/JSON carries 64-bit integers as strings
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end or time.time()) * 1e9)),
+            'attributes': _attributes(self.attributes),
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {'code': STATUS_OK},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NullSpan:
+    """Stands in for a span outside a traced request."""
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def finish(self, end=None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """The spans of one request, rooted at a 'request' span."""
+
+    def __init__(self, session, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.session = session
+        self._spans = []
+        self._lock = threading.Lock()
+        self._exported = False
+        self.root = self.start_span('request', None, KIND_SERVER, {'session.id': session.id, **attributes})
+
+    def start_span(self, name, parent, kind, attributes):
+        span = Span(self, name, parent, kind, attributes)
+        with self._lock:
+            self._spans.append(span)
+        return span
+
+    def finish(self, **attributes):
+        """End the request span and export the trace (once)."""
+        with self._lock:
+            if self._exported:
+                return
+            self._exported = True
+        self.root.set(route=self.session.data.get('route'), error=self.session.data.get('error'), **attributes)
+        self.root.finish()
+        _export_pool.submit(_export, self)
+
+    def to_otlp(self):
+        with self._lock:
+            spans = [s.to_otlp() for s in self._spans]
+        return {'resourceSpans': [{
+            'resource': {'attributes': _attributes({'service.name': SERVICE_NAME, 'process.pid': os.getpid()})},
+            'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': spans}],
+        }]}
+
+
+def _attributes(values):
+    attributes = []
+    for key, value in values.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {'boolValue': value}
+        elif isinstance(value, int):
+            typed = {'intValue': str(value)}
+        elif isinstance(value, float):
+            typed = {'doubleValue': value}
+        else:
+            typed = {'stringValue': str(value)}
+        attributes.append({'key': key, 'value': typed})
+    return attributes
+
+
+@contextmanager
+def trace_request(session, **attributes):
+    """Trace a request handler: spans opened in the block (and in work it
+    hands off through in_context) attach to the yielded trace.  Yields None
+    when TRACE_EXPORT is 'off'."""
+    if TRACE_EXPORT == 'off':
+        yield None
+        return
+    trace = Trace(session, **attributes)
+    session.data['trace_id'] = trace.trace_id
+    # Request threads are reused; don't leave this trace current after
+    token = _current.set(trace.root)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def finish_trace(trace, result, **attributes):
+    """End a trace when the handler's response is done — on close for a
+    stream, now otherwise.  Returns result unchanged."""
+    if trace is None:
+        return result
+    response = result[0] if isinstance(result, tuple) else result
+    attributes['http.status_code'] = result[1] if isinstance(result, tuple) else response.status_code
+    if response.is_streamed:
+        response.call_on_close(lambda: trace.finish(**attributes))
+    else:
+        trace.finish(**attributes)
+    return result
+
+
+def current_span():
+    return _current.get() or NULL_SPAN
+
+
+@contextmanager
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """A child of the current span, current itself while the block runs."""
+    parent = _current.get()
+    if parent is None:
+        yield NULL_SPAN
+        return
+    child = parent.trace.start_span(name, parent, kind, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def traced(name):
+    """Decorator: run the function in a span called name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_context(fn):
+    """fn bound to the caller's context, for submitting to another thread.
+    A request profile (src/profiler.py) follows it there too."""
+    return functools.partial(contextvars.copy_context().run, _followed, fn)
+
+
+def _followed(fn, *args, **kwargs):
+    profile = current_profile()
+    if profile is None:
+        return fn(*args, **kwargs)
+    with profile.thread():
+        return fn(*args, **kwargs)
+
+
+def _export(trace):
+    try:
+        payload = dumps(trace.to_otlp(), default=str)
+        if TRACE_EXPORT == 'file':
+            with _file_lock:
+                if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_BYTES:
+                    os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+                with open(TRACE_FILE, 'ab') as f:
+                    f.write(payload + b'\n')
+        else:
+            # Imported here: transport traces its own calls
+            from src.transport import HTTP
+            HTTP.post(f"{TRACE_EXPORT.rstrip('/')}/v1/traces", data=payload,
+                      headers={'Content-Type': 'application/json'}, timeout=5)
+    except Exception as e:
+        logger.warning(f"Trace export failed for session {trace.session.id}: {e}")
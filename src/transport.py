@@ -0,0 +1,325 @@
+"""Shared outbound HTTP session: pooled keep-alive connections, unix:// sockets.
+
+Every backend call goes through HTTP (a single requests.Session) instead of
+the module-level requests.post/get, which open a fresh TCP connection per
+call.  Base URLs of the form unix:///path/to/socket are served by a
+UnixAdapter mounted on that prefix, so co-located vLLM containers sharing a
+socket volume skip the Docker bridge TCP stack entirely.  Everything else
+in the code keeps building URLs as f"{base_url}/v1/...".  Calls made during
+a traced request are recorded as client spans (src/tracing.py).
+
+Each call's time is split into connection phases, so a slow TLS handshake,
+a DNS lookup inside Docker and a backend queueing the request no longer
+all read as one "time to headers":
+
+  dns      — resolving the host (new connections only)
+  connect  — TCP or unix socket connect (new connections only)
+  tls      — TLS handshake (new https connections only)
+  write    — sending the request line, headers and body
+  ttfb     — waiting for the response headers (backend queueing + prefill)
+  body     — reading the response body (not for streamed calls)
+
+The phases are attached to the response as response.phases (milliseconds,
+plus reused=True when a pooled connection was reused), to the call's span
+and — by src/providers.py — to its session step, and are aggregated per
+backend base URL and endpoint in /stats (connection_phases), failed calls
+(refused connections, DNS failures, timeouts) included.
+"""
+
+import contextvars
+import socket
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NameResolutionError, NewConnectionError
+
+from src.config import logger, ROUTER_URLS, PRIMARY_URLS, XAI_API_URL, OUTBOUND_POOL_MAXSIZE
+from src.shared_state import SharedState
+from src.tracing import span, KIND_CLIENT
+
+UNIX_SCHEME = 'unix://'
+PHASES = ('dns', 'connect', 'tls', 'write', 'ttfb', 'body')
+# Phases spent establishing a connection, which can happen inside another
+# (plain http connects lazily while writing the request)
+CONNECTION_PHASES = ('dns', 'connect', 'tls')
+
+_recording = contextvars.ContextVar('phases', default=None)
+_PHASE_STATS = SharedState('connection-phases')
+# Configured backend base URLs, longest first, so a base with a path (or a
+# unix:// socket path) is matched whole
+_BACKEND_BASES = sorted({u.rstrip('/') for u in ROUTER_URLS + PRIMARY_URLS + [XAI_API_URL]}, key=len, reverse=True)
+
+
+def is_unix_url(url: str) -> bool:
+    return url.startswith(UNIX_SCHEME)
+
+
+class Phases:
+    """Connection phase durations of one outbound call."""
+
+    def __init__(self):
+        self.ms = {}
+        self.reused = True
+        self.headers_at = None
+
+    def add(self, phase, seconds):
+        self.ms[phase] = self.ms.get(phase, 0) + seconds * 1000
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def connecting_ms(self):
+        return sum(self.ms.get(phase, 0) for phase in CONNECTION_PHASES)
+
+    def to_dict(self) -> dict:
+        phases = {f"{phase}_ms": round(self.ms[phase], 1) for phase in PHASES if phase in self.ms}
+        phases['reused'] = self.reused
+        return phases
+
+
+def _open(conn, new_conn):
+    """Resolve and connect, timing each: new_conn connects to
+    conn._dns_host, which is pointed at each resolved address in turn."""
+    phases = _recording.get()
+    if phases is None:
+        return new_conn()
+    phases.reused = False
+    host = conn._dns_host
+    try:
+        with phases.timed('dns'):
+            infos = socket.getaddrinfo(host, conn.port, 0, socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise NameResolutionError(conn.host, conn, e) from e
+    error = None
+    try:
+        for address in dict.fromkeys(info[4][0] for info in infos):
+            conn._dns_host = address
+            try:
+                with phases.timed('connect'):
+                    return new_conn()
+            except NewConnectionError as e:
+                error = e
+        raise error
+    finally:
+        conn._dns_host = host
+
+
+class _TimedRequest:
+    """Connection mixin timing the request write and the wait for headers."""
+
+    def request(self, *args, **kwargs):
+        phases = _recording.get()
+        if phases is None:
+            return super().request(*args, **kwargs)
+        before = phases.connecting_ms()
+        start = time.perf_counter()
+        super().request(*args, **kwargs)
+        # A lazy connect inside the write is already counted
+        phases.add('write', time.perf_counter() - start - (phases.connecting_ms() - before) / 1000)
+
+    def getresponse(self, *args, **kwargs):
+        phases = _recording.get()
+        if phases is None:
+            return super().getresponse(*args, **kwargs)
+        with phases.timed('ttfb'):
+            response = super().getresponse(*args, **kwargs)
+        phases.headers_at = time.perf_counter()
+        return response
+
+
+class TimedHTTPConnection(_TimedRequest, HTTPConnection):
+    def _new_conn(self):
+        return _open(self, super()._new_conn)
+
+
+class TimedHTTPSConnection(_TimedRequest, HTTPSConnection):
+    def _new_conn(self):
+        return _open(self, super()._new_conn)
+
+    def connect(self):
+        phases = _recording.get()
+        if phases is None:
+            return super().connect()
+        before = phases.connecting_ms()
+        start = time.perf_counter()
+        super().connect()
+        phases.add('tls', time.perf_counter() - start - (phases.connecting_ms() - before) / 1000)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record their phases."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class UnixHTTPConnection(_TimedRequest, HTTPConnection):
+    """urllib3 connection that dials an AF_UNIX socket instead of host:port."""
+
+    def __init__(self, *args, socket_path=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        phases = _recording.get()
+        if phases is not None:
+            phases.reused = False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        timeout = self.timeout if isinstance(self.timeout, (int, float)) else None
+        sock.settimeout(timeout)
+        start = time.perf_counter()
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            if phases is not None:
+                phases.add('connect', time.perf_counter() - start)
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+
+class UnixAdapter(HTTPAdapter):
+    """Transport adapter for one unix:// base URL.
+
+    requests passes non-http URLs through unparsed, so the adapter receives
+    e.g. unix:///run/vllm/primary.sock/v1/chat/completions, strips its own
+    base, and sends /v1/chat/completions over a pooled socket connection
+    with Host: localhost.
+    """
+
+    def __init__(self, base_url, pool_maxsize):
+        self.base_url = base_url.rstrip('/')
+        self.socket_path = self.base_url[len(UNIX_SCHEME):]
+        self._pool = UnixHTTPConnectionPool(
+            'localhost', maxsize=pool_maxsize, block=False, socket_path=self.socket_path,
+        )
+        super().__init__(pool_maxsize=pool_maxsize)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._pool
+
+    def get_connection(self, url, proxies=None):
+        return self._pool
+
+    def request_url(self, request, proxies):
+        return request.url[len(self.base_url):] or '/'
+
+    def close(self):
+        self._pool.close()
+        super().close()
+
+
+def _backend_endpoint(url) -> tuple:
+    """(backend base URL, endpoint path) of an outbound call's URL."""
+    url = url.split('?', 1)[0]
+    for base in _BACKEND_BASES:
+        if url.startswith(base + '/'):
+            return base, url[len(base):]
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}", parts.path or '/'
+
+
+def _record(url, phases, error):
+    base, endpoint = _backend_endpoint(url)
+
+    def _add(stats):
+        entry = stats.setdefault(base, {}).setdefault(endpoint, {
+            'calls': 0, 'errors': 0, 'new_connections': 0, 'total_ms': {}, 'counts': {}, 'max_ms': {},
+        })
+        entry['calls'] += 1
+        entry['errors'] += error
+        entry['new_connections'] += not phases.reused
+        for phase, ms in phases.ms.items():
+            entry['total_ms'][phase] = entry['total_ms'].get(phase, 0) + ms
+            entry['counts'][phase] = entry['counts'].get(phase, 0) + 1
+            entry['max_ms'][phase] = max(entry['max_ms'].get(phase, 0), ms)
+
+    _PHASE_STATS.update(_add)
+
+
+def connection_phase_stats() -> dict:
+    """Per backend base URL and endpoint: calls, failed calls, new
+    connections, and the mean and max of each phase over the calls that
+    had it."""
+    stats = {}
+    for base, endpoints in _PHASE_STATS.read().items():
+        for endpoint, entry in endpoints.items():
+            stats.setdefault(base, {})[endpoint] = {
+                'calls': entry['calls'],
+                'errors': entry['errors'],
+                'new_connections': entry['new_connections'],
+                'avg_ms': {phase: round(entry['total_ms'][phase] / entry['counts'][phase], 1)
+                           for phase in PHASES if phase in entry['counts']},
+                'max_ms': {phase: round(entry['max_ms'][phase], 1) for phase in PHASES if phase in entry['max_ms']},
+            }
+    return stats
+
+
+class TracedSession(requests.Session):
+    """A Session whose calls are client spans of the current trace
+    (src/tracing.py), with their connection phases recorded.  A streamed
+    call's span ends at the response headers.  Phases are recorded for
+    calls that raise too — those are the ones worth diagnosing."""
+
+    def request(self, method, url, *args, **kwargs):
+        phases = Phases()
+        token = _recording.set(phases)
+        failed = True
+        try:
+            with span(f"HTTP {method}", kind=KIND_CLIENT, **{'http.method': method, 'http.url': url}) as s:
+                response = super().request(method, url, *args, **kwargs)
+                # Non-streamed bodies are read before requests returns
+                if not kwargs.get('stream') and phases.headers_at is not None:
+                    phases.add('body', time.perf_counter() - phases.headers_at)
+                response.phases = phases.to_dict()
+                s.set(**{'http.status_code': response.status_code},
+                      **{f"net.{name}": value for name, value in response.phases.items()})
+                if response.status_code >= 500:
+                    s.fail(f"status {response.status_code}")
+            failed = False
+            return response
+        finally:
+            _recording.reset(token)
+            _record(url, phases, failed)
+
+
+def _build_session():
+    session = TracedSession()
+    adapter = TimedAdapter(pool_connections=8, pool_maxsize=OUTBOUND_POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    for url in dict.fromkeys(ROUTER_URLS + PRIMARY_URLS):
+        if is_unix_url(url):
+            session.mount(url.rstrip('/'), UnixAdapter(url, OUTBOUND_POOL_MAXSIZE))
+            logger.info(f"Using unix socket transport for {url}")
+    return session
+
+
+HTTP = _build_session()
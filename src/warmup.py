@@ -0,0 +1,131 @@
+"""Startup warm-up: pre-connect backend pools and prime vLLM prefix caches.
+
+Right after a deploy every backend call would otherwise pay for a fresh
+TCP (and, for xAI, TLS) connection, and the first classification and
+primary request would each prefill their long system prompt from scratch.
+warm_up() front-loads both costs before the process reports ready.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import (
+    logger, date_context,
+    XAI_API_KEY, XAI_API_URL,
+    PRIMARY_MODEL,
+    PRIMARY_SYSTEM_PROMPT, ROUTING_PROMPT,
+    WARMUP_CONNECTIONS,
+)
+from src.transport import HTTP
+from src.codec import dumps, JSON_HEADERS
+from src.backends import ROUTER_POOL, PRIMARY_POOL
+from src.providers import build_classify_messages, inject_system_prompt
+
+# Priming waits for one prefill of each system prompt — seconds on a cold GPU
+PRIME_TIMEOUT = 30
+
+_ready = threading.Event()
+_thread = None
+
+
+def is_ready() -> bool:
+    """True once this process has finished (or skipped) warm-up."""
+    return _ready.is_set()
+
+
+def _connect(url, headers=None):
+    try:
+        HTTP.get(url, headers=headers, timeout=5)
+        return True
+    except Exception:
+        return False
+
+
+def _prime(base_url, payload):
+    start = time.time()
+    try:
+        response = HTTP.post(f"{base_url}/v1/chat/completions", data=dumps(payload),
+                             headers=JSON_HEADERS, timeout=PRIME_TIMEOUT)
+        ok = response.status_code == 200
+    except Exception:
+        ok = False
+    return ok, (time.time() - start) * 1000
+
+
+def _priming_payloads():
+    """One-token requests laid out exactly like real classification/primary calls."""
+    date_ctx = date_context()
+    classify = {
+        "messages": build_classify_messages(
+            ROUTING_PROMPT.format(query='ping', truncation_note=''), date_ctx
+        ),
+        "temperature": 0.0,
+        "max_tokens": 1,
+    }
+    primary_messages = [{"role": "user", "content": "ping"}]
+    inject_system_prompt(primary_messages, PRIMARY_SYSTEM_PROMPT, date_ctx)
+    primary = {"model": PRIMARY_MODEL, "messages": primary_messages, "max_tokens": 1}
+    return classify, primary
+
+
+def warm_up():
+    """Open pooled connections to every backend and prime prompt prefixes.
+
+    Failures are logged, not raised: a backend that is still loading just
+    starts cold, and /health reports its state as usual once warm-up ends.
+    """
+    start = time.time()
+    classify, primary = _priming_payloads()
+
+    targets = [(url, f"{url}/health", None) for url in ROUTER_POOL.urls + PRIMARY_POOL.urls]
+    if XAI_API_KEY:
+        targets.append((XAI_API_URL, f"{XAI_API_URL}/v1/models",
+                        {'Authorization': f'Bearer {XAI_API_KEY}'}))
+    primes = [(url, classify) for url in ROUTER_POOL.urls]
+    primes += [(url, primary) for url in PRIMARY_POOL.urls]
+
+    # Concurrent requests to one host each need their own connection, and
+    # every one of them goes back to the pool when it completes.
+    with ThreadPoolExecutor(max_workers=len(targets) * WARMUP_CONNECTIONS + len(primes)) as pool:
+        connects = {
+            base: [pool.submit(_connect, url, headers) for _ in range(WARMUP_CONNECTIONS)]
+            for base, url, headers in targets
+        }
+        primed = {base: pool.submit(_prime, base, payload) for base, payload in primes}
+
+        for base, futures in connects.items():
+            opened = sum(f.result() for f in futures)
+            ok = opened > 0
+            line = f"Warm-up: {base} connections={opened}/{WARMUP_CONNECTIONS}"
+            if base in primed:
+                primed_ok, prime_ms = primed[base].result()
+                ok = ok and primed_ok
+                line += f" primed={'yes' if primed_ok else 'no'} prime_ms={prime_ms:.0f}"
+            if ok:
+                logger.info(line)
+            else:
+                logger.warning(line)
+
+    logger.info(f"Warm-up complete in {(time.time() - start) * 1000:.0f}ms")
+
+
+def start_warmup():
+    """Run warm-up in the background; is_ready() flips when it finishes."""
+    global _thread
+    if _thread is not None:
+        return
+    if WARMUP_CONNECTIONS <= 0:
+        _ready.set()
+        return
+
+    def _run():
+        try:
+            warm_up()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+        finally:
+            _ready.set()
+
+    _thread = threading.Thread(target=_run, name='warmup', daemon=True)
+    _thread.start()
@@ -0,0 +1,138 @@
+"""Render a request's trace as a waterfall.
+
+Reads the OTLP/JSON traces src/tracing.py writes to LOG_DIR/traces.jsonl
+and draws the spans of one request — found by session id (the
+X-Request-Id header, or the id in a session log's file name) or trace id —
+on a shared time axis, children indented under their parents:
+
+    $ python -m src.waterfall 3f9c2a1b
+    request                      0ms   2346ms |██████████████████████████████| route=primary
+      context_fit                0ms      1ms |▏                             |
+      classification             1ms    512ms |██████▌                       | decision=SIMPLE
+        attempt                  1ms    511ms |██████▌                       |
+          HTTP POST              1ms    511ms |██████▌                       | http.status_code=200
+      speculative_primary        1ms   1830ms |███████████████████████▍      |
+      ...
+
+Only the standard library is used, so it runs anywhere the log directory
+is readable (`make trace SESSION=<id>` on the host).
+"""
+
+import argparse
+import json
+import os
+import sys
+
+WIDTH = 40
+NAME_WIDTH = 28
+ERROR_WIDTH = 60
+BLOCKS = ' ▏▎▍▌▋▊▉█'
+# Attributes worth showing next to a span's bar
+SHOWN_ATTRIBUTES = ('route', 'decision', 'reused', 'policy', 'backend', 'call', 'first',
+                    'http.method', 'http.status_code', 'net.reused', 'net.dns_ms', 'net.connect_ms',
+                    'net.tls_ms', 'net.ttfb_ms', 'error')
+
+
+def _value(typed):
+    for kind in ('stringValue', 'boolValue', 'doubleValue'):
+        if kind in typed:
+            return typed[kind]
+    if 'intValue' in typed:
+        return int(typed['intValue'])
+    return None
+
+
+def _spans(document):
+    for resource in document.get('resourceSpans', []):
+        for scope in resource.get('scopeSpans', []):
+            for span in scope.get('spans', []):
+                yield {
+                    'id': span['spanId'],
+                    'parent': span.get('parentSpanId'),
+                    'trace': span['traceId'],
+                    'name': span['name'],
+                    'start': int(span['startTimeUnixNano']) / 1e6,
+                    'end': int(span['endTimeUnixNano']) / 1e6,
+                    'attributes': {a['key']: _value(a['value']) for a in span.get('attributes', [])},
+                    'error': span.get('status', {}).get('message'),
+                }
+
+
+def find_trace(paths, request_id):
+    """Spans of the trace whose session id or trace id starts with request_id."""
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if request_id not in line:
+                    continue
+                spans = list(_spans(json.loads(line)))
+                for span in spans:
+                    if (str(span['attributes'].get('session.id', '')).startswith(request_id)
+                            or span['trace'].startswith(request_id)):
+                        return spans
+    return None
+
+
+def _bar(start, end, origin, scale):
+    """A WIDTH-character bar with eighth-block resolution at both ends."""
+    left = (start - origin) * scale
+    right = max((end - origin) * scale, left + 1 / 8)
+    cells = []
+    for i in range(WIDTH):
+        filled = min(right, i + 1) - max(left, i)
+        cells.append(BLOCKS[round(max(0, min(1, filled)) * 8)])
+    return ''.join(cells)
+
+
+def render(spans):
+    """The waterfall as lines of text."""
+    children = {}
+    for span in sorted(spans, key=lambda s: s['start']):
+        children.setdefault(span['parent'], []).append(span)
+    ids = {s['id'] for s in spans}
+    roots = [s for s in spans if s['parent'] not in ids]
+    origin = min(s['start'] for s in spans)
+    total = max(s['end'] for s in spans) - origin
+    scale = WIDTH / total if total > 0 else 0
+
+    lines = []
+
+    def _draw(span, depth):
+        name = ('  ' * depth + span['name'])[:NAME_WIDTH]
+        shown = [f"{k}={span['attributes'][k]}" for k in SHOWN_ATTRIBUTES if k in span['attributes']]
+        if span['error']:
+            error = span['error']
+            shown.append(f"! {error[:ERROR_WIDTH - 1] + '…' if len(error) > ERROR_WIDTH else error}")
+        lines.append(f"{name:<{NAME_WIDTH}} {span['start'] - origin:>7.0f}ms {span['end'] - span['start']:>7.0f}ms"
+                     f" |{_bar(span['start'], span['end'], origin, scale)}| {' '.join(shown)}".rstrip())
+        for child in children.get(span['id'], []):
+            _draw(child, depth + 1)
+
+    for root in sorted(roots, key=lambda s: s['start']):
+        _draw(root, 0)
+    return lines
+
+
+def main():
+    log_dir = os.getenv('LOG_DIR', 'logs')
+    default_file = os.path.join(log_dir, 'traces.jsonl')
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('request_id', help='Session id (X-Request-Id) or trace id, or a prefix of either')
+    parser.add_argument('--file', default=default_file, help=f'Trace file (default: {default_file})')
+    args = parser.parse_args()
+
+    # Newest first: the rotated file holds older traces
+    spans = find_trace([args.file, f"{args.file}.1"], args.request_id)
+    if not spans:
+        print(f"No trace for {args.request_id} in {args.file}", file=sys.stderr)
+        sys.exit(1)
+    root = next((s for s in spans if s['parent'] is None), spans[0])
+    session_id = root['attributes'].get('session.id', '-')
+    print(f"trace {root['trace']}  session {session_id}")
+    print('\n'.join(render(spans)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""Stub backends for hermetic benchmarks: vLLM (router, primary) and xAI.
+
+    python -m stubs                       # all three on 18001 / 18000 / 18004
+    python -m stubs --primary tokens_per_s=40,max_concurrency=2 --xai failure_rate=0.2
+
+then run the router against them with the environment it prints.  In a
+benchmark script, start_stubs() runs them on background threads and
+router_env() gives the matching environment.  See stubs/latency.py for
+the latency model fields.
+"""
+
+from stubs.latency import LatencyModel
+from stubs.server import Stub, StubServer, start_stubs, router_env
+
+__all__ = ['LatencyModel', 'Stub', 'StubServer', 'start_stubs', 'router_env']
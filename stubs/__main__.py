@@ -0,0 +1,43 @@
+"""Run the stub backends until interrupted: python -m stubs --help"""
+
+import argparse
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stubs.latency import DEFAULTS  # noqa: E402
+from stubs.server import start_stubs, router_env  # noqa: E402
+
+PORTS = {'router': 18001, 'primary': 18000, 'xai': 18004}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split(':')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for delays and failures')
+    for kind, port in PORTS.items():
+        parser.add_argument(f'--{kind}', default='', metavar='SPEC',
+                            help=f"Latency spec (defaults: {','.join(f'{k}={v}' for k, v in DEFAULTS[kind].items())})")
+        parser.add_argument(f'--{kind}-port', type=int, default=port, help=f'Port (default {port}; -1 to skip)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ports = {kind: None if getattr(args, f'{kind}_port') < 0 else getattr(args, f'{kind}_port') for kind in PORTS}
+    servers = start_stubs({kind: getattr(args, kind) for kind in PORTS}, args.host, ports, args.seed)
+    for kind, server in servers.items():
+        print(f"{kind:>8}  {server.url}  {server.stub.latency.describe()}")
+    print('\nRun the router against them with:\n')
+    print(' '.join(f"{name}={value}" for name, value in router_env(servers).items()) + ' python router.py')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Latency, throughput, queueing and failure models for stub backends.
+
+A LatencyModel is configured from a comma-separated spec, e.g.
+
+    ttft_ms=50,prefill_ms_per_1k=30,tokens_per_s=80,max_concurrency=8,failure_rate=0.01
+
+Fields (all optional; defaults per backend kind in DEFAULTS):
+
+  ttft_ms             fixed time before the first token (scheduling, first forward pass)
+  prefill_ms_per_1k   extra time to first token per 1,000 prompt tokens
+  tokens_per_s        decode rate once generation has started
+  jitter              sigma of a log-normal factor applied to every delay (0: none)
+  max_concurrency     requests generating at once; more wait in a queue,
+                      reported as vllm:num_requests_waiting (0: unlimited)
+  max_context_tokens  longer prompts get vLLM's 400 context-length error (0: no limit)
+  answer_tokens       tokens in an answer, capped by the request's max_tokens
+  reasoning_tokens    tokens of <think> reasoning before the answer
+  search_ms           time an xAI /v1/responses call spends on its search tools
+  failure_rate        share of requests answered with failure_status at once
+  failure_status      status of those failures (503, 429, 500, ...)
+  stall_rate          share of requests that wait stall_s before answering
+                      (exercises client timeouts and hedging)
+  stall_s             length of a stall
+  drop_rate           share of streams cut off mid-generation, without [DONE]
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULTS = {
+    # Orchestrator 8B: short prompts, a few dozen tokens of reasoning and one word
+    'router': dict(ttft_ms=25, prefill_ms_per_1k=15, tokens_per_s=150, max_concurrency=16,
+                   answer_tokens=1, reasoning_tokens=24),
+    # Nano 30B on one GPU
+    'primary': dict(ttft_ms=40, prefill_ms_per_1k=30, tokens_per_s=80, max_concurrency=8,
+                    max_context_tokens=32768, answer_tokens=120, reasoning_tokens=40),
+    # api.x.ai over the internet
+    'xai': dict(ttft_ms=350, prefill_ms_per_1k=5, tokens_per_s=120, answer_tokens=300,
+                reasoning_tokens=0, search_ms=2500),
+}
+
+_FIELDS = {
+    'ttft_ms': float, 'prefill_ms_per_1k': float, 'tokens_per_s': float, 'jitter': float,
+    'max_concurrency': int, 'max_context_tokens': int, 'answer_tokens': int, 'reasoning_tokens': int,
+    'search_ms': float, 'failure_rate': float, 'failure_status': int, 'stall_rate': float,
+    'stall_s': float, 'drop_rate': float,
+}
+
+
+class LatencyModel:
+    """Delays and failures for one stub backend, plus its request queue."""
+
+    def __init__(self, ttft_ms=0, prefill_ms_per_1k=0, tokens_per_s=100, jitter=0.1, max_concurrency=0,
+                 max_context_tokens=0, answer_tokens=100, reasoning_tokens=0, search_ms=0,
+                 failure_rate=0, failure_status=503, stall_rate=0, stall_s=30, drop_rate=0, seed=None):
+        self.ttft_ms = ttft_ms
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.tokens_per_s = tokens_per_s
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.max_context_tokens = max_context_tokens
+        self.answer_tokens = answer_tokens
+        self.reasoning_tokens = reasoning_tokens
+        self.search_ms = search_ms
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self._slots = threading.Semaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    @classmethod
+    def from_spec(cls, kind, spec='', seed=None):
+        """The kind's defaults overridden by a 'name=value,...' spec."""
+        params = dict(DEFAULTS.get(kind, {}))
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            name, _, value = item.partition('=')
+            if name not in _FIELDS:
+                raise ValueError(f"unknown latency field {name!r} (known: {', '.join(_FIELDS)})")
+            params[name] = _FIELDS[name](value)
+        return cls(seed=seed, **params)
+
+    def describe(self) -> str:
+        return ','.join(f"{name}={getattr(self, name)}" for name in _FIELDS)
+
+    def _jittered(self, seconds):
+        if self.jitter <= 0 or seconds <= 0:
+            return seconds
+        return seconds * self._random.lognormvariate(0, self.jitter)
+
+    def chance(self, rate) -> bool:
+        return rate > 0 and self._random.random() < rate
+
+    def first_token_delay(self, prompt_tokens) -> float:
+        """Seconds from admission to the first token."""
+        return self._jittered((self.ttft_ms + self.prefill_ms_per_1k * prompt_tokens / 1000) / 1000)
+
+    def token_delay(self) -> float:
+        """Seconds between tokens."""
+        if self.tokens_per_s <= 0:
+            return 0
+        return self._jittered(1 / self.tokens_per_s)
+
+    def search_delay(self) -> float:
+        return self._jittered(self.search_ms / 1000)
+
+    @contextmanager
+    def slot(self):
+        """Hold a generation slot, queueing behind max_concurrency."""
+        with self._lock:
+            self.waiting += 1
+        if self._slots is not None:
+            self._slots.acquire()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+    def cache_usage(self) -> float:
+        """Stand-in for KV cache usage: the share of slots in use."""
+        if not self.max_concurrency:
+            return 0.0
+        return min(1.0, self.running / self.max_concurrency)
+
+
+def sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
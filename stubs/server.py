@@ -0,0 +1,392 @@
+"""Stub backends: the HTTP surface of vLLM and xAI that the router uses.
+
+  router   vLLM serving the Orchestrator 8B classifier: /v1/chat/completions
+           answers <think>…</think> and one of SIMPLE / MODERATE / COMPLEX /
+           ENRICH for the query in the routing prompt
+  primary  vLLM serving Nano 30B: /v1/chat/completions, streamed or not, with
+           reasoning in reasoning_content (as vLLM's reasoning parser
+           returns it) unless chat_template_kwargs.enable_thinking is false
+  xai      api.x.ai: /v1/chat/completions and /v1/responses (enrichment
+           search), accepting any API key
+
+All three serve /health, /v1/models and a vLLM-style /metrics (running and
+waiting requests from the stub's own queue), and /stub/stats with request
+counts.  Timing and failures come from each stub's LatencyModel
+(stubs/latency.py).
+
+The servers are http.server with HTTP/1.1 keep-alive, as vLLM's uvicorn
+is — werkzeug's development server closes every connection, which would
+put a TCP connect back into every call the router's pool reuses.
+
+The classifier stub decides from keywords in the query, close to what the
+real classifier does with the routing prompt; a query can also force its
+route with a [stub:simple|moderate|complex|enrich] marker.
+"""
+
+import itertools
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.codec import dumps, loads
+from stubs.latency import LatencyModel, sleep
+
+MODELS = {
+    'router': 'cyankiwi/Nemotron-Orchestrator-8B-AWQ-4bit',
+    'primary': 'unsloth/NVIDIA-Nemotron-3-Nano-30B-A3B-NVFP4',
+    'xai': 'grok-4-1-fast-reasoning',
+}
+
+_MARKER = re.compile(r'\[stub:(simple|moderate|complex|enrich)\]', re.IGNORECASE)
+_QUERY = re.compile(r'User query: "(.*)"', re.DOTALL)
+ENRICH_WORDS = ('today', 'tonight', 'tomorrow', 'yesterday', 'right now', 'current', 'latest', 'recent',
+                'news', 'this week', 'this month', 'this year', 'next week', 'open now', 'price of')
+COMPLEX_WORDS = ('novel', 'prove', 'research', 'propose', 'quantum', 'design a', 'implications')
+MODERATE_WORDS = ('explain', 'compare', 'debug', 'how does', 'why does', 'write a', 'difference between')
+
+VOCAB = ('the', 'router', 'sends', 'each', 'query', 'to', 'a', 'model', 'that', 'fits', 'its', 'cost',
+         'and', 'latency', 'budget', 'while', 'keeping', 'context', 'warm', 'in', 'cache', 'so')
+
+
+class StreamDropped(Exception):
+    """Raised by a stream the latency model decided to cut off."""
+
+
+def classify(text) -> str:
+    """The classifier stub's decision for a routing prompt (or bare query)."""
+    match = _QUERY.search(text)
+    query = (match.group(1) if match else text).lower()
+    marker = _MARKER.search(query)
+    if marker:
+        return marker.group(1).upper()
+    for words, decision in ((ENRICH_WORDS, 'ENRICH'), (COMPLEX_WORDS, 'COMPLEX'), (MODERATE_WORDS, 'MODERATE')):
+        if any(word in query for word in words):
+            return decision
+    return 'SIMPLE'
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content or ''
+
+
+def prompt_tokens(messages) -> int:
+    """Rough token count: 4 characters per token, as src/tokens.py estimates."""
+    return sum(len(_text(m.get('content'))) for m in messages) // 4 + 4 * len(messages)
+
+
+def words(n):
+    """n tokens of filler text, one word each."""
+    return [f" {word}" for word in itertools.islice(itertools.cycle(VOCAB), n)]
+
+
+class Stub:
+    """One stub backend: its kind, model name, latency model and counters."""
+
+    def __init__(self, kind, latency: LatencyModel, model=None, script=None):
+        self.kind = kind
+        self.model = model or MODELS[kind]
+        self.latency = latency
+        # Optional script(kind, endpoint, data) -> recorded timing for this
+        # request, or None to use the latency model: a dict with any of
+        # first_token_s, total_s and answer (the classifier's word); missing
+        # times come from the latency model.  benchmarks/replay.py replays
+        # session logs through it.
+        self.script = script
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def failure(self, prompt):
+        """(status, error body) to send instead of an answer, or None."""
+        latency = self.latency
+        if latency.chance(latency.stall_rate):
+            self.count('stalled')
+            sleep(latency.stall_s)
+        if latency.chance(latency.failure_rate):
+            self.count('failed')
+            return latency.failure_status, {'object': 'error', 'message': 'stub failure',
+                                            'type': 'ServiceUnavailableError', 'code': latency.failure_status}
+        if latency.max_context_tokens and prompt > latency.max_context_tokens:
+            self.count('context_length')
+            return 400, {'object': 'error', 'type': 'BadRequestError', 'code': 400, 'message': (
+                f"This model's maximum context length is {latency.max_context_tokens} tokens. However, you"
+                f" requested {prompt} tokens in the messages. Please reduce the length of the messages.")}
+        return None
+
+    def recorded(self, endpoint, data):
+        if self.script is None:
+            return None
+        recorded = self.script(self.kind, endpoint, data)
+        if recorded is not None:
+            self.count('scripted')
+        return recorded
+
+    def delays(self, prompt, tokens, recorded):
+        """(seconds to the first token, callable giving each gap after it)."""
+        latency = self.latency
+        first = (recorded or {}).get('first_token_s')
+        if first is None:
+            first = latency.first_token_delay(prompt)
+        if (recorded or {}).get('total_s') is None:
+            return first, latency.token_delay
+        gap = max(0.0, recorded['total_s'] - first) / max(1, tokens - 1)
+        return first, lambda: gap
+
+    def plan(self, data, messages, recorded=None):
+        """(reasoning, answer, finish_reason) token lists for a chat request."""
+        thinking = (data.get('chat_template_kwargs') or {}).get('enable_thinking', True)
+        reasoning = words(self.latency.reasoning_tokens) if thinking else []
+        if self.kind == 'router':
+            answer = [(recorded or {}).get('answer')
+                      or classify(_text(messages[-1].get('content')) if messages else '')]
+        else:
+            answer = words(self.latency.answer_tokens)
+        limit = data.get('max_tokens') or data.get('max_completion_tokens')
+        finish_reason = 'stop'
+        if limit and len(reasoning) + len(answer) > limit:
+            reasoning = reasoning[:limit]
+            answer = answer[:max(0, limit - len(reasoning))]
+            finish_reason = 'length'
+        return reasoning, answer, finish_reason
+
+    def chat_completions(self, data):
+        """(status, body dict) — or (200, iterator of SSE frames) for a stream."""
+        messages = data.get('messages') or []
+        prompt = prompt_tokens(messages)
+        self.count('chat_completions')
+        failed = self.failure(prompt)
+        if failed is not None:
+            return failed
+        recorded = self.recorded('/v1/chat/completions', data)
+        reasoning, answer, finish_reason = self.plan(data, messages, recorded)
+        first, gap = self.delays(prompt, len(reasoning) + len(answer), recorded)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        if data.get('stream'):
+            include_usage = (data.get('stream_options') or {}).get('include_usage')
+            return 200, self._stream(completion_id, prompt, reasoning, answer, finish_reason, include_usage,
+                                     first, gap)
+
+        with self.latency.slot():
+            sleep(first)
+            sleep(sum(gap() for _ in range(len(reasoning) + len(answer) - 1)))
+        message = {'role': 'assistant', 'content': ''.join(answer).strip()}
+        if reasoning:
+            if self.kind == 'router':
+                # No reasoning parser on the classifier: <think> stays in the content
+                message['content'] = f"<think>{''.join(reasoning).strip()}</think>\n{message['content']}"
+            else:
+                message['reasoning_content'] = ''.join(reasoning).strip()
+        return 200, {'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()),
+                     'model': self.model,
+                     'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+                     'usage': _usage(prompt, len(reasoning) + len(answer))}
+
+    def _stream(self, completion_id, prompt, reasoning, answer, finish_reason, include_usage, first, gap):
+        latency = self.latency
+        with latency.slot():
+            sleep(first)
+            yield _chunk(completion_id, self.model, {'role': 'assistant', 'content': ''})
+            if self.kind == 'router' and reasoning:
+                answer = ['<think>'] + reasoning + ['</think>\n'] + answer
+                reasoning = []
+            tokens = [('reasoning_content', t) for t in reasoning] + [('content', t) for t in answer]
+            for i, (field, token) in enumerate(tokens):
+                if i:
+                    sleep(gap())
+                if latency.chance(latency.drop_rate / max(1, len(tokens))):
+                    self.count('dropped')
+                    raise StreamDropped()
+                yield _chunk(completion_id, self.model, {field: token})
+            yield _chunk(completion_id, self.model, {}, finish_reason)
+            if include_usage:
+                yield b'data: ' + dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'model': self.model,
+                                         'choices': [], 'usage': _usage(prompt, len(tokens))}) + b'\n\n'
+            yield b'data: [DONE]\n\n'
+
+    def responses(self, data):
+        """(status, body dict) for an xAI /v1/responses (search) call."""
+        items = data.get('input') or []
+        prompt = prompt_tokens(items if isinstance(items, list) else [{'content': items}])
+        self.count('responses')
+        failed = self.failure(prompt)
+        if failed is not None:
+            return failed
+        latency = self.latency
+        answer = words(min(latency.answer_tokens, data.get('max_output_tokens') or latency.answer_tokens))
+        recorded = self.recorded('/v1/responses', data)
+        with latency.slot():
+            if (recorded or {}).get('total_s') is not None:
+                sleep(recorded['total_s'])
+            else:
+                sleep(latency.search_delay() + latency.first_token_delay(prompt))
+                sleep(sum(latency.token_delay() for _ in range(len(answer) - 1)))
+        return 200, {'id': f"resp_{uuid.uuid4().hex[:24]}", 'object': 'response', 'model': self.model,
+                     'status': 'completed',
+                     'output': [{'type': 'message', 'role': 'assistant', 'content': [
+                         {'type': 'output_text', 'text': 'Search results:' + ''.join(answer)}]}],
+                     'usage': {'input_tokens': prompt, 'output_tokens': len(answer)}}
+
+    def metrics(self) -> str:
+        labels = f'{{model_name="{self.model}"}}'
+        return (f"vllm:num_requests_running{labels} {float(self.latency.running)}\n"
+                f"vllm:num_requests_waiting{labels} {float(self.latency.waiting)}\n"
+                f"vllm:kv_cache_usage_perc{labels} {self.latency.cache_usage()}\n")
+
+    def stats(self) -> dict:
+        return {'kind': self.kind, 'model': self.model, 'latency': self.latency.describe(),
+                'running': self.latency.running, 'waiting': self.latency.waiting, 'counts': dict(self.counts)}
+
+
+def _usage(prompt, completion):
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def _chunk(completion_id, model, delta, finish_reason=None):
+    return b'data: ' + dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                              'model': model, 'choices': [{'index': 0, 'delta': delta,
+                                                           'finish_reason': finish_reason}]}) + b'\n\n'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves one Stub (the server's .stub) over keep-alive HTTP/1.1."""
+
+    protocol_version = 'HTTP/1.1'
+    # Like uvicorn, send small writes (SSE frames) at once
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        path = self.path.split('?', 1)[0]
+        if path == '/health':
+            self._send(200, b'', 'text/plain')
+        elif path == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': stub.model, 'object': 'model',
+                                                             'owned_by': 'stub'}]})
+        elif path == '/metrics':
+            self._send(200, stub.metrics().encode(), 'text/plain; version=0.0.4')
+        elif path == '/stub/stats':
+            self._send_json(200, stub.stats())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?', 1)[0]
+        if path == '/v1/chat/completions':
+            handler = stub.chat_completions
+        elif path == '/v1/responses' and stub.kind == 'xai':
+            handler = stub.responses
+        else:
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            data = loads(body)
+        except ValueError:
+            self._send_json(400, {'object': 'error', 'message': 'invalid JSON', 'code': 400})
+            return
+        status, result = handler(data)
+        if isinstance(result, dict):
+            self._send_json(status, result)
+        else:
+            self._send_stream(result)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, dumps(payload), 'application/json')
+
+    def _send_stream(self, frames):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for frame in frames:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(frame), frame))
+            self.wfile.write(b'0\r\n\r\n')
+        except StreamDropped:
+            # Cut off without the terminating chunk, like a crashed backend
+            self.close_connection = True
+        except OSError:
+            # The client went away — e.g. the router discarding a
+            # speculative stream
+            self.server.stub.count('client_disconnects')
+            self.close_connection = True
+        finally:
+            # Releases the generation slot now rather than at garbage collection
+            frames.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """A stub backend served on a background thread."""
+
+    def __init__(self, stub: Stub, host='127.0.0.1', port=0):
+        self.stub = stub
+        self._server = ThreadingHTTPServer((host, port), StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = stub
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"stub-{stub.kind}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def start_stubs(specs=None, host='127.0.0.1', ports=None, seed=None, script=None) -> dict:
+    """Start router, primary and xai stubs.
+
+    Args:
+        specs: kind -> latency spec overriding that kind's defaults
+        ports: kind -> port (0 picks a free one); a kind mapped to None is not started
+        seed: seeds every stub's random delays and failures
+        script: recorded timings for every stub (see Stub)
+
+    Returns:
+        dict of kind -> running StubServer
+    """
+    specs = specs or {}
+    ports = ports if ports is not None else {}
+    servers = {}
+    for kind in MODELS:
+        port = ports.get(kind, 0)
+        if port is None:
+            continue
+        latency = LatencyModel.from_spec(kind, specs.get(kind, ''), seed=seed)
+        servers[kind] = StubServer(Stub(kind, latency, script=script), host, port).start()
+    return servers
+
+
+def router_env(servers) -> dict:
+    """Environment pointing the router at running stubs."""
+    env = {}
+    if 'router' in servers:
+        env['ROUTER_URL'] = servers['router'].url
+    if 'primary' in servers:
+        env['PRIMARY_URL'] = servers['primary'].url
+    if 'xai' in servers:
+        env.update(XAI_API_URL=servers['xai'].url, XAI_API_KEY='stub')
+    return env